@@ -0,0 +1,168 @@
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+from benchmarks import workloads
+from mockasm.lexer import lexer
+from mockasm.parser import parser
+from mockasm.runtime import vm
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What each row runs
+MODES = {
+    "baseline": "original string-matching interpreter, from --baseline_ref",
+    "loop": "if/elif chain over decoded instructions, --mode loop",
+    "table": "dispatch table, --mode table",
+    "fused": "dispatch table with superinstructions, --mode fused",
+    "compiled": "hot blocks compiled to Python, --mode compiled",
+}
+
+# Runs in the extracted baseline, whose package is also called mockasm. Reads
+# the source from stdin and prints the best time.
+BASELINE_SCRIPT = """
+import contextlib
+import io
+import sys
+import time
+
+from mockasm.lexer import lexer
+from mockasm.parser import parser
+from mockasm.runtime import vm
+
+source_code = sys.stdin.read()
+tokens = lexer.Lexer(source_code=source_code).lexical_analyze()
+opcodes = parser.Parser(tokens=tokens).parse()
+
+best = None
+for _ in range(int(sys.argv[1])):
+    execution = vm.VM(opcodes=opcodes).execute()
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        _ = list(execution)
+        elapsed = time.perf_counter() - start
+    best = elapsed if best == None or elapsed < best else best
+
+print(best)
+"""
+
+
+def parse_program(source_code):
+    tokens = lexer.Lexer(source_code=source_code).lexical_analyze()
+    return parser.Parser(tokens=tokens).parse()
+
+
+def count_steps(opcodes):
+    # The VM prints the program result on the final ret
+    with contextlib.redirect_stdout(io.StringIO()):
+        return sum(
+            1
+            for sequence in vm.VM(opcodes=opcodes).execute(yield_execution=True)
+            if type(sequence) == dict
+        )
+
+
+def git(*args):
+    return subprocess.run(
+        ["git", *args], cwd=REPO_DIRECTORY, stdout=subprocess.PIPE, check=True
+    ).stdout
+
+
+@contextlib.contextmanager
+def baseline_checkout(ref):
+    # The mockasm package as it was at ref, in a temporary directory
+    with tempfile.TemporaryDirectory() as directory:
+        archive = git("archive", "--format=tar", ref, "mockasm")
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(path=directory)
+
+        yield directory
+
+
+def time_baseline(baseline_directory, source_code, repeat):
+    output = subprocess.run(
+        [sys.executable, "-c", BASELINE_SCRIPT, str(repeat)],
+        cwd=baseline_directory,
+        input=source_code.encode(),
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+
+    return float(output)
+
+
+def time_mode(opcodes, mode, repeat):
+    best = None
+    for _ in range(repeat):
+        vm_obj = vm.VM(opcodes=opcodes)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            _ = list(vm_obj.execute(mode=mode))
+            elapsed = time.perf_counter() - start
+        best = elapsed if best == None or elapsed < best else best
+
+    return best
+
+
+def run():
+    argparser = argparse.ArgumentParser(description="VM dispatch benchmark")
+    argparser.add_argument(
+        "--iterations", type=int, default=20000, help="Iterations of the loop program"
+    )
+    argparser.add_argument("--fib", type=int, default=18, help="Argument to fib")
+    argparser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per mode, best one is reported"
+    )
+    argparser.add_argument(
+        "--baseline_ref",
+        type=str,
+        default=None,
+        help="Git ref of the baseline interpreter, the first commit by default",
+    )
+    args = argparser.parse_args()
+
+    baseline_ref = args.baseline_ref
+    if baseline_ref == None:
+        baseline_ref = git("rev-list", "--max-parents=0", "HEAD").split()[-1].decode()
+
+    programs = {
+        "loop": workloads.loop(iterations=args.iterations),
+        "fib": workloads.fib(n=args.fib),
+    }
+
+    for mode, description in MODES.items():
+        print(f"{mode:<10}{description}")
+    print()
+    print(f"Baseline built from {baseline_ref}")
+    print()
+
+    with baseline_checkout(ref=baseline_ref) as baseline_directory:
+        print(
+            f"{'program':<10}{'mode':<10}{'steps':>12}{'seconds':>10}{'steps/s':>14}"
+        )
+        for name, source_code in programs.items():
+            opcodes = parse_program(source_code=source_code)
+            steps = count_steps(opcodes=opcodes)
+
+            for mode in MODES.keys():
+                if mode == "baseline":
+                    elapsed = time_baseline(
+                        baseline_directory=baseline_directory,
+                        source_code=source_code,
+                        repeat=args.repeat,
+                    )
+                else:
+                    elapsed = time_mode(opcodes=opcodes, mode=mode, repeat=args.repeat)
+                print(
+                    f"{name:<10}{mode:<10}{steps:>12}{elapsed:>10.3f}{steps / elapsed:>14.0f}"
+                )
+
+
+if __name__ == "__main__":
+    run()
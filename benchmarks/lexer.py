@@ -0,0 +1,55 @@
+import argparse
+import time
+
+from benchmarks import workloads
+from mockasm.lexer import lexer
+from mockasm.lexer import regex_lexer
+
+
+def time_lexer(lexer_cls, source_code, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = lexer_cls(source_code=source_code).lexical_analyze()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None or elapsed < best else best
+
+    return best, tokens
+
+
+def run():
+    argparser = argparse.ArgumentParser(description="Lexer benchmark")
+    argparser.add_argument(
+        "--megabytes",
+        type=float,
+        nargs="+",
+        default=[1, 4],
+        help="Sizes of the generated sources",
+    )
+    argparser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per lexer, best one is reported"
+    )
+    args = argparser.parse_args()
+
+    lexers = {"char": lexer.Lexer, "regex": regex_lexer.RegexLexer}
+
+    print(f"{'MB':<8}{'lexer':<8}{'tokens':>12}{'seconds':>10}{'MB/s':>10}")
+    for megabytes in args.megabytes:
+        source_code = workloads.functions(num_bytes=int(megabytes * (1 << 20)))
+
+        token_streams = []
+        for name, lexer_cls in lexers.items():
+            elapsed, tokens = time_lexer(
+                lexer_cls=lexer_cls, source_code=source_code, repeat=args.repeat
+            )
+            token_streams.append(tokens)
+            print(
+                f"{megabytes:<8}{name:<8}{len(tokens):>12}{elapsed:>10.3f}{megabytes / elapsed:>10.2f}"
+            )
+
+        if token_streams[0] != token_streams[1]:
+            print("Token streams differ!")
+
+
+if __name__ == "__main__":
+    run()
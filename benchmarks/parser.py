@@ -0,0 +1,46 @@
+import argparse
+import time
+
+from benchmarks import workloads
+from mockasm.lexer import regex_lexer
+from mockasm.parser import parser
+
+
+def time_parser(tokens, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        opcodes = parser.Parser(tokens=tokens).parse()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None or elapsed < best else best
+
+    return best, opcodes
+
+
+def run():
+    argparser = argparse.ArgumentParser(description="Parser benchmark")
+    argparser.add_argument(
+        "--megabytes",
+        type=float,
+        nargs="+",
+        default=[1, 4],
+        help="Sizes of the generated sources",
+    )
+    argparser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per size, best one is reported"
+    )
+    args = argparser.parse_args()
+
+    print(f"{'MB':<8}{'tokens':>12}{'opcodes':>12}{'seconds':>10}{'opcodes/s':>14}")
+    for megabytes in args.megabytes:
+        source_code = workloads.functions(num_bytes=int(megabytes * (1 << 20)))
+        tokens = regex_lexer.RegexLexer(source_code=source_code).lexical_analyze()
+
+        elapsed, opcodes = time_parser(tokens=tokens, repeat=args.repeat)
+        print(
+            f"{megabytes:<8}{len(tokens):>12}{len(opcodes):>12}{elapsed:>10.3f}{len(opcodes) / elapsed:>14.0f}"
+        )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,197 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmarks import workloads
+from mockasm.lexer import lexer
+from mockasm.lexer import regex_lexer
+from mockasm.parser import parser
+from mockasm.runtime import vm
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Source generators, sized by --scale
+WORKLOADS = {
+    "loop": lambda scale: workloads.loop(iterations=int(20000 * scale)),
+    "fib": lambda scale: workloads.fib(n=18),
+    "recursion": lambda scale: workloads.recursion(depth=int(5000 * scale)),
+    "memory": lambda scale: workloads.memory(iterations=int(5000 * scale)),
+    "globals": lambda scale: workloads.globals_section(
+        num_globals=int(2000 * scale), bytes_per_global=16
+    ),
+    "functions": lambda scale: workloads.functions(num_bytes=int((256 << 10) * scale)),
+}
+
+STAGES = ["lexer", "regex_lexer", "parser", "decoder", "vm"]
+
+UNITS = {
+    "lexer": "tokens/s",
+    "regex_lexer": "tokens/s",
+    "parser": "opcodes/s",
+    "decoder": "opcodes/s",
+    "vm": "instructions/s",
+}
+
+
+def run_stage(stage, source_code, tokens, opcodes):
+    # Returns the number of items the stage processed and how long it took
+    start = time.perf_counter()
+    if stage == "lexer":
+        items = len(lexer.Lexer(source_code=source_code).lexical_analyze())
+    elif stage == "regex_lexer":
+        items = len(regex_lexer.RegexLexer(source_code=source_code).lexical_analyze())
+    elif stage == "parser":
+        items = len(parser.Parser(tokens=tokens).parse())
+    elif stage == "decoder":
+        _ = vm.VM(opcodes=opcodes)
+        items = len(opcodes)
+    else:
+        vm_obj = vm.VM(opcodes=opcodes)
+
+        # Only execution is timed, the VM prints the result on the final ret
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            _ = list(vm_obj.execute())
+        items = vm_obj.num_steps
+
+    return items, time.perf_counter() - start
+
+
+def measure_stage(stage, source_code, tokens, opcodes, repeat):
+    best = None
+    for _ in range(repeat):
+        items, elapsed = run_stage(
+            stage=stage, source_code=source_code, tokens=tokens, opcodes=opcodes
+        )
+        best = elapsed if best == None or elapsed < best else best
+
+    # Tracing slows everything down, so memory is measured in its own run
+    tracemalloc.start()
+    run_stage(stage=stage, source_code=source_code, tokens=tokens, opcodes=opcodes)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "items": items,
+        "seconds": best,
+        "rate": items / best,
+        "unit": UNITS[stage],
+        "peak_bytes": peak_bytes,
+    }
+
+
+def run_workload(source_code, repeat):
+    tokens = regex_lexer.RegexLexer(source_code=source_code).lexical_analyze()
+    opcodes = parser.Parser(tokens=tokens).parse()
+
+    return {
+        stage: measure_stage(
+            stage=stage,
+            source_code=source_code,
+            tokens=tokens,
+            opcodes=opcodes,
+            repeat=repeat,
+        )
+        for stage in STAGES
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+
+    print(
+        f"{'workload':<11}{'stage':<13}{'rate':>14}{'baseline':>14}{'change':>9}{'peak MB':>9}  unit"
+    )
+    for name, stages in results["workloads"].items():
+        for stage, result in stages.items():
+            baseline_result = baseline.get("workloads", {}).get(name, {}).get(stage)
+
+            baseline_rate = ""
+            change = ""
+            if baseline_result != None:
+                ratio = result["rate"] / baseline_result["rate"] - 1
+                baseline_rate = f"{baseline_result['rate']:.0f}"
+                change = f"{ratio:+.1%}"
+                if ratio < -threshold:
+                    regressions.append((name, stage, ratio))
+
+            print(
+                f"{name:<11}{stage:<13}{result['rate']:>14.0f}{baseline_rate:>14}{change:>9}{result['peak_bytes'] / (1 << 20):>9.2f}  {result['unit']}"
+            )
+
+    return regressions
+
+
+def run():
+    argparser = argparse.ArgumentParser(
+        description="Lexer, parser and VM benchmark suite"
+    )
+    argparser.add_argument(
+        "--workloads",
+        type=str,
+        nargs="+",
+        default=list(WORKLOADS.keys()),
+        choices=list(WORKLOADS.keys()),
+        help="Workloads to run",
+    )
+    argparser.add_argument(
+        "--scale", type=float, default=1, help="Multiplier for the workload sizes"
+    )
+    argparser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per stage, best one is reported"
+    )
+    argparser.add_argument(
+        "--baseline",
+        type=str,
+        default=BASELINE_PATH,
+        help="Baseline JSON to compare with",
+    )
+    argparser.add_argument(
+        "--save", type=str, default="", help="Write the results as JSON to this path"
+    )
+    argparser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Slowdown against the baseline reported as a regression",
+    )
+    args = argparser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "scale": args.scale,
+        "workloads": {
+            name: run_workload(source_code=WORKLOADS[name](args.scale), repeat=args.repeat)
+            for name in args.workloads
+        },
+    }
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+        if baseline.get("scale") != args.scale:
+            print(f"Baseline was recorded at scale {baseline.get('scale')}")
+
+    regressions = compare(results=results, baseline=baseline, threshold=args.threshold)
+
+    if args.save != "":
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if len(regressions) > 0:
+        print()
+        for name, stage, ratio in regressions:
+            print(f"Regression: {name} {stage} {ratio:+.1%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
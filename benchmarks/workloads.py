@@ -0,0 +1,155 @@
+LOOP_PROGRAM = """.L.main:
+  mov $0, rax
+  mov $0, rdi
+.L.loop:
+  cmp ${iterations}, rdi
+  je .L.end
+  add rdi, rax
+  add $1, rdi
+  jmp .L.loop
+.L.end:
+  ret
+"""
+
+FIB_PROGRAM = """.L.main:
+  mov ${n}, rdi
+  call .L.fib
+  ret
+.L.fib:
+  cmp $2, rdi
+  setl al
+  movzb al, rax
+  cmp $0, rax
+  je .L.rec
+  mov rdi, rax
+  ret
+.L.rec:
+  push rdi
+  sub $1, rdi
+  call .L.fib
+  pop rdi
+  push rax
+  push rdi
+  sub $2, rdi
+  call .L.fib
+  pop rdi
+  pop rsi
+  add rsi, rax
+  ret
+"""
+
+# Recurses depth times before returning, one stack slot per frame
+RECURSION_PROGRAM = """.L.main:
+  mov ${depth}, rdi
+  call .L.sum
+  ret
+.L.sum:
+  cmp $0, rdi
+  je .L.base
+  push rdi
+  sub $1, rdi
+  call .L.sum
+  pop rdi
+  add rdi, rax
+  ret
+.L.base:
+  mov $0, rax
+  ret
+"""
+
+# Stores and loads through (reg), $_N and N(reg) every iteration
+MEMORY_PROGRAM = """.L.main:
+  push rbp
+  mov rsp, rbp
+  sub $32, rsp
+  mov $0, rcx
+.L.loop:
+  cmp ${iterations}, rcx
+  je .L.end
+  lea $_8, rdi
+  mov rcx, (rdi)
+  mov $_8, rax
+  add $3, rax
+  mov rax, $_16
+  mov $_16, rdx
+  mov rdx, -24(rbp)
+  mov -24(rbp), rsi
+  mov sil, -32(rbp)
+  movzb -32(rbp), rax
+  add $1, rcx
+  jmp .L.loop
+.L.end:
+  mov rbp, rsp
+  pop rbp
+  ret
+"""
+
+# One function per block, every block gets its own labels and global
+BLOCK = """# block {idx}
+.global.value{idx}
+  byte 1
+  byte 2
+.L.func{idx}:
+  push rbp
+  mov rsp, rbp
+  sub $16, rsp
+  mov $42, rax
+  mov rax, -8(rbp)
+  lea .global.value{idx}, rdi
+  movsbq (rdi), rsi
+  cmp $0, rsi
+  je .L.end{idx}
+  add rsi, rax
+  imul $3, rax
+  mov $_8, rdx
+.L.end{idx}:
+  mov rbp, rsp
+  pop rbp
+  ret
+"""
+
+
+def loop(iterations):
+    return LOOP_PROGRAM.replace("{iterations}", str(iterations))
+
+
+def fib(n):
+    return FIB_PROGRAM.replace("{n}", str(n))
+
+
+def recursion(depth):
+    return RECURSION_PROGRAM.replace("{depth}", str(depth))
+
+
+def memory(iterations):
+    return MEMORY_PROGRAM.replace("{iterations}", str(iterations))
+
+
+def globals_section(num_globals, bytes_per_global):
+    lines = []
+    for idx in range(num_globals):
+        lines.append(f".global.data{idx}")
+        lines += [f"byte {(idx + i) % 128}" for i in range(bytes_per_global)]
+
+    # Reads the first byte of every 16th global
+    lines += [".L.main:", "  mov $0, rax"]
+    for idx in range(0, num_globals, 16):
+        lines += [
+            f"  lea .global.data{idx}, rdi",
+            "  movsbq (rdi), rsi",
+            "  add rsi, rax",
+        ]
+    lines.append("  ret")
+
+    return "\n".join(lines) + "\n"
+
+
+def functions(num_bytes):
+    blocks = []
+    size = 0
+    while size < num_bytes:
+        block = BLOCK.replace("{idx}", str(len(blocks)))
+        blocks.append(block)
+        size += len(block)
+
+    return "".join(blocks)
@@ -1,9 +1,11 @@
+import contextlib
+import json
+
 from flask import Flask, request, render_template, jsonify, session
-import copy
 
+from . import debug_session
 from ..lexer import lexer
 from ..parser import parser
-from ..runtime import vm
 from ..utils import file_utils
 
 # Instantiate flask app
@@ -14,6 +16,27 @@ app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 0
 app.secret_key = "my-secret-key"
 app.config["SESSION_TYPE"] = "filesystem"
 
+# Live debug sessions are kept on the server, keyed by the id stored in the
+# client session. Least recently used sessions are evicted past the byte
+# budget, or spilled to DEBUG_SESSION_SPILL_DIR when it is set, and idle ones
+# expire after the TTL. Any object with add/use/remove can be set as
+# DEBUG_SESSION_STORE instead.
+app.config["DEBUG_SESSION_MAX_BYTES"] = debug_session.MAX_BYTES
+app.config["DEBUG_SESSION_TTL"] = debug_session.TTL
+app.config["DEBUG_SESSION_SPILL_DIR"] = None
+app.config["DEBUG_SESSION_STORE"] = None
+
+
+def get_debug_sessions():
+    if app.config["DEBUG_SESSION_STORE"] == None:
+        app.config["DEBUG_SESSION_STORE"] = debug_session.DebugSessionStore(
+            max_bytes=app.config["DEBUG_SESSION_MAX_BYTES"],
+            ttl=app.config["DEBUG_SESSION_TTL"],
+            spill_directory=app.config["DEBUG_SESSION_SPILL_DIR"],
+        )
+
+    return app.config["DEBUG_SESSION_STORE"]
+
 
 @app.route("/", methods=["GET"])
 def index():
@@ -22,15 +45,29 @@ def index():
         return render_template("index.html")
 
 
+@contextlib.contextmanager
+def use_debug_session():
+    # The session is held for the whole request, so it is not spilled while it
+    # moves
+    session_id = session.get("debug_session_id", None)
+    if session_id == None:
+        yield None
+        return
+
+    with get_debug_sessions().use(session_id=session_id) as debug_session_obj:
+        yield debug_session_obj
+
+
 @app.route("/get-output", methods=["POST"])
 def get_output():
 
     if request.method == "POST":
         path = request.form["path"]
 
-        session["sequence_of_execution"] = None
-        session["sequence_ptr"] = None
-        session["source_code"] = None
+        # Only the id lives in the cookie, the running VM stays on the server
+        session_id = session.pop("debug_session_id", None)
+        if session_id != None:
+            get_debug_sessions().remove(session_id=session_id)
 
         source_code = file_utils.read_file(path=path)
 
@@ -40,65 +77,53 @@ def get_output():
         parser_obj = parser.Parser(tokens=tokens)
         opcodes = parser_obj.parse()
 
-        vm_obj = vm.VM(opcodes=opcodes)
-        sequence_of_execution = []
-        for sequence in vm_obj.execute(yield_execution=True):
-            if type(sequence) == dict:
-                sequence_of_execution.append(copy.deepcopy(sequence))
-            else:
-                sequence_of_execution.append(sequence)
-
-        output = sequence_of_execution[-1]
-
-        sequence_of_execution = sequence_of_execution[:-1]
+        debug_session_obj = debug_session.DebugSession(
+            opcodes=opcodes, source_code=source_code
+        )
+        current_sequence = debug_session_obj.next_sequence()
 
-        source_lines = source_code.split("\n")
-        for sequence in sequence_of_execution:
-            sequence["source_code"] = source_lines[sequence["line_num"] - 1]
+        if current_sequence == None:
+            return jsonify(
+                {
+                    "icon": "error",
+                    "title": "Error",
+                    "text": "Code did not execute any instruction!",
+                }
+            )
 
-        session["sequence_of_execution"] = sequence_of_execution
-        session["sequence_ptr"] = 1
-        session["source_code"] = source_code
+        session["debug_session_id"] = get_debug_sessions().add(
+            debug_session=debug_session_obj
+        )
 
         return jsonify(
             {
                 "icon": "success",
                 "title": "Success",
-                "text": "Code executed successfully!",
-                "output": output,
-                "sequence_of_execution": sequence_of_execution[0],
+                "text": "Code loaded successfully!",
+                "output": debug_session_obj.output,
+                "num_steps": debug_session_obj.num_steps,
+                "end_of_trace": debug_session_obj.is_at_end,
+                "sequence_of_execution": current_sequence,
                 "source_code": source_code,
             }
         )
 
 
-@app.route("/next-output", methods=["POST"])
-def next_output():
-
-    if request.method == "POST":
-        sequence_of_execution = session.get("sequence_of_execution", None)
-        sequence_ptr = session.get("sequence_ptr", None)
-        source_code = session.get("source_code", None)
-
-        if (
-            sequence_of_execution != None
-            and sequence_ptr != None
-            and source_code != None
-        ):
-            current_sequence = sequence_of_execution[sequence_ptr]
-
-            session["sequence_ptr"] += 1
-
-            if session["sequence_ptr"] >= len(session["sequence_of_execution"]):
-                session["sequence_ptr"] = 0
+def step_debug_session(move):
+    with use_debug_session() as debug_session_obj:
+        if debug_session_obj != None:
+            current_sequence = move(debug_session_obj)
 
             return jsonify(
                 {
                     "icon": "",
                     "title": "",
                     "text": "",
+                    "output": debug_session_obj.output,
+                    "num_steps": debug_session_obj.num_steps,
+                    "end_of_trace": debug_session_obj.is_at_end,
                     "current_sequence": current_sequence,
-                    "source_code": source_code,
+                    "stop": debug_session_obj.stop,
                 }
             )
         else:
@@ -109,3 +134,107 @@ def next_output():
                     "text": "No sequence found, make sure you have run the code!",
                 }
             )
+
+
+@app.route("/next-output", methods=["POST"])
+def next_output():
+
+    if request.method == "POST":
+        return step_debug_session(
+            move=lambda debug_session_obj: debug_session_obj.next_sequence()
+        )
+
+
+@app.route("/prev-output", methods=["POST"])
+def prev_output():
+
+    if request.method == "POST":
+        return step_debug_session(
+            move=lambda debug_session_obj: debug_session_obj.prev_sequence()
+        )
+
+
+@app.route("/goto-output", methods=["POST"])
+def goto_output():
+
+    if request.method == "POST":
+        try:
+            step = int(request.form["step"])
+        except ValueError:
+            return jsonify(
+                {
+                    "icon": "error",
+                    "title": "Error",
+                    "text": "Step has to be a number!",
+                }
+            )
+
+        return step_debug_session(
+            move=lambda debug_session_obj: debug_session_obj.sequence_at(step=step)
+        )
+
+
+@app.route("/continue", methods=["POST"])
+def continue_output():
+
+    if request.method == "POST":
+        return step_debug_session(
+            move=lambda debug_session_obj: debug_session_obj.continue_sequence()
+        )
+
+
+@app.route("/step-over", methods=["POST"])
+def step_over_output():
+
+    if request.method == "POST":
+        return step_debug_session(
+            move=lambda debug_session_obj: debug_session_obj.step_over_sequence()
+        )
+
+
+@app.route("/step-out", methods=["POST"])
+def step_out_output():
+
+    if request.method == "POST":
+        return step_debug_session(
+            move=lambda debug_session_obj: debug_session_obj.step_out_sequence()
+        )
+
+
+@app.route("/breakpoints", methods=["POST"])
+def set_breakpoints():
+
+    if request.method == "POST":
+        with use_debug_session() as debug_session_obj:
+            if debug_session_obj == None:
+                return jsonify(
+                    {
+                        "icon": "error",
+                        "title": "Error",
+                        "text": "No sequence found, make sure you have run the code!",
+                    }
+                )
+
+            # A JSON list like [{"line": 12, "condition": "rax > 3"},
+            # {"label": "loop"}, {"register": "rdi"},
+            # {"address": 1048568, "bits": 64}]
+            try:
+                debug_session_obj.set_breakpoints(
+                    breakpoints=json.loads(request.form["breakpoints"])
+                )
+            except (ValueError, TypeError, AttributeError):
+                return jsonify(
+                    {
+                        "icon": "error",
+                        "title": "Error",
+                        "text": "Breakpoints have to be a list of lines, labels, registers or addresses!",
+                    }
+                )
+
+            return jsonify(
+                {
+                    "icon": "success",
+                    "title": "Success",
+                    "text": "Breakpoints set!",
+                }
+            )
@@ -0,0 +1,456 @@
+import collections
+import contextlib
+import os
+import pickle
+import threading
+import time
+import uuid
+
+from ..runtime import breakpoints
+from ..runtime import vm
+
+# Defaults for the session store, live sessions cost about one VM memory each
+MAX_BYTES = 256 << 20
+TTL = 30 * 60
+
+# Steps between VM checkpoints, bounds how many steps a seek replays
+CHECKPOINT_INTERVAL = 256
+
+
+class DebugSession:
+    def __init__(
+        self, opcodes, source_code, checkpoint_interval=CHECKPOINT_INTERVAL
+    ):
+        self.__opcodes = opcodes
+        self.__source_lines = source_code.split("\n")
+        self.__checkpoint_interval = checkpoint_interval
+        self.__output = None
+        self.__lock = threading.Lock()
+
+        # Known once the run has returned
+        self.__num_steps = None
+
+        # (VM checkpoint, sequence) after every checkpoint_interval-th step
+        self.__checkpoints = []
+        self.__checkpoint_bytes = 0
+
+        # The VM runs at full speed between the steps that are looked at, state
+        # is only read where a run stops
+        self.__vm = vm.VM(opcodes=self.__opcodes)
+        self.__is_started = False
+        self.__step = -1
+        self.__sequence = None
+
+        # Breakpoints as passed to set_breakpoints and their ids in the VM
+        self.__breakpoints = []
+        self.__breakpoint_ids = []
+        self.__stop = None
+
+    @property
+    def output(self):
+        return self.__output
+
+    @property
+    def num_steps(self):
+        return self.__num_steps
+
+    @property
+    def stop(self):
+        # What ended the last continue, step over or step out early
+        return self.__stop
+
+    @property
+    def is_at_end(self):
+        # On the last step, moving forward stays there
+        return self.__num_steps != None and self.__step >= self.__num_steps - 1
+
+    @property
+    def size(self):
+        return (
+            self.__vm.memory_size
+            + self.__checkpoint_bytes
+            + sum(len(line) for line in self.__source_lines)
+        )
+
+    def __is_valid_step(self):
+        return self.__step >= 0 and (
+            self.__num_steps == None or self.__step < self.__num_steps
+        )
+
+    def __read_sequence(self):
+        state = self.__vm.get_state()
+        self.__sequence = {
+            **state,
+            "flags": dict(state["flags"]),
+            "source_code": self.__source_lines[state["line_num"] - 1],
+            "step": self.__step,
+        }
+
+    def __add_checkpoint(self):
+        self.__read_sequence()
+
+        checkpoint = self.__vm.checkpoint()
+        _, globals_data, stack_data = checkpoint[1]
+        self.__checkpoint_bytes += len(globals_data) + len(stack_data)
+        self.__checkpoints.append((checkpoint, self.__sequence))
+
+    def __resume(self, **kwargs):
+        execution = (
+            self.__vm.resume(**kwargs)
+            if self.__is_started
+            else self.__vm.execute(**kwargs)
+        )
+        self.__is_started = True
+
+        try:
+            next(execution)
+        except StopIteration as stop:
+            return stop.value
+
+    def __run(self, step=None, stop_depth=None, ignore_breakpoints=True):
+        # Runs up to step, or until the VM stops by itself when step is None.
+        # Returns the VM's stop when it fired before step was reached.
+        while step == None or self.__step < step:
+            # Runs end at the next checkpoint not taken yet, so checkpoints
+            # stay checkpoint_interval steps apart
+            next_checkpoint = len(self.__checkpoints) * self.__checkpoint_interval
+            last_step = next_checkpoint if step == None else min(step, next_checkpoint)
+
+            output = self.__resume(
+                max_steps=last_step - self.__step,
+                stop_depth=stop_depth,
+                ignore_breakpoints=ignore_breakpoints,
+            )
+            self.__step = self.__vm.num_steps - 1
+
+            # The final ret only ends the run, it is not shown as a step
+            if self.__vm.stop == None:
+                self.__output = output
+                self.__num_steps = self.__vm.num_steps - (
+                    1 if self.__vm.is_halted else 0
+                )
+                return None
+
+            if self.__step == next_checkpoint:
+                self.__add_checkpoint()
+
+            if self.__vm.stop.reason != breakpoints.MAX_STEPS:
+                return self.__vm.stop
+
+        return None
+
+    def __restore(self, checkpoint_idx):
+        checkpoint, sequence = self.__checkpoints[checkpoint_idx]
+
+        self.__vm.restore(checkpoint=checkpoint)
+        self.__step = checkpoint_idx * self.__checkpoint_interval
+        self.__sequence = sequence
+
+    def __seek(self, step):
+        if self.__num_steps != None:
+            step = min(step, self.__num_steps - 1)
+        step = max(step, 0)
+
+        # Going back, or forward past a checkpoint, restarts from the closest
+        # checkpoint so at most checkpoint_interval steps are replayed. Once
+        # the program has ended the VM is past the last step, which also goes
+        # back to a checkpoint.
+        checkpoint_idx = min(
+            step // self.__checkpoint_interval, len(self.__checkpoints) - 1
+        )
+        if checkpoint_idx >= 0 and (
+            step < self.__step
+            or checkpoint_idx * self.__checkpoint_interval > self.__step
+        ):
+            self.__restore(checkpoint_idx=checkpoint_idx)
+
+        if self.__step < step:
+            self.__run(step=step)
+
+            if self.__num_steps != None and self.__step >= self.__num_steps:
+                return self.__seek(step=step)
+
+        if self.__is_valid_step():
+            self.__read_sequence()
+
+        return self.__sequence
+
+    def __continue(self, stop_depth=None):
+        self.__stop = None
+        if self.__num_steps != None and self.__step >= self.__num_steps - 1:
+            return self.__sequence
+
+        stop = self.__run(stop_depth=stop_depth, ignore_breakpoints=False)
+
+        # A breakpoint stops in front of its instruction, like a step the
+        # sequence shows it run
+        if stop != None and stop.reason == breakpoints.BREAKPOINT:
+            self.__run(step=self.__step + 1)
+
+        if stop != None:
+            self.__stop = stop._asdict()
+
+        return self.__seek(step=self.__step)
+
+    def next_sequence(self):
+        # Past the last step this stays on it, is_at_end tells the run is over
+        with self.__lock:
+            self.__stop = None
+
+            return self.__seek(step=self.__step + 1)
+
+    def prev_sequence(self):
+        with self.__lock:
+            self.__stop = None
+
+            return self.__seek(step=self.__step - 1)
+
+    def sequence_at(self, step):
+        with self.__lock:
+            self.__stop = None
+
+            return self.__seek(step=step)
+
+    def continue_sequence(self):
+        with self.__lock:
+            return self.__continue()
+
+    def step_over_sequence(self):
+        # Calls run until they return, anything else is a single step
+        with self.__lock:
+            pc = self.__vm.pc
+            if pc < len(self.__opcodes) and self.__opcodes[pc].op_code == "call":
+                return self.__continue(stop_depth=self.__vm.call_depth)
+
+            self.__stop = None
+            return self.__seek(step=self.__step + 1)
+
+    def step_out_sequence(self):
+        with self.__lock:
+            return self.__continue(stop_depth=self.__vm.call_depth - 1)
+
+    def set_breakpoints(self, breakpoints):
+        # Replaces every breakpoint. Entries with a register or address are
+        # watchpoints, the rest need a line or label and may have a condition.
+        with self.__lock:
+            breakpoint_ids = []
+            try:
+                for entry in breakpoints:
+                    if "register" in entry or "address" in entry:
+                        breakpoint_id = self.__vm.add_watchpoint(
+                            register=entry.get("register", None),
+                            address=entry.get("address", None),
+                            bits=entry.get("bits", 64),
+                        )
+                    else:
+                        breakpoint_id = self.__vm.add_breakpoint(
+                            line=entry.get("line", None),
+                            label=entry.get("label", None),
+                            condition=entry.get("condition", None),
+                        )
+
+                    breakpoint_ids.append(breakpoint_id)
+            except Exception:
+                for breakpoint_id in breakpoint_ids:
+                    self.__vm.remove_breakpoint(breakpoint_id=breakpoint_id)
+                raise
+
+            for breakpoint_id in self.__breakpoint_ids:
+                self.__vm.remove_breakpoint(breakpoint_id=breakpoint_id)
+
+            self.__breakpoints = list(breakpoints)
+            self.__breakpoint_ids = breakpoint_ids
+
+    def __getstate__(self):
+        # The VM's memory is kept compacted like in a checkpoint, so loading the
+        # session again restores the run where it was instead of replaying it
+        with self.__lock:
+            return {
+                "opcodes": self.__opcodes,
+                "source_code": "\n".join(self.__source_lines),
+                "checkpoint_interval": self.__checkpoint_interval,
+                "output": self.__output,
+                "num_steps": self.__num_steps,
+                "checkpoints": self.__checkpoints,
+                "checkpoint_bytes": self.__checkpoint_bytes,
+                "vm_checkpoint": (
+                    self.__vm.checkpoint() if self.__is_started else None
+                ),
+                "step": self.__step,
+                "sequence": self.__sequence,
+                "breakpoints": self.__breakpoints,
+                "stop": self.__stop,
+            }
+
+    def __setstate__(self, state):
+        self.__init__(
+            opcodes=state["opcodes"],
+            source_code=state["source_code"],
+            checkpoint_interval=state["checkpoint_interval"],
+        )
+
+        self.__output = state["output"]
+        self.__num_steps = state["num_steps"]
+        self.__checkpoints = state["checkpoints"]
+        self.__checkpoint_bytes = state["checkpoint_bytes"]
+
+        if state["vm_checkpoint"] != None:
+            self.__vm.restore(checkpoint=state["vm_checkpoint"])
+            self.__is_started = True
+
+        self.set_breakpoints(breakpoints=state["breakpoints"])
+
+        self.__step = state["step"]
+        self.__sequence = state["sequence"]
+        self.__stop = state["stop"]
+
+
+class DebugSessionStore:
+    def __init__(self, max_bytes=MAX_BYTES, ttl=TTL, spill_directory=None):
+        self.__max_bytes = max_bytes
+        self.__ttl = ttl
+        self.__spill_directory = spill_directory
+
+        # session id -> (session, size, last used), least recently used first
+        self.__sessions = collections.OrderedDict()
+        self.__num_bytes = 0
+
+        # session id -> last used, for sessions spilled to disk
+        self.__spilled = collections.OrderedDict()
+
+        # session id -> requests using it, sessions in use are never evicted
+        # so a request cannot lose its progress to a spill
+        self.__num_users = collections.Counter()
+
+        self.__lock = threading.Lock()
+
+        if self.__spill_directory != None:
+            os.makedirs(self.__spill_directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self.__sessions) + len(self.__spilled)
+
+    @property
+    def num_bytes(self):
+        return self.__num_bytes
+
+    def __spill_path(self, session_id):
+        return os.path.join(self.__spill_directory, f"{session_id}.pickle")
+
+    def __remove_spilled(self, session_id):
+        if self.__spilled.pop(session_id, None) != None:
+            try:
+                os.remove(self.__spill_path(session_id=session_id))
+            except FileNotFoundError:
+                pass
+
+    def __pop(self, session_id):
+        debug_session, size, last_used = self.__sessions.pop(session_id)
+        self.__num_bytes -= size
+
+        return debug_session, last_used
+
+    def __expire(self, now):
+        for session_id, (_, _, last_used) in list(self.__sessions.items()):
+            if now - last_used < self.__ttl:
+                break
+
+            if session_id not in self.__num_users:
+                self.__pop(session_id=session_id)
+
+        while len(self.__spilled) > 0:
+            session_id, last_used = next(iter(self.__spilled.items()))
+            if now - last_used < self.__ttl:
+                break
+
+            self.__remove_spilled(session_id=session_id)
+
+    def __evict(self, keep_session_id):
+        # The session being added or used always stays, even when it alone is
+        # over the budget
+        for session_id in list(self.__sessions.keys()):
+            if self.__num_bytes <= self.__max_bytes:
+                break
+            if session_id == keep_session_id or session_id in self.__num_users:
+                continue
+
+            debug_session, last_used = self.__pop(session_id=session_id)
+
+            if self.__spill_directory != None:
+                with open(self.__spill_path(session_id=session_id), "wb") as f:
+                    pickle.dump(debug_session, f)
+                self.__spilled[session_id] = last_used
+
+    def __insert(self, session_id, debug_session, now):
+        size = debug_session.size
+        self.__sessions[session_id] = (debug_session, size, now)
+        self.__num_bytes += size
+
+        self.__evict(keep_session_id=session_id)
+
+    def add(self, debug_session):
+        session_id = uuid.uuid4().hex
+
+        with self.__lock:
+            now = time.monotonic()
+            self.__expire(now=now)
+            self.__insert(session_id=session_id, debug_session=debug_session, now=now)
+
+        return session_id
+
+    def __get(self, session_id, now):
+        if session_id in self.__sessions.keys():
+            # Sessions grow as they take checkpoints
+            debug_session, _ = self.__pop(session_id=session_id)
+            self.__insert(session_id=session_id, debug_session=debug_session, now=now)
+
+            return debug_session
+
+        if session_id not in self.__spilled.keys():
+            return None
+
+        with open(self.__spill_path(session_id=session_id), "rb") as f:
+            debug_session = pickle.load(f)
+        self.__remove_spilled(session_id=session_id)
+
+        self.__insert(session_id=session_id, debug_session=debug_session, now=now)
+
+        return debug_session
+
+    @contextlib.contextmanager
+    def use(self, session_id):
+        # Gives the session, or None, for the length of the with block. It is
+        # not evicted meanwhile, and its new size is counted once it is done.
+        with self.__lock:
+            now = time.monotonic()
+            self.__expire(now=now)
+
+            debug_session = self.__get(session_id=session_id, now=now)
+            if debug_session != None:
+                self.__num_users[session_id] += 1
+
+        try:
+            yield debug_session
+        finally:
+            if debug_session != None:
+                with self.__lock:
+                    self.__num_users[session_id] -= 1
+                    if self.__num_users[session_id] == 0:
+                        del self.__num_users[session_id]
+
+                    # Removed sessions are not put back
+                    if session_id in self.__sessions.keys():
+                        _, last_used = self.__pop(session_id=session_id)
+                        self.__insert(
+                            session_id=session_id,
+                            debug_session=debug_session,
+                            now=last_used,
+                        )
+
+    def remove(self, session_id):
+        with self.__lock:
+            if session_id in self.__sessions.keys():
+                self.__pop(session_id=session_id)
+
+            if self.__spill_directory != None:
+                self.__remove_spilled(session_id=session_id)
@@ -1,6 +1,6 @@
 $(document).ready(function() {
 
-    $("#next").css("display", "none");
+    $(".step-control").css("display", "none");
     $("#intermediate-area").css("display", "none");
 
     const capitalize = (s) => {
@@ -22,7 +22,7 @@ $(document).ready(function() {
     }
 
     function generate_sequence_tables(json_object) {
-        $("#next").css("display", "block");
+        $(".step-control").css("display", "block");
         $("#intermediate-area").css("display", "block");
 
         var registers = generate_table(json_object, "registers", "Register")
@@ -62,8 +62,31 @@ $(document).ready(function() {
         return [highlighted_source_code, focus_idx];
     }
     
+    var source_code = "";
+
+    function show_output(output) {
+        if(output === null) {
+            $("#output").html("<strong>Output:</strong> program is still running");
+        } else {
+            $("#output").html("<strong>Output:</strong> " + output);
+        }
+    }
+
+    function show_step(step, num_steps, end_of_trace) {
+        if(num_steps === null) {
+            $("#step_num").html("<strong>Step:</strong> " + step);
+        } else if(end_of_trace) {
+            $("#step_num").html("<strong>Step:</strong> " + step + " of " + (num_steps - 1) + " (end of program)");
+        } else {
+            $("#step_num").html("<strong>Step:</strong> " + step + " of " + (num_steps - 1));
+        }
+
+        // Next stays on the last step, so there is nothing left to step to
+        $("#next").prop("disabled", end_of_trace);
+    }
+
     $("#run").click(function() {
-        $("#next").css("display", "none");
+        $(".step-control").css("display", "none");
         $("#intermediate-area").css("display", "none");
 
         var path = $("#path").val();
@@ -81,8 +104,14 @@ $(document).ready(function() {
                         text: result.text,
                     });
 
-                    $("#output").html("<strong>Output:</strong> " + result.output);
-                    const source_ret_val = highlight_source_lines(result.source_code, result.sequence_of_execution.line_num);
+                    if(result.icon == "error") {
+                        return;
+                    }
+
+                    source_code = result.source_code;
+                    show_output(result.output);
+                    show_step(result.sequence_of_execution.step, result.num_steps, result.end_of_trace);
+                    const source_ret_val = highlight_source_lines(source_code, result.sequence_of_execution.line_num);
                     var highlighted_source_code = source_ret_val[0];
                     $("#source_code").html(highlighted_source_code);
 
@@ -98,11 +127,12 @@ $(document).ready(function() {
         }
     });
 
-    $("#next").click(function() {
+    function step_to(url, data) {
         $.ajax({
-            url: "/next-output",
+            url: url,
             type: "post",
             dataType: "json",
+            data: data,
             success: function(result) {
                 if(result.icon == "error") {
                     Swal.fire({
@@ -111,7 +141,9 @@ $(document).ready(function() {
                         text: result.text,
                     });
                 } else {
-                    const source_ret_val = highlight_source_lines(result.source_code, result.current_sequence.line_num);
+                    show_output(result.output);
+                    show_step(result.current_sequence.step, result.num_steps, result.end_of_trace);
+                    const source_ret_val = highlight_source_lines(source_code, result.current_sequence.line_num);
                     var highlighted_source_code = source_ret_val[0];
                     var focus_idx = source_ret_val[1];
                     $("#source_code").html(highlighted_source_code);
@@ -126,6 +158,18 @@ $(document).ready(function() {
                 }
             }
         });
+    }
+
+    $("#next").click(function() {
+        step_to("/next-output", {});
+    });
+
+    $("#prev").click(function() {
+        step_to("/prev-output", {});
+    });
+
+    $("#goto").click(function() {
+        step_to("/goto-output", {"step": $("#step").val()});
     });
 
 });
\ No newline at end of file
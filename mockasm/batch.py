@@ -0,0 +1,125 @@
+import concurrent.futures
+import contextlib
+import csv
+import glob
+import io
+import json
+import os
+import re
+import time
+
+from .lexer import regex_lexer
+from .parser import parser
+from .runtime import breakpoints
+from .runtime import vm
+from .utils import error_utils
+from .utils import file_utils
+
+RESULT_FIELDS = ["path", "status", "exit_value", "steps", "wall_time", "error"]
+
+# Colour codes added by error_utils
+ANSI_ESCAPE = re.compile(r"\033\[[0-9;]*m")
+
+
+def collect_programs(pattern):
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.s")
+
+    return sorted(glob.glob(pattern))
+
+
+def run_program(path, mode, timeout, max_steps=None):
+    result = {
+        "path": path,
+        "status": "ok",
+        "exit_value": None,
+        "steps": 0,
+        "wall_time": 0.0,
+        "error": "",
+    }
+
+    vm_obj = None
+    start = time.perf_counter()
+    try:
+        tokens = regex_lexer.RegexLexer(
+            lines=file_utils.read_lines(path=path)
+        ).iter_tokens()
+        vm_obj = vm.VM(opcodes=parser.Parser(tokens=tokens).parse())
+
+        # The VM prints the program result on the final ret. It stops a
+        # program that runs too long itself, timing only the execution.
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_result = vm_obj.run(mode=mode, max_steps=max_steps, timeout=timeout)
+
+        if run_result.stop == None:
+            result["exit_value"] = run_result.value
+        elif run_result.stop.reason == breakpoints.TIMEOUT:
+            result["status"] = "timeout"
+            result["error"] = f"Timed out after {timeout}s"
+        else:
+            result["status"] = "max_steps"
+            result["error"] = f"Stopped after {max_steps} steps"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = ANSI_ESCAPE.sub("", str(e))
+
+    result["wall_time"] = time.perf_counter() - start
+    if vm_obj != None:
+        result["steps"] = vm_obj.num_steps
+
+    return result
+
+
+def run_batch(pattern, mode="table", jobs=None, timeout=None, max_steps=None):
+    paths = collect_programs(pattern=pattern)
+    if len(paths) == 0:
+        error_utils.error(msg=f"No programs found for '{pattern}'")
+
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(run_program, path, mode, timeout, max_steps): path
+            for path in paths
+        }
+
+        for future in concurrent.futures.as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                # The worker itself died, e.g. it ran out of memory
+                results[path] = {
+                    **{field: None for field in RESULT_FIELDS},
+                    "path": path,
+                    "status": "error",
+                    "error": str(e),
+                }
+
+    return [results[path] for path in paths]
+
+
+def write_results(results, path, results_format):
+    if results_format == "json":
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+def print_results(results):
+    print(f"{'status':<9}{'exit':>12}{'steps':>12}{'seconds':>10}  path")
+    for result in results:
+        exit_value = "" if result["exit_value"] == None else result["exit_value"]
+        steps = "" if result["steps"] == None else result["steps"]
+        wall_time = 0.0 if result["wall_time"] == None else result["wall_time"]
+        print(
+            f"{result['status']:<9}{exit_value:>12}{steps:>12}{wall_time:>10.3f}  {result['path']}"
+        )
+        if result["error"]:
+            print(f"{'':<9}{result['error']}")
+
+    num_ok = sum(1 for result in results if result["status"] == "ok")
+    print(f"{num_ok}/{len(results)} programs ran successfully")
@@ -0,0 +1,197 @@
+import re
+
+from . import token
+from ..utils import error_utils
+
+OPCODES = frozenset(
+    [
+        "mov",
+        "movzb",
+        "movsbq",
+        "movsxd",
+        "movswq",
+        "ret",
+        "add",
+        "sub",
+        "imul",
+        "idiv",
+        "cqo",
+        "cdq",
+        "neg",
+        "push",
+        "pop",
+        "cmp",
+        "sete",
+        "setne",
+        "setl",
+        "setle",
+        "lea",
+        "jmp",
+        "je",
+        "call",
+        "byte",
+    ]
+)
+
+REGISTERS = frozenset(
+    [
+        "rax",
+        "rdi",
+        "rsi",
+        "rdx",
+        "rcx",
+        "al",
+        "r8",
+        "r9",
+        "rsp",
+        "rbp",
+        "dil",
+        "sil",
+        "dl",
+        "cl",
+        "r8b",
+        "r9b",
+        "edi",
+        "esi",
+        "edx",
+        "ecx",
+        "r8d",
+        "r9d",
+        "eax",
+        "di",
+        "si",
+        "dx",
+        "cx",
+        "r8w",
+        "r9w",
+    ]
+)
+
+# Mirrors the character-by-character Lexer, including what it skips. A relative
+# address runs up to the closing parenthesis, which is dropped from the lexeme,
+# .L and .g skip the next 1 and 6 characters, whatever they are, and any other
+# character after a . is skipped along with it. Characters no alternative
+# matches are skipped by finditer.
+MASTER_PATTERN = re.compile(
+    r"""
+    (?P<newline>\n)
+    | (?P<word>[^\W\d_][^\W_]*)
+    | (?P<immediate>\$(?P<address>_)?(?P<immediate_digits>\d*)(?P<immediate_relative>\([^)]*\)?)?)
+    | (?P<number>(?P<negative>-)?(?P<number_digits>\d+)(?P<number_relative>\([^)]*\)?)?)
+    | (?P<comma>,)
+    | (?P<location_at>\((?P<location_register>[^\W_]*)(?P<location_end>\))?)
+    | (?P<dot>\.(?:L(?s:.)?(?P<label>\w*)|g(?s:.{0,6})(?P<global>\w*)|(?s:.))?)
+    | (?P<colon>:)
+    | (?P<comment>\#[^\n]*)
+    """,
+    re.VERBOSE,
+)
+
+
+class RegexLexer:
+    def __init__(self, source_code="", lines=None):
+        # lines is any iterable of source lines, e.g. an open file, which is
+        # read lazily by iter_tokens instead of source_code
+        self.__source_code = source_code
+        self.__lines = lines
+        self.__line_num = 1
+
+    def __identify_word(self, lexeme):
+        if lexeme in OPCODES:
+            return token.Token(
+                lexeme=lexeme, token_type=lexeme, line_num=self.__line_num
+            )
+        elif lexeme in REGISTERS:
+            return token.Token(
+                lexeme=lexeme, token_type="register", line_num=self.__line_num
+            )
+
+        error_utils.error(msg=f"{lexeme} is not a keyword or a register")
+
+    def __identify_number(self, digits, relative, token_type, is_negative=False):
+        lexeme = digits
+        if relative != None:
+            lexeme += relative[:-1] if relative.endswith(")") else relative
+            token_type = "relative_address" if token_type == "number" else token_type
+
+        return token.Token(
+            lexeme="-" + lexeme if is_negative else lexeme,
+            token_type=token_type,
+            line_num=self.__line_num,
+        )
+
+    def __identify_location_at(self, match):
+        temp_token = self.__identify_word(lexeme=match.group("location_register"))
+
+        if match.group("location_end") == None:
+            error_utils.error(
+                msg="Missing closing parantheses in location_at register"
+            )
+
+        return token.Token(
+            lexeme=temp_token.lexeme,
+            token_type="location_at",
+            line_num=temp_token.line_num,
+        )
+
+    def __tokenize(self, chunk, is_last):
+        for match in MASTER_PATTERN.finditer(chunk):
+            kind = match.lastgroup
+
+            # Relative addresses and dots can run past the end of a line, these
+            # are lexed again with the next line appended
+            if not is_last and kind != "newline" and match.end() == len(chunk):
+                return chunk[match.start() :]
+
+            if kind == "newline":
+                self.__line_num += 1
+            elif kind == "word":
+                yield self.__identify_word(lexeme=match.group())
+            elif kind == "immediate":
+                yield self.__identify_number(
+                    digits=match.group("immediate_digits"),
+                    relative=match.group("immediate_relative"),
+                    token_type="number" if match.group("address") == None else "address",
+                )
+            elif kind == "number":
+                yield self.__identify_number(
+                    digits=match.group("number_digits"),
+                    relative=match.group("number_relative"),
+                    token_type="number",
+                    is_negative=match.group("negative") != None,
+                )
+            elif kind == "comma":
+                yield token.Token(lexeme=",", token_type="comma", line_num=self.__line_num)
+            elif kind == "location_at":
+                yield self.__identify_location_at(match=match)
+            elif kind == "dot":
+                if match.group("label") != None:
+                    yield token.Token(
+                        lexeme=match.group("label"),
+                        token_type="label",
+                        line_num=self.__line_num,
+                    )
+                elif match.group("global") != None:
+                    yield token.Token(
+                        lexeme="g_" + match.group("global"),
+                        token_type="global",
+                        line_num=self.__line_num,
+                    )
+            elif kind == "colon":
+                yield token.Token(lexeme=":", token_type="colon", line_num=self.__line_num)
+
+        return ""
+
+    def iter_tokens(self):
+        if self.__lines == None:
+            yield from self.__tokenize(chunk=self.__source_code, is_last=True)
+            return
+
+        carry = ""
+        for line in self.__lines:
+            carry = yield from self.__tokenize(chunk=carry + line, is_last=False)
+
+        yield from self.__tokenize(chunk=carry, is_last=True)
+
+    def lexical_analyze(self):
+        return list(self.iter_tokens())
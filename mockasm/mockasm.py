@@ -1,15 +1,35 @@
 import argparse
 from mockasm.lexer import token
 
+from . import batch
 from .utils import file_utils
 from .lexer import lexer
+from .lexer import regex_lexer
+from .optimizer import peephole
 from .parser import parser
+from .runtime import trace_file
+from .transpiler import emitter
 from .runtime import vm
+from .utils import error_utils
 
 import copy
 import json
 
 
+def print_step(vm_obj, instruction, pc, next_pc):
+    if vm_obj.is_halted:
+        return
+
+    state = vm_obj.get_state()
+    print("*" * 50)
+    print(f"Line {state['line_num']}")
+    print(f"Flags: {state['flags']}")
+    print(f"Registers: {state['registers']}")
+    print(f"Memory: {state['memory']}")
+    print(f"Stack: {state['stack']}")
+    print("*" * 50)
+
+
 def run():
     argparser = argparse.ArgumentParser(description="Mock ASM")
     argparser.add_argument("--file_path", type=str, default="", help="Path to asm code")
@@ -28,14 +48,147 @@ def run():
     argparser.add_argument(
         "--exec_steps", action="store_true", default=False, help="Show execution steps"
     )
+    argparser.add_argument(
+        "--lexer",
+        type=str,
+        default=None,
+        choices=["char", "regex"],
+        help="Lexer used to tokenize the source, char unless --stream is given",
+    )
+    argparser.add_argument(
+        "--stream",
+        action="store_true",
+        default=False,
+        help="Lex and parse the file lazily, line by line",
+    )
+    argparser.add_argument(
+        "--mode",
+        type=str,
+        default="table",
+        choices=["table", "loop", "fused", "compiled"],
+        help="Instruction dispatch used by the VM",
+    )
+    argparser.add_argument(
+        "-O",
+        "--optimize",
+        action="store_true",
+        default=False,
+        help="Run the peephole optimizer over the opcodes before executing them",
+    )
+    argparser.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help="Show where execution time goes once the program ends",
+    )
+    argparser.add_argument(
+        "--trace_out",
+        "--trace-out",
+        type=str,
+        default="",
+        help="Write a binary execution trace to this path",
+    )
+    argparser.add_argument(
+        "--emit_python",
+        "--emit-python",
+        type=str,
+        default="",
+        help="Write the program as a standalone Python module to this path",
+    )
+    argparser.add_argument(
+        "--batch",
+        type=str,
+        default="",
+        help="Run every program in this directory or glob in parallel",
+    )
+    argparser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Worker processes for --batch, defaults to the number of CPUs",
+    )
+    argparser.add_argument(
+        "--max_steps",
+        "--max-steps",
+        type=int,
+        default=None,
+        help="Stop the program after this many steps, per program in --batch",
+    )
+    argparser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Seconds the program may run for, per program in --batch",
+    )
+    argparser.add_argument(
+        "--batch_out",
+        "--batch-out",
+        type=str,
+        default="",
+        help="Write the --batch results to this path",
+    )
+    argparser.add_argument(
+        "--batch_format",
+        "--batch-format",
+        type=str,
+        default="json",
+        choices=["json", "csv"],
+        help="Format of the --batch results file",
+    )
     args = argparser.parse_args()
 
-    source_code = file_utils.read_file(path=args.file_path)
+    if args.batch != "":
+        results = batch.run_batch(
+            pattern=args.batch,
+            mode=args.mode,
+            jobs=args.jobs,
+            timeout=args.timeout,
+            max_steps=args.max_steps,
+        )
+        batch.print_results(results=results)
+
+        if args.batch_out != "":
+            batch.write_results(
+                results=results, path=args.batch_out, results_format=args.batch_format
+            )
 
-    lexer_obj = lexer.Lexer(source_code=source_code)
-    tokens = lexer_obj.lexical_analyze()
+        return
+
+    has_limits = args.max_steps != None or args.timeout != None
+    if has_limits and (
+        args.trace_out != "" or args.exec_steps or args.exec_opcodes or args.profile
+    ):
+        error_utils.error(
+            msg="--max_steps and --timeout cannot be combined with --trace_out, --exec_steps, --exec_opcodes or --profile"
+        )
+
+    # Only the regex lexer can lex line by line
+    if args.stream and args.lexer == "char":
+        error_utils.error(msg="--stream cannot be combined with --lexer char")
+
+    # The profiler only counts plain runs
+    if args.profile and (args.trace_out != "" or args.exec_steps):
+        error_utils.error(
+            msg="--profile cannot be combined with --trace_out or --exec_steps"
+        )
+
+    if args.stream:
+        # Lines are read and tokenized only as the parser asks for tokens
+        lexer_obj = regex_lexer.RegexLexer(
+            lines=file_utils.read_lines(path=args.file_path)
+        )
+        tokens = lexer_obj.iter_tokens()
+    else:
+        source_code = file_utils.read_file(path=args.file_path)
+
+        if args.lexer == "regex":
+            lexer_obj = regex_lexer.RegexLexer(source_code=source_code)
+        else:
+            lexer_obj = lexer.Lexer(source_code=source_code)
+        tokens = lexer_obj.lexical_analyze()
 
     if args.tokens:
+        tokens = list(tokens)
         print()
         print("*" * 50)
         print("Tokens")
@@ -46,6 +199,13 @@ def run():
     parser_obj = parser.Parser(tokens=tokens)
     opcodes = parser_obj.parse()
 
+    if args.optimize:
+        num_opcodes = len(opcodes)
+        opcodes = peephole.PeepholeOptimizer(opcodes=opcodes).optimize()
+        print(
+            f"Optimizer eliminated {num_opcodes - len(opcodes)} of {num_opcodes} instructions"
+        )
+
     if args.opcodes:
         print()
         print("*" * 50)
@@ -54,7 +214,13 @@ def run():
         for opcode in opcodes:
             print(opcode)
 
-    vm_obj = vm.VM(opcodes=opcodes)
+    if args.emit_python != "":
+        with open(args.emit_python, "w") as f:
+            f.write(emitter.PythonEmitter(opcodes=opcodes).emit())
+
+        return
+
+    vm_obj = vm.VM(opcodes=opcodes, profile=args.profile)
 
     if args.tokens or args.opcodes:
         print()
@@ -62,15 +228,30 @@ def run():
         print("Output")
         print("*" * 50)
 
-    if args.exec_steps:
-        for sequence in vm_obj.execute(yield_execution=True):
-            if type(sequence) == dict:
-                print("*" * 50)
-                print(f"Line {sequence['line_num']}")
-                print(f"Flags: {sequence['flags']}")
-                print(f"Registers: {sequence['registers']}")
-                print(f"Memory: {sequence['memory']}")
-                print(f"Stack: {sequence['stack']}")
-                print("*" * 50)
+    if args.trace_out != "":
+        trace_file.write(
+            path=args.trace_out,
+            vm_obj=vm_obj,
+            mode=args.mode,
+            show_exec_opcodes=args.exec_opcodes,
+        )
+    elif args.exec_steps:
+        vm_obj.add_hook(event="on_step", callback=print_step)
+        _ = list(vm_obj.execute(mode=args.mode))
+    elif has_limits:
+        run_result = vm_obj.run(
+            mode=args.mode, max_steps=args.max_steps, timeout=args.timeout
+        )
+
+        if run_result.stop != None:
+            print(
+                f"Stopped ({run_result.stop.reason}) at line {run_result.stop.line_num} after {run_result.num_steps} steps"
+            )
     else:
-        _ = list(vm_obj.execute(show_exec_opcodes=args.exec_opcodes))
+        _ = list(
+            vm_obj.execute(show_exec_opcodes=args.exec_opcodes, mode=args.mode)
+        )
+
+        if args.profile:
+            print()
+            print(vm_obj.profile.report())
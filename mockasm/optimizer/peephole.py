@@ -0,0 +1,259 @@
+from ..parser import opcode
+from ..runtime import registers
+
+MOVES = ["mov", "movzb", "movsbq", "movsxd", "movswq"]
+JUMPS = ["jmp", "je", "call"]
+
+# The VM treats these as no-ops
+NOPS = ["cqo", "cdq"]
+
+ARITHMETIC = ["lea", "add", "sub", "imul", "idiv", "neg"]
+COMPARISONS = ["cmp", "sete", "setne", "setl", "setle"]
+
+# Opcodes a push and its pop may be moved across, they do not touch the stack
+# or control flow
+STACK_NEUTRAL = MOVES + ARITHMETIC + COMPARISONS + NOPS
+
+# How many opcodes may sit between a push and the pop it is folded with
+MAX_PUSH_DISTANCE = 4
+
+
+class PeepholeOptimizer:
+    def __init__(self, opcodes):
+        self.__opcodes = opcodes
+
+    def __operand_slots(self, value):
+        # Register slots an operand reads, including those used for addressing
+        if value in registers.REGISTERS.keys():
+            return [registers.REGISTERS[value][0]]
+        elif value.startswith("_"):
+            if value[1:].isdigit():
+                return [registers.RBP]
+
+            return [registers.REGISTERS.get(value[1:], (None,))[0]]
+        elif "(" in value:
+            return [registers.REGISTERS.get(value.split("(")[1], (None,))[0]]
+
+        return []
+
+    def __is_full_register(self, value):
+        return value in registers.PARENT_REGISTERS
+
+    def __is_immediate(self, value):
+        return value.lstrip("-").isdigit()
+
+    def __opcode_slots(self, op_code):
+        slots = []
+        for value in str(op_code.op_value).split("---"):
+            slots += self.__operand_slots(value=value)
+
+        return slots
+
+    def __written_register(self, op_code):
+        # The register an opcode writes, None when it writes none
+        if op_code.op_code in ["pop", "neg"]:
+            return op_code.op_value
+        elif op_code.op_code in MOVES + ARITHMETIC:
+            return op_code.op_value.split("---")[1]
+
+        return None
+
+    def __is_set(self, entries, push_idx, value):
+        # Pushing a register that was never set is an error, which a move
+        # would hide. Only a write of at least 32 bits earlier in the same
+        # straight-line run proves it is set.
+        slot = registers.REGISTERS[value][0]
+        if slot in [registers.RSP, registers.RBP]:
+            return True
+
+        for _, op_code in reversed(entries[:push_idx]):
+            if op_code.op_code not in STACK_NEUTRAL + ["push", "pop"]:
+                return False
+
+            written = self.__written_register(op_code=op_code)
+            if written in registers.REGISTERS.keys():
+                written_slot, bits = registers.REGISTERS[written]
+                if written_slot == slot and bits >= 32:
+                    return True
+
+        return False
+
+    def __find_pop(self, entries, push_idx):
+        # The pop that restores push_idx's value, when everything in between
+        # leaves the stack and the popped register alone
+        _, push = entries[push_idx]
+        if push.op_code != "push":
+            return None
+        if not self.__is_immediate(value=push.op_value) and not (
+            self.__is_full_register(value=push.op_value)
+            and self.__is_set(entries=entries, push_idx=push_idx, value=push.op_value)
+        ):
+            return None
+
+        last_idx = min(len(entries), push_idx + MAX_PUSH_DISTANCE + 2)
+        for pop_idx in range(push_idx + 1, last_idx):
+            _, op_code = entries[pop_idx]
+
+            if op_code.op_code == "pop":
+                if not self.__is_full_register(value=op_code.op_value):
+                    return None
+
+                slot = registers.REGISTERS[op_code.op_value][0]
+                for _, between in entries[push_idx + 1 : pop_idx]:
+                    if slot in self.__opcode_slots(op_code=between):
+                        return None
+
+                return pop_idx
+
+            if (
+                op_code.op_code not in STACK_NEUTRAL
+                or registers.RSP in self.__opcode_slots(op_code=op_code)
+            ):
+                return None
+
+        return None
+
+    def __fold_push_pop(self, entries):
+        # push X; ...; pop Y becomes mov X, Y; ... and goes away when X is Y
+        entries = list(entries)
+        is_changed = False
+
+        push_idx = 0
+        while push_idx < len(entries):
+            pop_idx = self.__find_pop(entries=entries, push_idx=push_idx)
+            if pop_idx == None:
+                push_idx += 1
+                continue
+
+            idx, push = entries[push_idx]
+            _, pop = entries[pop_idx]
+            del entries[pop_idx]
+
+            if push.op_value == pop.op_value:
+                del entries[push_idx]
+            else:
+                entries[push_idx] = (
+                    idx,
+                    opcode.OpCode(
+                        op_code="mov",
+                        op_value=f"{push.op_value}---{pop.op_value}",
+                        line_num=push.line_num,
+                    ),
+                )
+                push_idx += 1
+
+            is_changed = True
+
+        return entries, is_changed
+
+    def __drop_dead_move(self, first, second):
+        # The first move's register is overwritten right away without being read
+        if first.op_code not in MOVES or second.op_code not in MOVES:
+            return None
+
+        _, first_dst = first.op_value.split("---")
+        second_src, second_dst = second.op_value.split("---")
+        if (
+            not self.__is_full_register(value=first_dst)
+            or second_dst != first_dst
+            or registers.REGISTERS[first_dst][0]
+            in self.__operand_slots(value=second_src)
+        ):
+            return None
+
+        return [second]
+
+    def __drop_dead_moves(self, entries):
+        rewritten = []
+        is_changed = False
+
+        for entry in entries:
+            if len(rewritten) == 0:
+                rewritten.append(entry)
+                continue
+
+            prev_idx, prev = rewritten[-1]
+            _, current = entry
+
+            replacement = self.__drop_dead_move(first=prev, second=current)
+
+            if replacement == None:
+                rewritten.append(entry)
+                continue
+
+            # The remaining move takes the place of the dropped one
+            rewritten.pop()
+            rewritten += [(prev_idx, replaced) for replaced in replacement]
+            is_changed = True
+
+        return rewritten, is_changed
+
+    def __drop_nops(self, entries):
+        kept = [entry for entry in entries if entry[1].op_code not in NOPS]
+
+        return kept, len(kept) != len(entries)
+
+    def __drop_jumps_to_next(self, entries):
+        # je is left alone, it also clears the flags
+        kept = []
+        for entry_idx, (idx, op_code) in enumerate(entries):
+            if (
+                op_code.op_code == "jmp"
+                and entry_idx + 1 < len(entries)
+                and entries[entry_idx + 1][0] == op_code.op_value
+            ):
+                continue
+
+            kept.append((idx, op_code))
+
+        return kept, len(kept) != len(entries)
+
+    def __drop_labels(self, entries):
+        # Only labels the VM looks up by name have to stay: main and the call
+        # targets. Every other label is skipped over by jumps anyway.
+        call_targets = set(
+            op_code.op_value for _, op_code in entries if op_code.op_code == "call"
+        )
+
+        return [
+            (idx, op_code)
+            for idx, op_code in entries
+            if op_code.op_code != "label"
+            or op_code.op_value == "main"
+            or idx in call_targets
+        ]
+
+    def __remap_jumps(self, entries):
+        # Jumps continue right after their target, so a target maps to just
+        # before the first opcode kept past it
+        new_positions = {idx: new_idx for new_idx, (idx, _) in enumerate(entries)}
+        next_kept = [len(entries)] * (len(self.__opcodes) + 1)
+        for idx in range(len(self.__opcodes) - 1, -1, -1):
+            next_kept[idx] = new_positions.get(idx, next_kept[idx + 1])
+
+        return [
+            opcode.OpCode(
+                op_code=op_code.op_code,
+                op_value=next_kept[op_code.op_value + 1] - 1,
+                line_num=op_code.line_num,
+            )
+            if op_code.op_code in JUMPS
+            else op_code
+            for _, op_code in entries
+        ]
+
+    def optimize(self):
+        entries = list(enumerate(self.__opcodes))
+
+        # Patterns never match across a label, as it may be a jump target
+        is_changed = True
+        while is_changed:
+            entries, nops_dropped = self.__drop_nops(entries=entries)
+            entries, pushes_folded = self.__fold_push_pop(entries=entries)
+            entries, moves_dropped = self.__drop_dead_moves(entries=entries)
+            entries, jumps_dropped = self.__drop_jumps_to_next(entries=entries)
+            is_changed = nops_dropped or pushes_folded or moves_dropped or jumps_dropped
+
+        entries = self.__drop_labels(entries=entries)
+
+        return self.__remap_jumps(entries=entries)
@@ -0,0 +1,94 @@
+import collections
+
+# Token types each instruction expects, in order, starting with the token that
+# selects the rule. Alternatives are separated by commas.
+MOVE = [
+    "number,register,location_at,address,relative_address",
+    "comma",
+    "register,location_at,address,relative_address",
+]
+ARITHMETIC = ["number,register", "comma", "register"]
+SINGLE = ["number,register"]
+
+GRAMMAR = {
+    "mov": MOVE,
+    "movzb": MOVE,
+    "movsbq": MOVE,
+    "movsxd": MOVE,
+    "movswq": MOVE,
+    "ret": [],
+    "add": ARITHMETIC,
+    "sub": ARITHMETIC,
+    "imul": ARITHMETIC,
+    "idiv": ARITHMETIC,
+    "cqo": [],
+    "cdq": [],
+    "neg": ["register"],
+    "push": SINGLE,
+    "pop": SINGLE,
+    "cmp": ARITHMETIC,
+    "sete": SINGLE,
+    "setne": SINGLE,
+    "setl": SINGLE,
+    "setle": SINGLE,
+    "lea": ["address,global", "comma", "register"],
+    "jmp": ["label"],
+    "je": ["label"],
+    "label": ["colon"],
+    "call": ["label"],
+    "global": [],
+    "byte": ["number"],
+}
+
+# Rules whose leading token is also the value, e.g. a label definition
+VALUE_HEADS = ["label", "global"]
+
+# Labels are bound to jump/call targets once the whole program is parsed
+JUMPS = ["jmp", "je", "call"]
+LABELS = ["label"]
+
+# Token types that never contribute to the opcode value
+PUNCTUATION = ["comma", "colon"]
+
+# Token types whose lexeme is prefixed with _ in the opcode value
+PREFIXED = frozenset(["location_at", "address"])
+
+# token_types is the set of accepted token types, expected how they are shown
+# in an error and is_value whether the lexeme goes into the opcode value
+Slot = collections.namedtuple("slot", ["token_types", "expected", "is_value"])
+Rule = collections.namedtuple("rule", ["op_code", "slots", "is_jump", "is_label"])
+
+
+def compile_slot(expected_token_types, is_value):
+    token_types = expected_token_types.split(",")
+
+    return Slot(
+        token_types=frozenset(token_types),
+        expected=expected_token_types if len(token_types) == 1 else str(token_types),
+        is_value=is_value,
+    )
+
+
+def compile_grammar(grammar):
+    rules = {}
+    for op_code, operands in grammar.items():
+        slots = [compile_slot(expected_token_types=op_code, is_value=op_code in VALUE_HEADS)]
+        slots += [
+            compile_slot(
+                expected_token_types=expected_token_types,
+                is_value=expected_token_types not in PUNCTUATION,
+            )
+            for expected_token_types in operands
+        ]
+
+        rules[op_code] = Rule(
+            op_code=op_code,
+            slots=tuple(slots),
+            is_jump=op_code in JUMPS,
+            is_label=op_code in LABELS,
+        )
+
+    return rules
+
+
+RULES = compile_grammar(grammar=GRAMMAR)
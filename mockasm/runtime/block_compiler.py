@@ -0,0 +1,306 @@
+from . import decoder
+from . import flags
+from . import registers
+
+# Times a block start has to be reached before it is compiled
+HOT_THRESHOLD = 8
+
+MOVES = frozenset(["mov", "movzb", "movsbq", "movsxd", "movswq"])
+ARITHMETIC = {"add": "+", "sub": "-", "imul": "*", "idiv": "//"}
+# Blocks keep the flags in the local fb, as flag bits
+LESS = f"(fb & {flags.NEGATIVE | flags.POSITIVE}) == {flags.NEGATIVE}"
+SETS = {
+    "sete": f"fb & {flags.ZERO}",
+    "setne": f"not fb & {flags.ZERO}",
+    "setl": LESS,
+    "setle": f"{LESS} or fb & {flags.ZERO}",
+}
+NOPS = frozenset(["label", "cqo", "cdq", "global", "byte"])
+
+# ret may halt the program, it ends the block and the interpreter runs it
+SUPPORTED = MOVES | set(ARITHMETIC.keys()) | set(SETS.keys()) | NOPS
+SUPPORTED |= {"neg", "push", "pop", "cmp", "lea", "jmp", "je", "call"}
+
+# Instructions after which control does not simply fall through
+TERMINATORS = frozenset(["jmp", "je", "call"])
+
+FLAG_OP_CODES = frozenset(["cmp", "je"]) | set(SETS.keys())
+MEMORY_OP_CODES = frozenset(["push", "pop"]) | MOVES
+
+
+class BlockCompiler:
+    def __init__(self, instructions):
+        self.__instructions = instructions
+
+    def __local(self, slot):
+        return f"r{slot}"
+
+    def __result_bits(self, result):
+        # Expression for the flag bits a compare with this result sets
+        return (
+            f"{flags.NEGATIVE} if {result} < 0 "
+            f"else {flags.ZERO} if {result} == 0 else {flags.POSITIVE}"
+        )
+
+    def __to_int64(self, expression):
+        sign = hex(registers.INT64_SIGN)
+        return f"((({expression}) + {sign}) & {hex(registers.UINT64_MASK)}) - {sign}"
+
+    def __narrow(self, expression, bits, signed):
+        mask = (1 << bits) - 1
+        if not signed:
+            return f"({expression} & {mask})"
+
+        sign = 1 << (bits - 1)
+        return f"((({expression} & {mask}) ^ {sign}) - {sign})"
+
+    def __address(self, operand):
+        if operand.kind == decoder.ADDRESS:
+            return f"({self.__local(slot=registers.RBP)} - {operand.value})"
+        elif operand.kind == decoder.LOCATION_AT:
+            return self.__local(slot=operand.register)
+        elif operand.kind == decoder.RELATIVE_ADDRESS:
+            return f"({self.__local(slot=operand.register)} + {operand.value})"
+
+        return repr(operand.value)
+
+    def __read(self, operand, bits=64, signed=True):
+        if operand.kind == decoder.IMMEDIATE:
+            return repr(operand.value)
+        elif operand.kind == decoder.REGISTER:
+            return self.__local(slot=operand.register)
+        elif operand.kind == decoder.SUB_REGISTER:
+            return self.__narrow(
+                expression=self.__local(slot=operand.register),
+                bits=operand.bits,
+                signed=signed,
+            )
+        elif operand.kind in decoder.MEMORY_KINDS:
+            return f"load({self.__address(operand=operand)}, {bits}, {signed})"
+
+        return repr(operand.value)
+
+    def __write(self, operand, expression, wrap=True):
+        # wrap is False for values that are signed 64-bit already
+        local = self.__local(slot=operand.register)
+        if operand.kind == decoder.REGISTER:
+            if wrap:
+                expression = self.__to_int64(expression=expression)
+
+            return [f"{local} = {expression}"]
+        elif operand.bits == 32:
+            return [f"{local} = ({expression}) & 0xFFFFFFFF"]
+
+        mask = (1 << operand.bits) - 1
+        return [f"{local} = ({local} & {~mask}) | (({expression}) & {mask})"]
+
+    def __operand_reads(self, operand):
+        # Slots an operand reads when used as a source or for addressing
+        if operand == None:
+            return []
+        elif operand.kind in [decoder.REGISTER, decoder.SUB_REGISTER]:
+            return [operand.register]
+        elif operand.kind == decoder.ADDRESS:
+            return [registers.RBP]
+        elif operand.kind in [decoder.LOCATION_AT, decoder.RELATIVE_ADDRESS]:
+            return [operand.register]
+
+        return []
+
+    def __written_slot(self, operand):
+        # (slot, whether the old value is kept in part, width the register is
+        # left with or None when it keeps its width) for a register written
+        if operand.kind == decoder.REGISTER:
+            return [(operand.register, False, 64)]
+        elif operand.bits == 32:
+            return [(operand.register, False, 32)]
+
+        return [(operand.register, True, None)]
+
+    def __accesses(self, instruction):
+        # Slots read, then (slot, is partial, width) for the slots written
+        op_code = instruction.op_code
+        src = instruction.src
+        dst = instruction.dst
+
+        if op_code in MOVES or op_code == "lea":
+            reads = self.__operand_reads(operand=src)
+            if dst.kind in decoder.MEMORY_KINDS:
+                return reads + self.__operand_reads(operand=dst), []
+
+            return reads, self.__written_slot(operand=dst)
+        elif op_code in ARITHMETIC or op_code == "neg":
+            reads = self.__operand_reads(operand=src) + [dst.register]
+            return reads, self.__written_slot(operand=dst)
+        elif op_code == "push":
+            reads = self.__operand_reads(operand=src) + [registers.RSP]
+            return reads, [(registers.RSP, False, 64)]
+        elif op_code == "pop":
+            return [registers.RSP], [
+                (registers.RSP, False, 64)
+            ] + self.__written_slot(operand=dst)
+        elif op_code == "cmp":
+            reads = self.__operand_reads(operand=src) + self.__operand_reads(
+                operand=dst
+            )
+            return reads, []
+        elif op_code in SETS:
+            return [], self.__written_slot(operand=dst)
+
+        return [], []
+
+    def __translate(self, instruction, pc):
+        op_code = instruction.op_code
+        src = instruction.src
+        dst = instruction.dst
+
+        if op_code in NOPS:
+            return []
+        elif op_code in MOVES:
+            value = self.__read(
+                operand=src, bits=instruction.bits, signed=op_code != "movzb"
+            )
+            if dst.kind in decoder.MEMORY_KINDS:
+                return [
+                    f"store({self.__address(operand=dst)}, {value}, {instruction.bits})"
+                ]
+
+            return self.__write(
+                operand=dst, expression=value, wrap=src.kind == decoder.IMMEDIATE
+            )
+        elif op_code in ARITHMETIC:
+            existing = self.__read(operand=dst)
+            value = self.__read(operand=src)
+            return self.__write(
+                operand=dst, expression=f"{existing} {ARITHMETIC[op_code]} {value}"
+            )
+        elif op_code == "neg":
+            return self.__write(
+                operand=dst, expression=f"-1 * {self.__read(operand=dst)}"
+            )
+        elif op_code == "push":
+            rsp = self.__local(slot=registers.RSP)
+            return [
+                f"value = {self.__read(operand=src)}",
+                f"{rsp} = {rsp} - 8",
+                f"store({rsp}, value, 64)",
+            ]
+        elif op_code == "pop":
+            rsp = self.__local(slot=registers.RSP)
+            return [
+                f"value = load({rsp}, 64, True)",
+                f"{rsp} = {rsp} + 8",
+            ] + self.__write(operand=dst, expression="value", wrap=False)
+        elif op_code == "cmp":
+            return [
+                f"value = {self.__read(operand=src)}",
+                f"result = {self.__read(operand=dst)} - value",
+                f"fb |= {self.__result_bits(result='result')}",
+            ]
+        elif op_code in SETS:
+            return self.__write(
+                operand=dst, expression=f"1 if {SETS[op_code]} else 0", wrap=False
+            ) + ["fb = 0"]
+        elif op_code == "lea":
+            return self.__write(operand=dst, expression=self.__address(operand=src))
+        elif op_code == "jmp":
+            return [f"next_pc = {instruction.src + 1}"]
+        elif op_code == "je":
+            return [
+                f"next_pc = {instruction.src + 1} if fb & {flags.ZERO} "
+                f"else {pc + 1}",
+                "fb = 0",
+            ]
+        elif op_code == "call":
+            return [f"call_stack.append({pc})", f"next_pc = {instruction.src + 1}"]
+
+    def __collect(self, start):
+        # Instructions of the block starting at start, up to and including the
+        # first jump or call, and stopping before anything unsupported
+        block = []
+        for pc in range(start, len(self.__instructions)):
+            instruction = self.__instructions[pc]
+            if instruction.op_code not in SUPPORTED:
+                break
+
+            block.append((pc, instruction))
+            if instruction.op_code in TERMINATORS:
+                break
+
+        return block
+
+    def source(self, start):
+        block = self.__collect(start=start)
+        if len(block) == 0:
+            return None, 0
+
+        live_in = []
+        merged = []
+        written = []
+        widths = {}
+        for _, instruction in block:
+            reads, writes = self.__accesses(instruction=instruction)
+            for slot in reads:
+                if slot not in written + live_in + merged:
+                    live_in.append(slot)
+
+            for slot, is_partial, width in writes:
+                if is_partial and slot not in written + live_in + merged:
+                    merged.append(slot)
+                if slot not in written:
+                    written.append(slot)
+                # rsp and rbp have no 32-bit name, they always stay 64 wide
+                if width != None and slot not in [registers.RSP, registers.RBP]:
+                    widths[slot] = width
+
+        op_codes = set(instruction.op_code for _, instruction in block)
+        uses_flags = len(op_codes & FLAG_OP_CODES) > 0
+        uses_memory = len(op_codes & MEMORY_OP_CODES) > 0
+
+        lines = [f"def block_{start}(R, W, memory, flags, call_stack):"]
+
+        # Registers that are read before being written must already be set,
+        # otherwise the interpreter runs the block to raise its usual errors
+        if len(live_in) > 0:
+            condition = " or ".join(f"R[{slot}] is None" for slot in live_in)
+            lines += [f"    if {condition}:", "        return None"]
+
+        lines += [f"    {self.__local(slot=slot)} = R[{slot}]" for slot in live_in]
+        lines += [
+            f"    {self.__local(slot=slot)} = 0 if R[{slot}] is None else R[{slot}]"
+            for slot in merged
+        ]
+        # flags is the VM's [unread compare result, flag bits] pair
+        if uses_flags:
+            lines += [
+                "    result, fb = flags",
+                "    if result is not None:",
+                f"        fb |= {self.__result_bits(result='result')}",
+            ]
+        if uses_memory:
+            lines.append("    load, store = memory.load, memory.store")
+
+        lines.append(f"    next_pc = {block[-1][0] + 1}")
+        for pc, instruction in block:
+            lines += [
+                "    " + line
+                for line in self.__translate(instruction=instruction, pc=pc)
+            ]
+
+        lines += [f"    R[{slot}] = {self.__local(slot=slot)}" for slot in written]
+        lines += [f"    W[{slot}] = {width}" for slot, width in widths.items()]
+        if uses_flags:
+            lines += ["    flags[0] = None", "    flags[1] = fb"]
+        lines.append("    return next_pc")
+
+        return "\n".join(lines) + "\n", len(block)
+
+    def compile_block(self, start):
+        source, num_instructions = self.source(start=start)
+        if source == None:
+            return None
+
+        namespace = {}
+        exec(compile(source, f"<block {start}>", "exec"), namespace)
+
+        return namespace[f"block_{start}"], num_instructions
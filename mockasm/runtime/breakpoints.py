@@ -0,0 +1,147 @@
+import ast
+import collections
+
+from . import decoder
+from . import registers
+from ..utils import error_utils
+
+# Why a run stopped before the program ended
+BREAKPOINT = "breakpoint"
+WATCHPOINT = "watchpoint"
+RETURN = "return"
+MAX_STEPS = "max_steps"
+TIMEOUT = "timeout"
+CANCELLED = "cancelled"
+
+# pc is where execution continues, for a breakpoint the instruction it stopped
+# in front of
+Stop = collections.namedtuple(
+    "stop", ["reason", "breakpoint_id", "pc", "line_num"]
+)
+
+# pcs are the instructions a breakpoint stops in front of, condition is None
+# or a Condition
+Breakpoint = collections.namedtuple("breakpoint", ["pcs", "condition"])
+
+# Exactly one of register and address is set, register is (slot, bits)
+Watchpoint = collections.namedtuple("watchpoint", ["register", "address", "bits"])
+
+# Breakpoint traps are dispatched after the regular opcodes
+TRAP_OP_NUM = len(decoder.OP_CODES)
+
+# Opcodes whose handlers may change a register or memory
+REGISTER_WRITE_OP_CODES = [
+    "mov",
+    "movzb",
+    "movsbq",
+    "movsxd",
+    "movswq",
+    "add",
+    "sub",
+    "imul",
+    "idiv",
+    "neg",
+    "push",
+    "pop",
+    "sete",
+    "setne",
+    "setl",
+    "setle",
+    "lea",
+]
+MEMORY_WRITE_OP_CODES = ["push", "mov", "movzb", "movsbq", "movsxd", "movswq"]
+
+# Syntax allowed in conditions, anything else is rejected before evaluating.
+# Multiplication, shifts and powers are left out, they let a short condition
+# like 1 << 10**9 build numbers big enough to hang the run.
+CONDITION_NODES = (
+    ast.Expression,
+    ast.BoolOp,
+    ast.And,
+    ast.Or,
+    ast.UnaryOp,
+    ast.Not,
+    ast.USub,
+    ast.UAdd,
+    ast.Invert,
+    ast.BinOp,
+    ast.Add,
+    ast.Sub,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.BitAnd,
+    ast.BitOr,
+    ast.BitXor,
+    ast.Compare,
+    ast.Eq,
+    ast.NotEq,
+    ast.Lt,
+    ast.LtE,
+    ast.Gt,
+    ast.GtE,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+)
+
+
+class StopExecution(Exception):
+    # Raised by trap and watch handlers to leave the run loop
+    def __init__(self, stop, num_steps):
+        super().__init__(stop.reason)
+
+        self.stop = stop
+        self.num_steps = num_steps
+
+
+class Condition:
+    def __init__(self, expression):
+        self.__expression = expression
+
+        try:
+            tree = ast.parse(expression, mode="eval")
+        except SyntaxError:
+            error_utils.error(msg=f"Invalid condition '{expression}'")
+
+        self.__names = []
+        for node in ast.walk(tree):
+            if not isinstance(node, CONDITION_NODES) or (
+                isinstance(node, ast.Constant) and type(node.value) != int
+            ):
+                error_utils.error(
+                    msg=f"Conditions can only use registers, numbers and operators, got '{expression}'"
+                )
+
+            if isinstance(node, ast.Name):
+                if node.id not in registers.REGISTERS.keys():
+                    error_utils.error(
+                        msg=f"Unknown register '{node.id}' in condition '{expression}'"
+                    )
+
+                self.__names.append(node.id)
+
+        self.__code = compile(tree, "<condition>", "eval")
+
+    @property
+    def expression(self):
+        return self.__expression
+
+    def evaluate(self, register_file):
+        values = {}
+        for name in self.__names:
+            slot, bits = registers.REGISTERS[name]
+            values[name] = (
+                register_file.values[slot]
+                if bits == 64
+                else register_file.read(slot=slot, bits=bits)
+            )
+
+            # Nothing can be said about a register that has not been set
+            if values[name] == None:
+                return False
+
+        # A division by zero cannot hold, the run goes on
+        try:
+            return bool(eval(self.__code, {"__builtins__": {}}, values))
+        except ArithmeticError:
+            return False
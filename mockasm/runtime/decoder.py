@@ -0,0 +1,308 @@
+import collections
+
+from . import registers
+from ..utils import error_utils
+
+# Operand kinds
+IMMEDIATE = 0
+REGISTER = 1  # 64-bit register
+SUB_REGISTER = 2  # 8/16/32-bit view of a 64-bit register
+ADDRESS = 3  # $_<number>, offset below rbp
+LOCATION_AT = 4  # (<register>)
+RELATIVE_ADDRESS = 5  # <number>(<register>)
+GLOBAL = 6  # .global.<name>, resolved to its address in the globals segment
+
+MEMORY_KINDS = [ADDRESS, LOCATION_AT, RELATIVE_ADDRESS]
+
+# Opcodes in dispatch order, an instruction's op_num indexes into this list
+OP_CODES = [
+    "mov",
+    "movzb",
+    "movsbq",
+    "movsxd",
+    "movswq",
+    "ret",
+    "add",
+    "sub",
+    "imul",
+    "idiv",
+    "cqo",
+    "cdq",
+    "neg",
+    "push",
+    "pop",
+    "cmp",
+    "sete",
+    "setne",
+    "setl",
+    "setle",
+    "lea",
+    "jmp",
+    "je",
+    "label",
+    "call",
+    "global",
+    "byte",
+]
+OP_NUMS = {op_code: op_num for op_num, op_code in enumerate(OP_CODES)}
+
+# register is the slot of the 64-bit parent register, bits the width read or
+# written through it
+Operand = collections.namedtuple("operand", ["kind", "register", "value", "bits"])
+
+# src/dst hold operands for data instructions, the raw jump/call index, label
+# name, global name or byte value for the rest. For global and byte dst is the
+# address in the globals segment. bits is the width of a memory access.
+Instruction = collections.namedtuple(
+    "instruction", ["op_code", "op_num", "src", "dst", "bits", "line_num"]
+)
+
+
+class Decoder:
+    def __init__(self, opcodes):
+        self.__opcodes = opcodes
+        self.__instructions = []
+        self.__symbol_table = {}
+
+        self.__global_addresses = {}
+        self.__globals_size = 0
+        self.__current_global_address = None
+        self.__current_global_size = 0
+
+        # Widths loaded by the extending moves, plain mov loads its destination width
+        self.__load_bits = {"movzb": 8, "movsbq": 8, "movswq": 16, "movsxd": 32}
+
+    @property
+    def symbol_table(self):
+        return self.__symbol_table
+
+    @property
+    def global_addresses(self):
+        return self.__global_addresses
+
+    @property
+    def globals_size(self):
+        return self.__globals_size
+
+    def __append_instruction(self, instruction):
+        self.__instructions.append(instruction)
+
+    def __decode_register(self, register):
+        if register not in registers.REGISTERS.keys():
+            error_utils.error(msg=f"Unknown register '{register}'")
+
+        return registers.REGISTERS[register]
+
+    def __decode_operand(self, value):
+        if value.startswith("_"):
+            if value[1:].isdigit():
+                return Operand(
+                    kind=ADDRESS, register=None, value=int(value[1:]), bits=64
+                )
+
+            slot, _ = self.__decode_register(register=value[1:])
+            return Operand(kind=LOCATION_AT, register=slot, value=None, bits=64)
+        elif "(" in value:
+            index, register = value.split("(")
+            slot, _ = self.__decode_register(register=register)
+            return Operand(
+                kind=RELATIVE_ADDRESS, register=slot, value=int(index), bits=64
+            )
+        elif value in registers.REGISTERS.keys():
+            slot, bits = registers.REGISTERS[value]
+            return Operand(
+                kind=REGISTER if bits == 64 else SUB_REGISTER,
+                register=slot,
+                value=None,
+                bits=bits,
+            )
+        elif value.startswith("g_"):
+            return Operand(kind=GLOBAL, register=None, value=value, bits=64)
+
+        try:
+            return Operand(kind=IMMEDIATE, register=None, value=int(value), bits=64)
+        except ValueError:
+            error_utils.error(msg=f"Cannot decode operand '{value}'")
+
+    def __decode_move(self, op_code):
+        value, register = op_code.op_value.split("---")
+
+        src = self.__decode_operand(value=value)
+        dst = self.__decode_operand(value=register)
+
+        if dst.kind in MEMORY_KINDS:
+            bits = src.bits
+        elif src.kind in MEMORY_KINDS:
+            bits = self.__load_bits.get(op_code.op_code, dst.bits)
+        else:
+            bits = 64
+
+        return Instruction(
+            op_code=op_code.op_code,
+            op_num=OP_NUMS[op_code.op_code],
+            src=src,
+            dst=dst,
+            bits=bits,
+            line_num=op_code.line_num,
+        )
+
+    def __decode_arithmetic_op(self, op_code):
+        value, register = op_code.op_value.split("---")
+
+        src = self.__decode_operand(value=value)
+        dst = self.__decode_operand(value=register)
+
+        return Instruction(
+            op_code=op_code.op_code,
+            op_num=OP_NUMS[op_code.op_code],
+            src=src,
+            dst=dst,
+            bits=dst.bits,
+            line_num=op_code.line_num,
+        )
+
+    def __decode_cmp(self, op_code):
+        src_register, dst_register = op_code.op_value.split("---")
+
+        return Instruction(
+            op_code="cmp",
+            op_num=OP_NUMS[op_code.op_code],
+            src=self.__decode_operand(value=src_register),
+            dst=self.__decode_operand(value=dst_register),
+            bits=64,
+            line_num=op_code.line_num,
+        )
+
+    def __decode_lea(self, op_code):
+        address, register = op_code.op_value.split("---")
+
+        return Instruction(
+            op_code="lea",
+            op_num=OP_NUMS[op_code.op_code],
+            src=self.__decode_operand(value=address),
+            dst=self.__decode_operand(value=register),
+            bits=64,
+            line_num=op_code.line_num,
+        )
+
+    def __decode_single_operand(self, op_code):
+        operand = self.__decode_operand(value=op_code.op_value)
+
+        return Instruction(
+            op_code=op_code.op_code,
+            op_num=OP_NUMS[op_code.op_code],
+            src=operand,
+            dst=operand,
+            bits=64,
+            line_num=op_code.line_num,
+        )
+
+    def __decode_raw(self, op_code, value):
+        return Instruction(
+            op_code=op_code.op_code,
+            op_num=OP_NUMS[op_code.op_code],
+            src=value,
+            dst=None,
+            bits=64,
+            line_num=op_code.line_num,
+        )
+
+    def __end_global(self):
+        if self.__current_global_address == None:
+            return
+
+        # Globals without data are 8 zero bytes, everything stays 8-byte aligned
+        size = max(self.__current_global_size, 8)
+        self.__globals_size += (size + 7) // 8 * 8
+
+        self.__current_global_address = None
+        self.__current_global_size = 0
+
+    def __decode_global(self, op_code):
+        self.__end_global()
+
+        self.__current_global_address = self.__globals_size
+        self.__global_addresses[op_code.op_value] = self.__current_global_address
+
+        return Instruction(
+            op_code="global",
+            op_num=OP_NUMS[op_code.op_code],
+            src=op_code.op_value,
+            dst=self.__current_global_address,
+            bits=64,
+            line_num=op_code.line_num,
+        )
+
+    def __decode_byte(self, op_code):
+        if self.__current_global_address == None:
+            error_utils.error(
+                msg=f"byte at Line {op_code.line_num} does not belong to a global"
+            )
+
+        address = self.__current_global_address + self.__current_global_size
+        self.__current_global_size += 1
+
+        return Instruction(
+            op_code="byte",
+            op_num=OP_NUMS[op_code.op_code],
+            src=int(op_code.op_value),
+            dst=address,
+            bits=8,
+            line_num=op_code.line_num,
+        )
+
+    def __resolve_global_operands(self):
+        for idx, instruction in enumerate(self.__instructions):
+            operand = instruction.src
+            if type(operand) != Operand or operand.kind != GLOBAL:
+                continue
+
+            if operand.value not in self.__global_addresses.keys():
+                error_utils.error(
+                    msg=f"Unknown global '{operand.value}' at Line {instruction.line_num}"
+                )
+
+            self.__instructions[idx] = instruction._replace(
+                src=operand._replace(value=self.__global_addresses[operand.value])
+            )
+
+    def decode(self):
+        for op_code in self.__opcodes:
+            if op_code.op_code in ["mov", "movzb", "movsbq", "movsxd", "movswq"]:
+                instruction = self.__decode_move(op_code=op_code)
+            elif op_code.op_code in ["add", "sub", "imul", "idiv"]:
+                instruction = self.__decode_arithmetic_op(op_code=op_code)
+            elif op_code.op_code == "cmp":
+                instruction = self.__decode_cmp(op_code=op_code)
+            elif op_code.op_code == "lea":
+                instruction = self.__decode_lea(op_code=op_code)
+            elif op_code.op_code in [
+                "push",
+                "pop",
+                "neg",
+                "sete",
+                "setne",
+                "setl",
+                "setle",
+            ]:
+                instruction = self.__decode_single_operand(op_code=op_code)
+            elif op_code.op_code == "global":
+                instruction = self.__decode_global(op_code=op_code)
+            elif op_code.op_code == "byte":
+                instruction = self.__decode_byte(op_code=op_code)
+            elif op_code.op_code in ["jmp", "je", "call"]:
+                instruction = self.__decode_raw(
+                    op_code=op_code, value=int(op_code.op_value)
+                )
+            else:
+                if op_code.op_code == "label":
+                    self.__symbol_table[op_code.op_value] = len(self.__instructions)
+
+                instruction = self.__decode_raw(op_code=op_code, value=op_code.op_value)
+
+            self.__append_instruction(instruction=instruction)
+
+        self.__end_global()
+        self.__resolve_global_operands()
+
+        return self.__instructions
@@ -0,0 +1,41 @@
+# Flag bits, in the order the trace file stores them
+ZERO = 1
+NEGATIVE = 2
+POSITIVE = 4
+
+FLAG_BITS = {"zero": ZERO, "negative": NEGATIVE, "positive": POSITIVE}
+
+# Whether a condition code holds, indexed by the flag bits set since the flags
+# were last cleared. Flags from several compares add up, so e.g. both ZERO and
+# NEGATIVE may be set.
+CONDITION_CODES = {
+    "e": [bits & ZERO != 0 for bits in range(8)],
+    "ne": [bits & ZERO == 0 for bits in range(8)],
+    "l": [bits & (NEGATIVE | POSITIVE) == NEGATIVE for bits in range(8)],
+    "le": [
+        bits & (NEGATIVE | POSITIVE) == NEGATIVE or bits & ZERO != 0
+        for bits in range(8)
+    ],
+}
+
+# Opcodes that read the flags, and then clear them, by the condition they test
+CONDITIONS = {
+    "sete": CONDITION_CODES["e"],
+    "setne": CONDITION_CODES["ne"],
+    "setl": CONDITION_CODES["l"],
+    "setle": CONDITION_CODES["le"],
+    "je": CONDITION_CODES["e"],
+}
+
+
+def result_bits(result):
+    if result < 0:
+        return NEGATIVE
+    elif result == 0:
+        return ZERO
+
+    return POSITIVE
+
+
+def to_dict(bits):
+    return {name: 1 if bits & bit else 0 for name, bit in FLAG_BITS.items()}
@@ -0,0 +1,55 @@
+from . import decoder
+
+SET_OP_CODES = frozenset(["sete", "setne", "setl", "setle"])
+MOVE_OP_CODES = frozenset(["mov", "movzb", "movsbq", "movsxd", "movswq"])
+
+# Sequences compilers emit back to back, each slot lists the opcodes it accepts.
+# Longer sequences are tried first.
+FUSED_SEQUENCES = {
+    "cmp_set_movzb": [frozenset(["cmp"]), SET_OP_CODES, frozenset(["movzb"])],
+    "push_mov_pop": [frozenset(["push"]), MOVE_OP_CODES, frozenset(["pop"])],
+    "cmp_je": [frozenset(["cmp"]), frozenset(["je"])],
+}
+
+# Fused instructions are numbered after the regular opcodes
+FUSED_OP_CODES = list(FUSED_SEQUENCES.keys())
+FUSED_OP_NUMS = {
+    op_code: len(decoder.OP_CODES) + idx for idx, op_code in enumerate(FUSED_OP_CODES)
+}
+
+
+def match_sequence(instructions, pc):
+    for op_code, slots in FUSED_SEQUENCES.items():
+        parts = instructions[pc : pc + len(slots)]
+        if len(parts) == len(slots) and all(
+            part.op_code in slot for part, slot in zip(parts, slots)
+        ):
+            return op_code, parts
+
+    return None, None
+
+
+def fuse(instructions):
+    # The first instruction of a sequence is replaced by one that runs all of
+    # them. The rest stay where they are, so jumping into the middle of a
+    # sequence still runs the remaining instructions one by one.
+    fused = list(instructions)
+
+    pc = 0
+    while pc < len(fused):
+        op_code, parts = match_sequence(instructions=instructions, pc=pc)
+        if op_code == None:
+            pc += 1
+            continue
+
+        fused[pc] = decoder.Instruction(
+            op_code=op_code,
+            op_num=FUSED_OP_NUMS[op_code],
+            src=tuple(parts),
+            dst=None,
+            bits=64,
+            line_num=parts[0].line_num,
+        )
+        pc += len(parts)
+
+    return fused
@@ -0,0 +1,46 @@
+import collections
+import threading
+import time
+
+from . import breakpoints
+from ..utils import error_utils
+
+# Steps a plain run takes between looking at the clock and the cancel token
+CHECK_INTERVAL = 4096
+
+# What VM.run returns. value is the program result, None when stop says the
+# run was stopped early. state is the VM state where execution continues from.
+RunResult = collections.namedtuple(
+    "run_result", ["value", "stop", "pc", "num_steps", "state"]
+)
+
+
+class CancelToken:
+    # Can be cancelled from any thread, a running VM notices on its next check
+    def __init__(self):
+        self.__event = threading.Event()
+
+    @property
+    def is_cancelled(self):
+        return self.__event.is_set()
+
+    def cancel(self):
+        self.__event.set()
+
+
+class Limits:
+    def __init__(self, timeout=None, cancel_token=None):
+        if timeout != None and timeout < 0:
+            error_utils.error(msg=f"Timeout has to be positive, got {timeout}")
+
+        self.__deadline = None if timeout == None else time.monotonic() + timeout
+        self.__cancel_token = cancel_token
+
+    def exceeded(self):
+        # Why the run has to stop, None while it may go on
+        if self.__cancel_token != None and self.__cancel_token.is_cancelled:
+            return breakpoints.CANCELLED
+        elif self.__deadline != None and time.monotonic() >= self.__deadline:
+            return breakpoints.TIMEOUT
+
+        return None
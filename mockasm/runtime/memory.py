@@ -0,0 +1,115 @@
+import struct
+
+from ..utils import error_utils
+
+# Bytes reserved above the globals segment for the stack
+STACK_SIZE = 1 << 20
+
+# Bytes past the top of the stack that can still be touched, e.g. above the
+# first frame. Anything further is a wild access and fails instead of growing
+# memory to it.
+STACK_MARGIN = 1 << 20
+
+# Little-endian accessors keyed by access width in bits
+LOAD_FORMATS = {
+    (8, True): struct.Struct("<b"),
+    (8, False): struct.Struct("<B"),
+    (16, True): struct.Struct("<h"),
+    (16, False): struct.Struct("<H"),
+    (32, True): struct.Struct("<i"),
+    (32, False): struct.Struct("<I"),
+    (64, True): struct.Struct("<q"),
+    (64, False): struct.Struct("<Q"),
+}
+STORE_FORMATS = {bits: LOAD_FORMATS[(bits, False)] for bits in [8, 16, 32, 64]}
+
+
+class Memory:
+    def __init__(self, globals_size, stack_size=STACK_SIZE):
+        self.__globals_size = globals_size
+        self.__stack_top = globals_size + stack_size
+        self.__max_size = self.__stack_top + STACK_MARGIN
+        self.__data = bytearray(self.__stack_top)
+
+    @property
+    def globals_size(self):
+        return self.__globals_size
+
+    @property
+    def stack_top(self):
+        return self.__stack_top
+
+    @property
+    def size(self):
+        return len(self.__data)
+
+    @property
+    def max_size(self):
+        return self.__max_size
+
+    def __grow(self, address, num_bytes):
+        end = address + num_bytes
+        if address < 0 or end > self.__max_size:
+            error_utils.error(msg=f"Invalid memory access at address {address}")
+
+        if end > len(self.__data):
+            self.__data.extend(bytes(end - len(self.__data)))
+
+    def load(self, address, bits, signed=True):
+        if address < 0 or address + (bits >> 3) > len(self.__data):
+            self.__grow(address=address, num_bytes=bits >> 3)
+
+        return LOAD_FORMATS[(bits, signed)].unpack_from(self.__data, address)[0]
+
+    def store(self, address, value, bits):
+        if address < 0 or address + (bits >> 3) > len(self.__data):
+            self.__grow(address=address, num_bytes=bits >> 3)
+
+        STORE_FORMATS[bits].pack_into(
+            self.__data, address, value & ((1 << bits) - 1)
+        )
+
+    def dump(self, address, num_bytes):
+        if address < 0 or address + num_bytes > len(self.__data):
+            self.__grow(address=address, num_bytes=num_bytes)
+
+        return {
+            address + i: byte
+            for i, byte in enumerate(self.__data[address : address + num_bytes])
+        }
+
+    def checkpoint(self):
+        # The gap between the globals and the deepest stack write is all zeros
+        # and is left out
+        return (
+            len(self.__data),
+            bytes(self.__data[: self.__globals_size]),
+            bytes(self.__data[self.__globals_size :].lstrip(b"\x00")),
+        )
+
+    def restore(self, checkpoint):
+        size, globals_data, stack_data = checkpoint
+
+        self.__data = bytearray(size)
+        self.__data[: len(globals_data)] = globals_data
+        self.__data[size - len(stack_data) :] = stack_data
+
+    def stack(self, rsp):
+        # Oldest entry first, like the order values were pushed in
+        return [
+            self.load(address=address, bits=64)
+            for address in range(self.__stack_top - 8, rsp - 1, -8)
+        ]
+
+    def snapshot(self, rsp):
+        live_ranges = [
+            range(0, self.__globals_size),
+            range(max(rsp, self.__globals_size), self.__stack_top),
+        ]
+
+        return {
+            address: self.__data[address]
+            for live_range in live_ranges
+            for address in live_range
+            if self.__data[address] != 0
+        }
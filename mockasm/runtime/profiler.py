@@ -0,0 +1,101 @@
+TOP_LEVEL = "<top>"
+
+REPORT_LIMIT = 10
+
+
+class Profile:
+    def __init__(self, instructions, symbol_table):
+        self.__instructions = instructions
+        self.__label_names = {idx: label for label, idx in symbol_table.items()}
+
+        # Filled in by the VM's profiling loop. Counts and times are kept per
+        # instruction and per function, keyed by the index of its label.
+        self.counts = [0] * len(instructions)
+        self.times = [0.0] * len(instructions)
+        self.function_counts = {}
+        self.function_times = {}
+        self.entry = symbol_table.get("main", None)
+
+    def __label_name(self, idx):
+        return self.__label_names.get(idx, TOP_LEVEL)
+
+    def __enclosing_labels(self):
+        labels = []
+        current = TOP_LEVEL
+        for instruction in self.__instructions:
+            if instruction.op_code == "label":
+                current = instruction.src
+            labels.append(current)
+
+        return labels
+
+    def __group(self, keys):
+        counts = {}
+        times = {}
+        for idx, key in enumerate(keys):
+            if self.counts[idx] == 0:
+                continue
+
+            counts[key] = counts.get(key, 0) + self.counts[idx]
+            times[key] = times.get(key, 0.0) + self.times[idx]
+
+        return self.__sort(counts=counts, times=times)
+
+    def __sort(self, counts, times):
+        return sorted(
+            [(key, counts[key], times[key]) for key in counts],
+            key=lambda entry: entry[2],
+            reverse=True,
+        )
+
+    @property
+    def total_count(self):
+        return sum(self.counts)
+
+    @property
+    def total_time(self):
+        return sum(self.times)
+
+    def by_opcode(self):
+        return self.__group(
+            keys=[instruction.op_code for instruction in self.__instructions]
+        )
+
+    def by_line(self):
+        return self.__group(
+            keys=[instruction.line_num for instruction in self.__instructions]
+        )
+
+    def by_label(self):
+        return self.__group(keys=self.__enclosing_labels())
+
+    def by_function(self):
+        counts = {}
+        times = {}
+        for idx, count in self.function_counts.items():
+            name = self.__label_name(idx=idx)
+            counts[name] = counts.get(name, 0) + count
+            times[name] = times.get(name, 0.0) + self.function_times[idx]
+
+        return self.__sort(counts=counts, times=times)
+
+    def report(self, limit=REPORT_LIMIT):
+        total_time = self.total_time
+        lines = [
+            f"Profile: {self.total_count} instructions in {total_time:.6f}s",
+        ]
+
+        sections = [
+            ("Opcode", self.by_opcode()),
+            ("Line", self.by_line()),
+            ("Label", self.by_label()),
+            ("Function", self.by_function()),
+        ]
+        for title, entries in sections:
+            lines.append("")
+            lines.append(f"{title:<20}{'count':>12}{'seconds':>12}{'time %':>9}")
+            for key, count, elapsed in entries[:limit]:
+                share = elapsed / total_time if total_time > 0 else 0.0
+                lines.append(f"{str(key):<20}{count:>12}{elapsed:>12.6f}{share:>9.1%}")
+
+        return "\n".join(lines)
@@ -0,0 +1,96 @@
+# 64-bit registers in slot order, every narrower register aliases one of these
+PARENT_REGISTERS = ["rax", "rdi", "rsi", "rdx", "rcx", "r8", "r9", "rsp", "rbp"]
+
+RAX = PARENT_REGISTERS.index("rax")
+RSP = PARENT_REGISTERS.index("rsp")
+RBP = PARENT_REGISTERS.index("rbp")
+
+# 64-bit registers hold signed 64-bit values, the same a 64-bit load from
+# memory gives back
+INT64_SIGN = 1 << 63
+UINT64_MASK = (1 << 64) - 1
+
+# Register name -> (slot, bits)
+REGISTERS = {
+    "rax": (0, 64),
+    "rdi": (1, 64),
+    "rsi": (2, 64),
+    "rdx": (3, 64),
+    "rcx": (4, 64),
+    "r8": (5, 64),
+    "r9": (6, 64),
+    "rsp": (7, 64),
+    "rbp": (8, 64),
+    "eax": (0, 32),
+    "edi": (1, 32),
+    "esi": (2, 32),
+    "edx": (3, 32),
+    "ecx": (4, 32),
+    "r8d": (5, 32),
+    "r9d": (6, 32),
+    "ax": (0, 16),
+    "di": (1, 16),
+    "si": (2, 16),
+    "dx": (3, 16),
+    "cx": (4, 16),
+    "r8w": (5, 16),
+    "r9w": (6, 16),
+    "al": (0, 8),
+    "dil": (1, 8),
+    "sil": (2, 8),
+    "dl": (3, 8),
+    "cl": (4, 8),
+    "r8b": (5, 8),
+    "r9b": (6, 8),
+}
+
+
+def to_int64(value):
+    return ((value + INT64_SIGN) & UINT64_MASK) - INT64_SIGN
+
+
+class RegisterFile:
+    __slots__ = ["values", "widths"]
+
+    def __init__(self):
+        self.values = [None] * len(PARENT_REGISTERS)
+        self.values[RSP] = 0
+        self.values[RBP] = 0
+
+        # 32 after a 32-bit write, 64 after a 64-bit one. Narrower writes keep
+        # the upper bits and leave it alone.
+        self.widths = [64] * len(PARENT_REGISTERS)
+
+    def read(self, slot, bits, signed=True):
+        value = self.values[slot]
+        if value == None:
+            return value
+
+        value &= (1 << bits) - 1
+        if signed and value >> (bits - 1):
+            value -= 1 << bits
+
+        return value
+
+    def write(self, slot, bits, value):
+        if bits == 32:
+            # 32-bit writes zero the upper half of the parent, like x86-64
+            self.values[slot] = value & 0xFFFFFFFF
+            self.widths[slot] = 32
+        else:
+            mask = (1 << bits) - 1
+            current_value = self.values[slot]
+            current_value = 0 if current_value == None else current_value
+            self.values[slot] = (current_value & ~mask) | (value & mask)
+
+    def result(self, slot):
+        # What the program left in the register, signed at the width it was
+        # last written with
+        return self.read(slot=slot, bits=self.widths[slot])
+
+    def snapshot(self):
+        return {
+            register: value
+            for register, value in zip(PARENT_REGISTERS, self.values)
+            if value != None
+        }
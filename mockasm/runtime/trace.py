@@ -0,0 +1,132 @@
+import struct
+
+# Steps between full copies of the machine state kept for reconstruction
+CHECKPOINT_INTERVAL = 1024
+
+STACK_WORD = struct.Struct("<q")
+
+
+def build_state(line_num, registers, flags, memory, globals_size, stack_top):
+    # memory holds every byte written so far, only the live ones are reported
+    rsp = registers["rsp"]
+
+    live_memory = {
+        address: byte
+        for address, byte in sorted(memory.items())
+        if byte != 0 and (address < globals_size or rsp <= address < stack_top)
+    }
+
+    stack = [
+        STACK_WORD.unpack(bytes(memory.get(address + i, 0) for i in range(8)))[0]
+        for address in range(stack_top - 8, rsp - 1, -8)
+    ]
+
+    return {
+        "line_num": line_num,
+        "flags": flags,
+        "registers": registers,
+        "memory": live_memory,
+        "stack": stack,
+    }
+
+
+class Trace:
+    def __init__(self, initial_state, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.__globals_size = initial_state["globals_size"]
+        self.__stack_top = initial_state["stack_top"]
+        self.__checkpoint_interval = checkpoint_interval
+
+        self.__deltas = []
+        self.__result = None
+
+        # State after the latest appended step
+        self.__registers = dict(initial_state["registers"])
+        self.__flags = dict(initial_state["flags"])
+        self.__memory = dict(initial_state["memory"])
+
+        self.__initial_checkpoint = self.__take_checkpoint()
+        self.__checkpoints = []
+
+    def __len__(self):
+        return len(self.__deltas)
+
+    @property
+    def deltas(self):
+        return self.__deltas
+
+    @property
+    def result(self):
+        return self.__result
+
+    @result.setter
+    def result(self, result):
+        self.__result = result
+
+    def __take_checkpoint(self):
+        return (dict(self.__registers), dict(self.__flags), dict(self.__memory))
+
+    def __apply_delta(self, delta, registers, flags, memory):
+        if "registers" in delta.keys():
+            registers.update(delta["registers"])
+        if "flags" in delta.keys():
+            flags.clear()
+            flags.update(delta["flags"])
+        if "memory" in delta.keys():
+            memory.update(delta["memory"])
+
+    def append(self, delta):
+        self.__apply_delta(
+            delta=delta,
+            registers=self.__registers,
+            flags=self.__flags,
+            memory=self.__memory,
+        )
+        self.__deltas.append(delta)
+
+        if len(self.__deltas) % self.__checkpoint_interval == 0:
+            self.__checkpoints.append(self.__take_checkpoint())
+
+    def state_at(self, step):
+        if step < 0:
+            step += len(self.__deltas)
+        if step < 0 or step >= len(self.__deltas):
+            raise IndexError(f"Step {step} is outside the trace")
+
+        # Replay from the closest checkpoint at or before the step
+        checkpoint_idx = (step + 1) // self.__checkpoint_interval
+        if checkpoint_idx == 0:
+            checkpoint = self.__initial_checkpoint
+        else:
+            checkpoint = self.__checkpoints[checkpoint_idx - 1]
+
+        registers, flags, memory = (dict(part) for part in checkpoint)
+        for delta in self.__deltas[
+            checkpoint_idx * self.__checkpoint_interval : step + 1
+        ]:
+            self.__apply_delta(
+                delta=delta, registers=registers, flags=flags, memory=memory
+            )
+
+        return build_state(
+            line_num=self.__deltas[step]["line_num"],
+            registers=registers,
+            flags=flags,
+            memory=memory,
+            globals_size=self.__globals_size,
+            stack_top=self.__stack_top,
+        )
+
+
+def record(vm_obj, mode="table", checkpoint_interval=CHECKPOINT_INTERVAL):
+    execution = vm_obj.execute(yield_execution=True, mode=mode, yield_deltas=True)
+
+    trace_obj = Trace(
+        initial_state=next(execution), checkpoint_interval=checkpoint_interval
+    )
+    for delta in execution:
+        if type(delta) == dict:
+            trace_obj.append(delta=delta)
+        else:
+            trace_obj.result = delta
+
+    return trace_obj
@@ -0,0 +1,328 @@
+import mmap
+import os
+import struct
+
+from . import registers
+from . import trace
+from ..utils import error_utils
+
+MAGIC = b"MKTR"
+VERSION = 1
+
+FLAGS = ["zero", "negative", "positive"]
+
+# Marks a step that did not write memory
+NO_MEMORY_WRITE = 0xFFFFFFFF
+
+MASK_64 = (1 << 64) - 1
+SIGN_64 = 1 << 63
+
+# magic, version, registers per checkpoint, checkpoint interval, number of
+# steps, globals size, stack top, result, has result, then the offsets of the
+# register table, memory table, checkpoint index and checkpoint memory
+HEADER = struct.Struct("<4sHHIQQQqBQQQQ")
+
+# line number, flags, first register change, register change count, memory
+# write (an index into the memory table or NO_MEMORY_WRITE)
+STEP = struct.Struct("<IBIBI")
+
+# register slot, value
+REGISTER_ENTRY = struct.Struct("<Bq")
+
+# address, number of bytes, bytes padded to 8
+MEMORY_ENTRY = struct.Struct("<QB8s")
+
+# registers set mask, register values, first memory entry, memory entry count
+CHECKPOINT = struct.Struct(f"<H{len(registers.PARENT_REGISTERS)}qQI")
+
+# address, byte
+CHECKPOINT_MEMORY_ENTRY = struct.Struct("<QB")
+
+REGISTER_SLOTS = {
+    register: slot for slot, register in enumerate(registers.PARENT_REGISTERS)
+}
+
+
+def to_int64(value):
+    # Registers are stored as 64-bit two's complement, like the machine holds them
+    return ((value & MASK_64) ^ SIGN_64) - SIGN_64
+
+
+def encode_flags(flags):
+    return sum(1 << idx for idx, flag in enumerate(FLAGS) if flags[flag])
+
+
+def decode_flags(flags):
+    return {flag: (flags >> idx) & 1 for idx, flag in enumerate(FLAGS)}
+
+
+class TraceWriter:
+    def __init__(self, trace_file, initial_state, checkpoint_interval):
+        self.__trace_file = trace_file
+        self.__checkpoint_interval = checkpoint_interval
+        self.__globals_size = initial_state["globals_size"]
+        self.__stack_top = initial_state["stack_top"]
+
+        # Steps are streamed to the file, the side tables are small enough to
+        # be buffered until the end
+        self.__num_steps = 0
+        self.__register_table = bytearray()
+        self.__num_register_entries = 0
+        self.__memory_table = bytearray()
+        self.__num_memory_entries = 0
+        self.__checkpoint_index = bytearray()
+        self.__checkpoint_memory = bytearray()
+        self.__num_checkpoint_memory_entries = 0
+
+        self.__registers = dict(initial_state["registers"])
+        self.__flags = dict(initial_state["flags"])
+        self.__memory = dict(initial_state["memory"])
+
+        self.__trace_file.seek(HEADER.size)
+        self.__write_checkpoint()
+
+    def __write_checkpoint(self):
+        registers_set = 0
+        values = []
+        for slot, register in enumerate(registers.PARENT_REGISTERS):
+            value = self.__registers.get(register, None)
+            if value != None:
+                registers_set |= 1 << slot
+            values.append(0 if value == None else to_int64(value=value))
+
+        memory = [(address, byte) for address, byte in self.__memory.items() if byte]
+        for address, byte in sorted(memory):
+            self.__checkpoint_memory += CHECKPOINT_MEMORY_ENTRY.pack(address, byte)
+
+        self.__checkpoint_index += CHECKPOINT.pack(
+            registers_set,
+            *values,
+            self.__num_checkpoint_memory_entries,
+            len(memory),
+        )
+        self.__num_checkpoint_memory_entries += len(memory)
+
+    def append(self, delta):
+        register_start = self.__num_register_entries
+        changed_registers = delta.get("registers", {})
+        for register, value in changed_registers.items():
+            self.__register_table += REGISTER_ENTRY.pack(
+                REGISTER_SLOTS[register], to_int64(value=value)
+            )
+        self.__num_register_entries += len(changed_registers)
+        self.__registers.update(changed_registers)
+
+        if "flags" in delta.keys():
+            self.__flags = dict(delta["flags"])
+
+        memory_idx = NO_MEMORY_WRITE
+        if "memory" in delta.keys():
+            written = delta["memory"]
+            address = min(written.keys())
+            self.__memory_table += MEMORY_ENTRY.pack(
+                address,
+                len(written),
+                bytes(written[address + i] for i in range(len(written))),
+            )
+            memory_idx = self.__num_memory_entries
+            self.__num_memory_entries += 1
+            self.__memory.update(written)
+
+        self.__trace_file.write(
+            STEP.pack(
+                delta["line_num"],
+                encode_flags(flags=self.__flags),
+                register_start,
+                len(changed_registers),
+                memory_idx,
+            )
+        )
+        self.__num_steps += 1
+
+        if self.__num_steps % self.__checkpoint_interval == 0:
+            self.__write_checkpoint()
+
+    def close(self, result):
+        registers_offset = HEADER.size + self.__num_steps * STEP.size
+        memory_offset = registers_offset + len(self.__register_table)
+        checkpoints_offset = memory_offset + len(self.__memory_table)
+        checkpoint_memory_offset = checkpoints_offset + len(self.__checkpoint_index)
+
+        for table in [
+            self.__register_table,
+            self.__memory_table,
+            self.__checkpoint_index,
+            self.__checkpoint_memory,
+        ]:
+            self.__trace_file.write(table)
+
+        self.__trace_file.seek(0)
+        self.__trace_file.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                len(registers.PARENT_REGISTERS),
+                self.__checkpoint_interval,
+                self.__num_steps,
+                self.__globals_size,
+                self.__stack_top,
+                0 if result == None else to_int64(value=result),
+                result != None,
+                registers_offset,
+                memory_offset,
+                checkpoints_offset,
+                checkpoint_memory_offset,
+            )
+        )
+
+
+def write(
+    path,
+    vm_obj,
+    mode="table",
+    show_exec_opcodes=False,
+    checkpoint_interval=trace.CHECKPOINT_INTERVAL,
+):
+    execution = vm_obj.execute(
+        yield_execution=True,
+        show_exec_opcodes=show_exec_opcodes,
+        mode=mode,
+        yield_deltas=True,
+    )
+
+    with open(path, "wb") as trace_file:
+        writer = TraceWriter(
+            trace_file=trace_file,
+            initial_state=next(execution),
+            checkpoint_interval=checkpoint_interval,
+        )
+
+        result = None
+        for delta in execution:
+            if type(delta) == dict:
+                writer.append(delta=delta)
+            else:
+                result = delta
+
+        writer.close(result=result)
+
+    return result
+
+
+class TraceReader:
+    def __init__(self, path):
+        with open(path, "rb") as trace_file:
+            if os.fstat(trace_file.fileno()).st_size < HEADER.size:
+                error_utils.error(msg=f"'{path}' is not a mockasm trace")
+
+            self.__data = mmap.mmap(trace_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.__data[:4] != MAGIC:
+            self.__data.close()
+            error_utils.error(msg=f"'{path}' is not a mockasm trace")
+
+        (
+            _,
+            version,
+            num_registers,
+            self.__checkpoint_interval,
+            self.__num_steps,
+            self.__globals_size,
+            self.__stack_top,
+            result,
+            has_result,
+            self.__registers_offset,
+            self.__memory_offset,
+            self.__checkpoints_offset,
+            self.__checkpoint_memory_offset,
+        ) = HEADER.unpack_from(self.__data, 0)
+
+        if version != VERSION or num_registers != len(registers.PARENT_REGISTERS):
+            self.__data.close()
+            error_utils.error(msg=f"Unsupported trace version {version} in '{path}'")
+
+        self.__result = result if has_result else None
+
+    def __len__(self):
+        return self.__num_steps
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def result(self):
+        return self.__result
+
+    def close(self):
+        self.__data.close()
+
+    def __read_checkpoint(self, checkpoint_idx):
+        (registers_set, *values, memory_start, memory_count) = (
+            CHECKPOINT.unpack_from(
+                self.__data, self.__checkpoints_offset + checkpoint_idx * CHECKPOINT.size
+            )
+        )
+
+        checkpoint_registers = {
+            register: values[slot]
+            for slot, register in enumerate(registers.PARENT_REGISTERS)
+            if registers_set >> slot & 1
+        }
+
+        memory = {}
+        offset = (
+            self.__checkpoint_memory_offset
+            + memory_start * CHECKPOINT_MEMORY_ENTRY.size
+        )
+        for address, byte in CHECKPOINT_MEMORY_ENTRY.iter_unpack(
+            self.__data[offset : offset + memory_count * CHECKPOINT_MEMORY_ENTRY.size]
+        ):
+            memory[address] = byte
+
+        return checkpoint_registers, memory
+
+    def __read_step(self, step):
+        return STEP.unpack_from(self.__data, HEADER.size + step * STEP.size)
+
+    def state_at(self, step):
+        if step < 0:
+            step += self.__num_steps
+        if step < 0 or step >= self.__num_steps:
+            raise IndexError(f"Step {step} is outside the trace")
+
+        # Only the steps since the closest checkpoint are read, every step
+        # record holds the full flags
+        checkpoint_idx = (step + 1) // self.__checkpoint_interval
+        step_registers, memory = self.__read_checkpoint(checkpoint_idx=checkpoint_idx)
+
+        for idx in range(checkpoint_idx * self.__checkpoint_interval, step + 1):
+            _, _, register_start, register_count, memory_idx = self.__read_step(
+                step=idx
+            )
+
+            offset = self.__registers_offset + register_start * REGISTER_ENTRY.size
+            for slot, value in REGISTER_ENTRY.iter_unpack(
+                self.__data[offset : offset + register_count * REGISTER_ENTRY.size]
+            ):
+                step_registers[registers.PARENT_REGISTERS[slot]] = value
+
+            if memory_idx != NO_MEMORY_WRITE:
+                address, num_bytes, data = MEMORY_ENTRY.unpack_from(
+                    self.__data, self.__memory_offset + memory_idx * MEMORY_ENTRY.size
+                )
+                for i in range(num_bytes):
+                    memory[address + i] = data[i]
+
+        line_num, flags, _, _, _ = self.__read_step(step=step)
+
+        return trace.build_state(
+            line_num=line_num,
+            registers=step_registers,
+            flags=decode_flags(flags=flags),
+            memory=memory,
+            globals_size=self.__globals_size,
+            stack_top=self.__stack_top,
+        )
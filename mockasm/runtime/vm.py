@@ -1,64 +1,217 @@
-import collections
-
-from mockasm.parser import opcode
+import time
+
+from . import block_compiler
+from . import breakpoints
+from . import decoder
+from . import flags
+from . import fusion
+from . import limits
+from . import memory
+from . import profiler
+from . import registers
 from ..utils import error_utils
 
+# on_step, on_call, on_ret and on_branch callbacks get
+# (vm, instruction, pc, next_pc), on_mem_write callbacks get
+# (vm, instruction, pc, address, bits, value). A step callback returning True
+# pauses the run, resume() continues it.
+HOOK_EVENTS = ["on_step", "on_call", "on_ret", "on_mem_write", "on_branch"]
+
+# Opcodes whose handlers are wrapped when a hook for the event is registered
+HOOKED_OP_CODES = {
+    "on_call": ["call"],
+    "on_ret": ["ret"],
+    "on_mem_write": ["push", "mov", "movzb", "movsbq", "movsxd", "movswq"],
+    "on_branch": ["jmp", "je"],
+}
+
+
+# Modes that run several instructions per dispatch
+BATCHED_MODES = ["fused", "compiled"]
+
 
 class VM:
-    def __init__(self, opcodes):
+    def __init__(self, opcodes, profile=False):
         self.__opcodes = opcodes
+
+        decoder_obj = decoder.Decoder(opcodes=opcodes)
+        self.__instructions = decoder_obj.decode()
+        self.__symbol_table = decoder_obj.symbol_table
+        self.__globals_size = decoder_obj.globals_size
+
         self.__current_opcode_ptr = 0
-        self.__register_tuple = collections.namedtuple(
-            "register", ["value", "num_bytes"]
+        self.__is_halted = False
+        self.__num_steps = 0
+
+        self.__profile = (
+            profiler.Profile(
+                instructions=self.__instructions, symbol_table=self.__symbol_table
+            )
+            if profile
+            else None
         )
 
+        self.__hooks = {event: [] for event in HOOK_EVENTS}
+
+        # Breakpoints and watchpoints by id, the instructions with breakpoint
+        # traps patched in are rebuilt when they change
+        self.__breakpoints = {}
+        self.__next_breakpoint_id = 0
+        self.__trapped_instructions = None
+        self.__stop = None
+
+        # Built on the first run in fused or compiled mode
+        self.__fused_instructions = None
+        self.__block_compiler = None
+        self.__blocks = None
+        self.__block_heat = None
+
         self.__clear_registers()
+        self.__build_dispatch_tables()
 
-    def __clear_flags(self):
-        self.__flags = {
-            "zero": 0,
-            "negative": 0,
-            "positive": 0,
-        }
+    @property
+    def memory_size(self):
+        return self.__memory.size
 
-    def __clear_registers(self):
-        self.__registers = {
-            "rax": self.__register_tuple(value=None, num_bytes=64),
-            "rdi": self.__register_tuple(value=None, num_bytes=64),
-            "rsi": self.__register_tuple(value=None, num_bytes=64),
-            "rdx": self.__register_tuple(value=None, num_bytes=64),
-            "rcx": self.__register_tuple(value=None, num_bytes=64),
-            "r8": self.__register_tuple(value=None, num_bytes=64),
-            "r9": self.__register_tuple(value=None, num_bytes=64),
-            "rsp": self.__register_tuple(value=0, num_bytes=64),
-            "rbp": self.__register_tuple(value=0, num_bytes=64),
-            "ax": self.__register_tuple(value=None, num_bytes=16),
-            "di": self.__register_tuple(value=None, num_bytes=16),
-            "si": self.__register_tuple(value=None, num_bytes=16),
-            "dx": self.__register_tuple(value=None, num_bytes=16),
-            "cx": self.__register_tuple(value=None, num_bytes=16),
-            "r8w": self.__register_tuple(value=None, num_bytes=16),
-            "r9w": self.__register_tuple(value=None, num_bytes=16),
-            "eax": self.__register_tuple(value=None, num_bytes=32),
-            "edi": self.__register_tuple(value=None, num_bytes=32),
-            "esi": self.__register_tuple(value=None, num_bytes=32),
-            "edx": self.__register_tuple(value=None, num_bytes=32),
-            "ecx": self.__register_tuple(value=None, num_bytes=32),
-            "r8d": self.__register_tuple(value=None, num_bytes=32),
-            "r9d": self.__register_tuple(value=None, num_bytes=32),
-            "al": self.__register_tuple(value=None, num_bytes=8),
-            "dil": self.__register_tuple(value=None, num_bytes=8),
-            "sil": self.__register_tuple(value=None, num_bytes=8),
-            "dl": self.__register_tuple(value=None, num_bytes=8),
-            "cl": self.__register_tuple(value=None, num_bytes=8),
-            "r8b": self.__register_tuple(value=None, num_bytes=8),
-            "r9b": self.__register_tuple(value=None, num_bytes=8),
-        }
+    @property
+    def num_steps(self):
+        return self.__num_steps
+
+    @property
+    def profile(self):
+        return self.__profile
+
+    @property
+    def is_halted(self):
+        return self.__is_halted
+
+    @property
+    def stop(self):
+        # Why the last run stopped early, None when it ran to the end
+        return self.__stop
+
+    @property
+    def pc(self):
+        return self.__current_opcode_ptr
+
+    @property
+    def call_depth(self):
+        return len(self.__call_stack)
+
+    def add_hook(self, event, callback):
+        if event not in self.__hooks.keys():
+            error_utils.error(msg=f"Unknown hook '{event}'")
+
+        self.__hooks[event].append(callback)
+
+    def remove_hook(self, event, callback):
+        if event not in self.__hooks.keys():
+            error_utils.error(msg=f"Unknown hook '{event}'")
+
+        self.__hooks[event].remove(callback)
+
+    def __add_stop_condition(self, stop_condition):
+        breakpoint_id = self.__next_breakpoint_id
+        self.__next_breakpoint_id += 1
+
+        self.__breakpoints[breakpoint_id] = stop_condition
+        self.__trapped_instructions = None
+
+        return breakpoint_id
 
-        self.__clear_flags()
+    def add_breakpoint(self, line=None, label=None, condition=None):
+        if (line == None) == (label == None):
+            error_utils.error(msg="A breakpoint needs either a line or a label")
 
-        self.__stack = []
-        self.__memory = {}
+        # Jumps and calls continue after the label they target, so stopping at
+        # a label means stopping in front of the instruction following it
+        if label != None:
+            label_idx = self.find_label(label=label)
+            if label_idx == None:
+                error_utils.error(msg=f"Unknown label '{label}'")
+
+            pcs = [label_idx + 1]
+        else:
+            pcs = [
+                pc + 1 if instruction.op_code == "label" else pc
+                for pc, instruction in enumerate(self.__instructions)
+                if instruction.line_num == line
+            ]
+            if len(pcs) == 0:
+                error_utils.error(msg=f"No instruction at Line {line}")
+
+        return self.__add_stop_condition(
+            stop_condition=breakpoints.Breakpoint(
+                pcs=[pc for pc in pcs if pc < len(self.__instructions)],
+                condition=None
+                if condition == None
+                else breakpoints.Condition(expression=condition),
+            )
+        )
+
+    def add_watchpoint(self, register=None, address=None, bits=64):
+        if (register == None) == (address == None):
+            error_utils.error(msg="A watchpoint needs either a register or an address")
+
+        if register != None and register not in registers.REGISTERS.keys():
+            error_utils.error(msg=f"Unknown register '{register}'")
+        if address != None and (
+            type(bits) != int
+            or bits not in memory.STORE_FORMATS.keys()
+            or type(address) != int
+            or address < 0
+            or address + (bits >> 3) > self.__memory.max_size
+        ):
+            error_utils.error(msg=f"Cannot watch {bits} bits at address {address}")
+
+        return self.__add_stop_condition(
+            stop_condition=breakpoints.Watchpoint(
+                register=None if register == None else registers.REGISTERS[register],
+                address=address,
+                bits=bits,
+            )
+        )
+
+    def remove_breakpoint(self, breakpoint_id):
+        if breakpoint_id not in self.__breakpoints.keys():
+            error_utils.error(msg=f"Unknown breakpoint {breakpoint_id}")
+
+        del self.__breakpoints[breakpoint_id]
+        self.__trapped_instructions = None
+
+    def __flag_bits(self):
+        result, bits = self.__flag_state
+        if result != None:
+            bits |= flags.result_bits(result=result)
+
+        return bits
+
+    def __take_flags(self):
+        # Flag bits of every compare since the flags were last cleared, which
+        # clears them
+        flag_state = self.__flag_state
+        result, bits = flag_state
+        flag_state[0] = None
+        flag_state[1] = 0
+
+        if result == None:
+            return bits
+
+        return bits | flags.result_bits(result=result)
+
+    def __clear_registers(self):
+        self.__registers = registers.RegisterFile()
+        self.__register_values = self.__registers.values
+        self.__register_widths = self.__registers.widths
+
+        # Flags are only worked out when something reads them: the result of
+        # the last compare that has not been read yet, and the flag bits of
+        # the compares before it
+        self.__flag_state = [None, 0]
+
+        self.__memory = memory.Memory(globals_size=self.__globals_size)
+        self.__register_values[registers.RSP] = self.__memory.stack_top
+        self.__register_values[registers.RBP] = self.__memory.stack_top
         self.__call_stack = []
 
     def __increment_opcode_ptr(self):
@@ -74,237 +227,153 @@ class VM:
             else self.__opcodes[pos]
         )
 
-    def __find_opcode_idx(self, op):
-        for i, opcode in enumerate(self.__opcodes):
-            if op == opcode:
-                return i
+    def find_label(self, label):
+        return self.__symbol_table.get(label, None)
 
-        return None
+    def __read_register(self, operand, signed=True):
+        if operand.kind == decoder.REGISTER:
+            return self.__register_values[operand.register]
 
-    def __update_reg_value(self, register, value, op):
-        current_value = self.__registers[register].value
+        return self.__registers.read(
+            slot=operand.register, bits=operand.bits, signed=signed
+        )
 
-        if op == "add":
-            self.__registers[register] = self.__registers[register]._replace(
-                value=current_value + value
-            )
-        elif op == "sub":
-            self.__registers[register] = self.__registers[register]._replace(
-                value=current_value - value
-            )
-        elif op == "mul":
-            self.__registers[register] = self.__registers[register]._replace(
-                value=current_value * value
-            )
-        elif op == "assign":
-            self.__registers[register] = self.__registers[register]._replace(
-                value=value
-            )
+    def __write_register(self, operand, value):
+        if operand.kind == decoder.REGISTER:
+            self.__register_values[operand.register] = (
+                (value + registers.INT64_SIGN) & registers.UINT64_MASK
+            ) - registers.INT64_SIGN
+            self.__register_widths[operand.register] = 64
+        else:
+            self.__registers.write(slot=operand.register, bits=operand.bits, value=value)
 
-    def __parse_value(self, value, error_msg=None, map_to_higher_reg=False):
-        old_value = value
+    def __describe_operand(self, operand):
+        if operand.register != None:
+            return registers.PARENT_REGISTERS[operand.register]
 
-        if map_to_higher_reg:
-            register_mapping = {"al": "rax", "eax": "rax", "edi": "rdi", "esi": "rsi",
-                                "edx": "rdx", "ecx": "rcx", "r8d": "r8", "r9d": "r9"}
-            value = (
-                register_mapping[value] if value in register_mapping.keys() else value
+        return str(operand.value)
+
+    def __read_operand(self, operand, error_msg=None, bits=64, signed=True):
+        kind = operand.kind
+
+        if kind == decoder.IMMEDIATE:
+            value = operand.value
+        elif kind == decoder.REGISTER:
+            value = self.__register_values[operand.register]
+        elif kind == decoder.SUB_REGISTER:
+            value = self.__registers.read(
+                slot=operand.register, bits=operand.bits, signed=signed
+            )
+        elif kind in decoder.MEMORY_KINDS:
+            value = self.__memory.load(
+                address=self.__compute_operand_address(operand=operand),
+                bits=bits,
+                signed=signed,
             )
         else:
-            # Mandatory mapping
-            register_mapping = {"eax": "rax", "edi": "rdi"}
-            value = register_mapping[value] if value in register_mapping.keys() else value
-
-        if (
-            not value.startswith("_")
-            and value not in self.__registers.keys()
-            and "(" not in value
-        ):
-            value = int(value)
-        elif "(" in value:
-            index, register = value.split("(")
-            mem_location = int(self.__registers[register].value) + int(index)
-            value = self.__read_from_memory(mem_location=mem_location)
-        else:
-            if value.startswith("_"):
-                if value[1:].isdigit():
-                    value = self.__read_from_memory(mem_location=value)
-                else:
-                    value = self.__read_from_memory(
-                        mem_location=self.__registers[value[1:]].value
-                    )
-            else:
-                value = self.__registers[value].value
+            value = operand.value
 
         if value == None and error_msg != None:
-            error_utils.error(msg=error_msg.replace("{}", old_value))
+            error_utils.error(
+                msg=error_msg.replace("{}", self.__describe_operand(operand=operand))
+            )
         elif value == None and error_msg == None:
             value = -1
 
         return value
 
-    def __execute_push_to_stack(self, value):
-        value = self.__parse_value(
-            value=value,
-            error_msg="Register '{}' has not been set, you cannot push it to stack",
-        )
+    def __compute_operand_address(self, operand):
+        kind = operand.kind
 
-        self.__stack.append(value)
+        if kind == decoder.ADDRESS:
+            return self.__register_values[registers.RBP] - operand.value
+        elif kind == decoder.LOCATION_AT:
+            return self.__register_values[operand.register]
+        elif kind == decoder.RELATIVE_ADDRESS:
+            return self.__register_values[operand.register] + operand.value
 
-        self.__update_reg_value(register="rsp", value=8, op="add")
+        return operand.value
 
-    def __execute_pop_from_stack(self, register):
-        value = self.__stack.pop()
-        update_value = (
-            int(value)
-            if type(value) != int
-            and not value.startswith("_")
-            and not value.startswith("g_")
-            else value
+    def __execute_push_to_stack(self, instruction, pc):
+        value = self.__read_operand(
+            operand=instruction.src,
+            error_msg="Register '{}' has not been set, you cannot push it to stack",
         )
-        self.__update_reg_value(register=register, value=update_value, op="assign")
 
-        self.__update_reg_value(register="rsp", value=8, op="sub")
+        rsp = self.__register_values[registers.RSP] - 8
+        self.__memory.store(address=rsp, value=value, bits=64)
+        self.__register_values[registers.RSP] = rsp
 
-    def __compute_true_mem_loc(self, mem_location):
-        if type(mem_location) == int:
-            return mem_location
+        return pc + 1
 
-        mem_location = (
-            -1 * int(mem_location[1:]) + self.__registers["rbp"].value
-            if mem_location[1:].isdigit() and mem_location[0] == "_"
-            else mem_location
-        )
-        return (
-            int(mem_location)
-            if type(mem_location) == str and mem_location.isdigit()
-            else mem_location
-        )
+    def __execute_pop_from_stack(self, instruction, pc):
+        rsp = self.__register_values[registers.RSP]
+        value = self.__memory.load(address=rsp, bits=64)
+        self.__register_values[registers.RSP] = rsp + 8
 
-    def __store_in_memory(self, mem_location, value, bits):
-        mem_location = self.__compute_true_mem_loc(mem_location)
-
-        if type(value) == int and type(mem_location) == int and value > 0 and bits != 8:
-            value = bin(value)[2:]
-            value = "0" * (bits - len(value)) + value
-            value = [value[i * 8 : (i + 1) * 8] for i in range(bits // 8)]
-            value = [int(binary, 2) for binary in value]
-            value = value[::-1]
-            for i in range(bits // 8):
-                self.__memory[mem_location + i] = value[i]
-        else:
-            self.__memory[mem_location] = value
-
-    def __read_from_memory(self, mem_location):
-        mem_location = self.__compute_true_mem_loc(mem_location)
-        return self.__memory.get(mem_location, None)
-
-    def __execute_move_instruction(self, value, register):
-        bits = 64
-        if (
-            type(value) == str
-            and not value.isdigit()
-            and value != "r8"
-            and (value.endswith("8") or value == "al")
-        ):
-            value = value[:-1] if value != "al" else value
-            bits = 8
-        elif(
-            type(value) == str
-            and value in self.__registers.keys()
-            and self.__registers[value].num_bytes == 32
-        ):
-            bits = 32
-        elif(
-            type(value) == str
-            and value in self.__registers.keys()
-            and self.__registers[value].num_bytes == 16
-        ):
-            bits = 16
+        self.__write_register(operand=instruction.dst, value=value)
+
+        return pc + 1
 
-        map_to_higher_reg = (
-            True if "(" in register or register.startswith("_") else False
+    def __execute_move_instruction(self, instruction, pc):
+        # movzb zero-extends, everything else reads narrow values as signed
+        value = self.__read_operand(
+            operand=instruction.src,
+            bits=instruction.bits,
+            signed=instruction.op_code != "movzb",
         )
-        value = self.__parse_value(value=value, map_to_higher_reg=map_to_higher_reg)
 
-        if register.startswith("_"):
-            if register[1:].isdigit():
-                self.__store_in_memory(mem_location=register, value=value, bits=bits)
-            else:
-                self.__store_in_memory(
-                    mem_location=self.__registers[register[1:]].value,
-                    value=value,
-                    bits=bits,
-                )
-        elif "(" in register:
-            index, register = register.split("(")
-            mem_location = int(self.__registers[register].value) + int(index)
-            self.__store_in_memory(mem_location=mem_location, value=value, bits=bits)
+        dst = instruction.dst
+        if dst.kind == decoder.REGISTER or dst.kind == decoder.SUB_REGISTER:
+            self.__write_register(operand=dst, value=value)
         else:
-            if self.__get_opcode_from_pos().op_code == "movsbq" and value > 256:
-                value = int(bin(value)[-8:], 2)
-            self.__update_reg_value(register=register, value=value, op="assign")
+            self.__memory.store(
+                address=self.__compute_operand_address(operand=dst),
+                value=value,
+                bits=instruction.bits,
+            )
 
-    def __execute_return_instruction(self):
+        return pc + 1
+
+    def __execute_return_instruction(self, instruction, pc):
         if len(self.__call_stack) == 0:
-            for value in self.__registers.values():
-                if value.value != None:
-                    value = value.value
-                    if type(value) == str:
-                        value = value.replace("_", "")
-                        value = abs(int(value))
-                    print(value)
+            for slot, value in enumerate(self.__register_values):
+                if value != None:
+                    print(self.__printed_result(slot=slot))
                     break
-            return True
-        else:
-            self.__current_opcode_ptr = self.__call_stack.pop()
-            return False
 
-    def __execute_arithmetic_operation(self, value, register, operator):
-        if self.__registers[register].value == None and self.__registers[register].num_bytes != 32:
+            self.__is_halted = True
+            return len(self.__instructions)
+
+        return self.__call_stack.pop() + 1
+
+    def __printed_result(self, slot):
+        value = self.__registers.result(slot=slot)
+        if slot in [registers.RSP, registers.RBP]:
+            # Stack pointers used to count up from 0, print the bytes below the
+            # stack top like before
+            return self.__memory.stack_top - value
+
+        return value
+
+    def __execute_arithmetic_operation(self, instruction, pc):
+        operator = instruction.op_code
+        existing_reg_value = self.__read_register(operand=instruction.dst)
+
+        if existing_reg_value == None:
+            register = self.__describe_operand(operand=instruction.dst)
             error_utils.error(
                 msg=f"Register {register} does not have any value, set a value to perform arithmetic operation"
             )
 
-        value = self.__parse_value(
-            value=value,
+        value = self.__read_operand(
+            operand=instruction.src,
             error_msg="Register {} has not been set, you cannot perform "
             + operator
             + " operation",
         )
 
-        # Mandatory mapping
-        register_mapping = {"eax": "rax", "edi": "rdi"}
-        register = register_mapping[register] if register in register_mapping.keys() else register
-
         new_value = 0
-        existing_reg_value = self.__registers[register].value 
-
-        if (
-            type(existing_reg_value) == str
-            and existing_reg_value.startswith("g_")
-            and not existing_reg_value.startswith("g__")
-        ):
-            existing_reg_value = self.__read_from_memory(
-                mem_location=existing_reg_value
-            )
-
-        if type(value) == str and value.startswith("_"):
-            value = -1 * int(value[1:])
-
-        is_global_str_literal = (
-            True
-            if type(existing_reg_value) == str and existing_reg_value.startswith("g__")
-            else False
-        )
-        if is_global_str_literal:
-            value = str(value)
-
-        register_is_mem_loc = False
-        if type(existing_reg_value) == str and existing_reg_value.startswith("_"):
-            existing_reg_value = -1 * int(existing_reg_value[1:])
-            register_is_mem_loc = True
-
         if operator == "add":
             new_value = existing_reg_value + value
         elif operator == "sub":
@@ -314,220 +383,955 @@ class VM:
         elif operator == "idiv":
             new_value = existing_reg_value // value
 
-        new_value = new_value if not register_is_mem_loc else "_" + str(-1 * new_value)
-        self.__update_reg_value(register=register, value=new_value, op="assign")
+        self.__write_register(operand=instruction.dst, value=new_value)
+
+        return pc + 1
 
-    def __execute_unary_operation(self, register):
-        if self.__registers[register].value == None:
+    def __execute_unary_operation(self, instruction, pc):
+        value = self.__read_register(operand=instruction.dst)
+        if value == None:
+            register = self.__describe_operand(operand=instruction.dst)
             error_utils.error(
                 msg=f"Register '{register}' has not been set, cannot negate empty value"
             )
 
-        self.__update_reg_value(register=register, value=-1, op="mul")
+        self.__write_register(operand=instruction.dst, value=-1 * value)
 
-    def __execute_compare(self, src_register, dst_register):
-        src_value = self.__parse_value(
-            value=src_register,
+        return pc + 1
+
+    def __execute_compare(self, instruction, pc):
+        src_value = self.__read_operand(
+            operand=instruction.src,
             error_msg="Register '{}' has not been set, cannot use it in cmp",
         )
 
-        dst_value = self.__parse_value(
-            value=dst_register,
+        dst_value = self.__read_operand(
+            operand=instruction.dst,
             error_msg="Register '{}' has not been set, cannot use it in cmp",
         )
 
-        comparison_result = dst_value - src_value
+        # Flags of an earlier compare nothing has read yet still count
+        flag_state = self.__flag_state
+        if flag_state[0] != None:
+            flag_state[1] |= flags.result_bits(result=flag_state[0])
+        flag_state[0] = dst_value - src_value
+
+        return pc + 1
 
-        if comparison_result < 0:
-            self.__flags["negative"] = 1
-        elif comparison_result == 0:
-            self.__flags["zero"] = 1
-        elif comparison_result > 0:
-            self.__flags["positive"] = 1
+    def __execute_comparison_op(self, instruction, pc):
+        is_set = flags.CONDITIONS[instruction.op_code][self.__take_flags()]
+        self.__write_register(operand=instruction.dst, value=1 if is_set else 0)
 
-    def __execute_comparison_op(self, operator, register):
-        zero_flag_val = self.__flags["zero"]
-        negative_flag_val = self.__flags["negative"]
-        positive_flag_val = self.__flags["positive"]
+        return pc + 1
 
-        register = (
-            register[:-1]
-            if type(register) == str and register.endswith("8")
-            else register
+    def __execute_lea(self, instruction, pc):
+        self.__write_register(
+            operand=instruction.dst,
+            value=self.__compute_operand_address(operand=instruction.src),
         )
 
-        if operator == "sete":
-            if zero_flag_val == 1:
-                self.__update_reg_value(register=register, value=1, op="assign")
-            elif zero_flag_val == 0:
-                self.__update_reg_value(register=register, value=0, op="assign")
-        elif operator == "setne":
-            if zero_flag_val == 1:
-                self.__update_reg_value(register=register, value=0, op="assign")
-            elif zero_flag_val == 0:
-                self.__update_reg_value(register=register, value=1, op="assign")
-        elif operator == "setl":
-            if negative_flag_val == 1 and positive_flag_val == 0:
-                self.__update_reg_value(register=register, value=1, op="assign")
-            else:
-                self.__update_reg_value(register=register, value=0, op="assign")
-        elif operator == "setle":
-            if negative_flag_val == 1 and positive_flag_val == 0:
-                self.__update_reg_value(register=register, value=1, op="assign")
-            elif zero_flag_val == 1:
-                self.__update_reg_value(register=register, value=1, op="assign")
-            else:
-                self.__update_reg_value(register=register, value=0, op="assign")
+        return pc + 1
+
+    def __execute_jmp(self, instruction, pc):
+        return instruction.src + 1
+
+    def __execute_conditional_jump(self, instruction, pc):
+        if flags.CONDITIONS[instruction.op_code][self.__take_flags()]:
+            return instruction.src + 1
+
+        return pc + 1
 
-        self.__clear_flags()
+    def __execute_call(self, instruction, pc):
+        self.__call_stack.append(pc)
 
-    def __execute_lea(self, address, register):
-        self.__update_reg_value(
-            register=register, value=self.__compute_true_mem_loc(address), op="assign"
+        return instruction.src + 1
+
+    def __execute_nop(self, instruction, pc):
+        return pc + 1
+
+    def __read_compare_operands(self, compare):
+        # Immediates and set registers are read directly, anything else goes
+        # through __read_operand and its errors
+        src = compare.src
+        if src.kind == decoder.IMMEDIATE:
+            src_value = src.value
+        else:
+            src_value = self.__read_operand(
+                operand=src,
+                error_msg="Register '{}' has not been set, cannot use it in cmp",
+            )
+
+        dst = compare.dst
+        dst_value = (
+            self.__register_values[dst.register]
+            if dst.kind == decoder.REGISTER
+            else None
         )
+        if dst_value == None:
+            dst_value = self.__read_operand(
+                operand=dst,
+                error_msg="Register '{}' has not been set, cannot use it in cmp",
+            )
 
-    def __execute_jmp(self, jmp_idx):
-        self.__current_opcode_ptr = jmp_idx
+        return dst_value, src_value
+
+    def __execute_compare_set(self, instruction, pc):
+        # cmp, set<cc>, movzb without going through the flags in between
+        compare, set_op, extend = instruction.src
+
+        dst_value, src_value = self.__read_compare_operands(compare=compare)
+
+        # Flags left over from an earlier cmp still count
+        bits = self.__take_flags() | flags.result_bits(result=dst_value - src_value)
+
+        is_set = flags.CONDITIONS[set_op.op_code][bits]
+        self.__write_register(operand=set_op.dst, value=1 if is_set else 0)
+
+        self.__num_steps += 2
+        return self.__execute_move_instruction(instruction=extend, pc=pc + 2)
+
+    def __execute_compare_jump(self, instruction, pc):
+        compare, jump = instruction.src
+
+        dst_value, src_value = self.__read_compare_operands(compare=compare)
+
+        bits = self.__take_flags() | flags.result_bits(result=dst_value - src_value)
+
+        self.__num_steps += 1
+        return jump.src + 1 if flags.CONDITIONS[jump.op_code][bits] else pc + 2
+
+    def __execute_push_move_pop(self, instruction, pc):
+        push, move, pop = instruction.src
+
+        self.__execute_push_to_stack(instruction=push, pc=pc)
+        self.__execute_move_instruction(instruction=move, pc=pc + 1)
+        self.__execute_pop_from_stack(instruction=pop, pc=pc + 2)
+
+        self.__num_steps += 2
+        return pc + 3
+
+    def __dispatch_chain(self, instruction, pc):
+        if instruction.op_code in ["mov", "movzb", "movsbq", "movsxd", "movswq"]:
+            return self.__execute_move_instruction(instruction=instruction, pc=pc)
+        elif instruction.op_code == "ret":
+            return self.__execute_return_instruction(instruction=instruction, pc=pc)
+        elif instruction.op_code in ["add", "sub", "imul", "idiv"]:
+            return self.__execute_arithmetic_operation(instruction=instruction, pc=pc)
+        elif instruction.op_code == "neg":
+            return self.__execute_unary_operation(instruction=instruction, pc=pc)
+        elif instruction.op_code == "push":
+            return self.__execute_push_to_stack(instruction=instruction, pc=pc)
+        elif instruction.op_code == "pop":
+            return self.__execute_pop_from_stack(instruction=instruction, pc=pc)
+        elif instruction.op_code == "cmp":
+            return self.__execute_compare(instruction=instruction, pc=pc)
+        elif instruction.op_code in ["sete", "setne", "setl", "setle"]:
+            return self.__execute_comparison_op(instruction=instruction, pc=pc)
+        elif instruction.op_code == "lea":
+            return self.__execute_lea(instruction=instruction, pc=pc)
+        elif instruction.op_code == "jmp":
+            return self.__execute_jmp(instruction=instruction, pc=pc)
+        elif instruction.op_code == "je":
+            return self.__execute_conditional_jump(instruction=instruction, pc=pc)
+        elif instruction.op_code == "call":
+            return self.__execute_call(instruction=instruction, pc=pc)
+
+        return self.__execute_nop(instruction=instruction, pc=pc)
+
+    def __build_dispatch_tables(self):
+        handlers = {
+            "mov": self.__execute_move_instruction,
+            "movzb": self.__execute_move_instruction,
+            "movsbq": self.__execute_move_instruction,
+            "movsxd": self.__execute_move_instruction,
+            "movswq": self.__execute_move_instruction,
+            "ret": self.__execute_return_instruction,
+            "add": self.__execute_arithmetic_operation,
+            "sub": self.__execute_arithmetic_operation,
+            "imul": self.__execute_arithmetic_operation,
+            "idiv": self.__execute_arithmetic_operation,
+            "cqo": self.__execute_nop,
+            "cdq": self.__execute_nop,
+            "neg": self.__execute_unary_operation,
+            "push": self.__execute_push_to_stack,
+            "pop": self.__execute_pop_from_stack,
+            "cmp": self.__execute_compare,
+            "sete": self.__execute_comparison_op,
+            "setne": self.__execute_comparison_op,
+            "setl": self.__execute_comparison_op,
+            "setle": self.__execute_comparison_op,
+            "lea": self.__execute_lea,
+            "jmp": self.__execute_jmp,
+            "je": self.__execute_conditional_jump,
+            "label": self.__execute_nop,
+            "call": self.__execute_call,
+            "global": self.__execute_nop,
+            "byte": self.__execute_nop,
+        }
+
+        fused_handlers = {
+            "cmp_set_movzb": self.__execute_compare_set,
+            "push_mov_pop": self.__execute_push_move_pop,
+            "cmp_je": self.__execute_compare_jump,
+        }
 
-    def __execute_conditional_jump(self, jmp_idx, on):
-        if self.__flags[on]:
-            self.__current_opcode_ptr = jmp_idx
+        self.__execution_modes = {
+            "table": [handlers[op_code] for op_code in decoder.OP_CODES],
+            "loop": [self.__dispatch_chain] * len(decoder.OP_CODES),
+            "fused": [handlers[op_code] for op_code in decoder.OP_CODES]
+            + [fused_handlers[op_code] for op_code in fusion.FUSED_OP_CODES],
+            "compiled": [handlers[op_code] for op_code in decoder.OP_CODES],
+        }
+
+    def __notify_after(self, handler, callbacks):
+        def hooked_handler(instruction, pc):
+            next_pc = handler(instruction, pc)
+            for callback in callbacks:
+                callback(self, instruction, pc, next_pc)
+
+            return next_pc
+
+        return hooked_handler
+
+    def __notify_mem_write(self, handler, callbacks):
+        def hooked_handler(instruction, pc):
+            next_pc = handler(instruction, pc)
+
+            if instruction.op_code == "push":
+                address = self.__register_values[registers.RSP]
+                bits = 64
+            elif (
+                instruction.dst != None
+                and instruction.dst.kind in decoder.MEMORY_KINDS
+            ):
+                address = self.__compute_operand_address(operand=instruction.dst)
+                bits = instruction.bits
+            else:
+                return next_pc
+
+            value = self.__memory.load(address=address, bits=bits)
+            for callback in callbacks:
+                callback(self, instruction, pc, address, bits, value)
+
+            return next_pc
+
+        return hooked_handler
+
+    def __hook_handlers(self, handlers):
+        # Only the handlers of opcodes that raise a hooked event are wrapped, so
+        # every other instruction runs at full speed
+        handlers = list(handlers)
+        for event, op_codes in HOOKED_OP_CODES.items():
+            callbacks = list(self.__hooks[event])
+            if len(callbacks) == 0:
+                continue
+
+            for op_code in op_codes:
+                op_num = decoder.OP_NUMS[op_code]
+                if event == "on_mem_write":
+                    handlers[op_num] = self.__notify_mem_write(
+                        handler=handlers[op_num], callbacks=callbacks
+                    )
+                else:
+                    handlers[op_num] = self.__notify_after(
+                        handler=handlers[op_num], callbacks=callbacks
+                    )
 
-        self.__clear_flags()
+        return handlers
 
-    def __execute_call(self, label):
-        label_opcode = opcode.OpCode(
-            op_code="label", op_value=label.split(".")[-1], line_num=1
+    def __make_stop(self, reason, breakpoint_id, pc):
+        return breakpoints.Stop(
+            reason=reason,
+            breakpoint_id=breakpoint_id,
+            pc=pc,
+            line_num=self.__instructions[pc].line_num
+            if pc < len(self.__instructions)
+            else None,
         )
-        label_opcode_idx = None
 
-        label_opcode_idx = self.__find_opcode_idx(op=label_opcode)
+    def __trap_instructions(self):
+        # Every instruction a breakpoint stops in front of is replaced by a trap
+        # holding it and the ids of its breakpoints, the rest run untouched
+        if self.__trapped_instructions == None:
+            instructions = list(self.__instructions)
+            for breakpoint_id, stop_condition in self.__breakpoints.items():
+                if type(stop_condition) != breakpoints.Breakpoint:
+                    continue
+
+                for pc in stop_condition.pcs:
+                    instruction = instructions[pc]
+                    if instruction.op_num != breakpoints.TRAP_OP_NUM:
+                        instruction = decoder.Instruction(
+                            op_code="trap",
+                            op_num=breakpoints.TRAP_OP_NUM,
+                            src=instruction,
+                            dst=(),
+                            bits=instruction.bits,
+                            line_num=instruction.line_num,
+                        )
+
+                    instructions[pc] = instruction._replace(
+                        dst=instruction.dst + (breakpoint_id,)
+                    )
 
-        if label_opcode_idx == None:
-            error_utils.error(
-                msg=f"Label .L.{label} not found, but used in call statement"
+            self.__trapped_instructions = instructions
+
+        return self.__trapped_instructions
+
+    def __trap(self, handlers):
+        def trap_handler(instruction, pc):
+            for breakpoint_id in instruction.dst:
+                condition = self.__breakpoints[breakpoint_id].condition
+                if condition == None or condition.evaluate(
+                    register_file=self.__registers
+                ):
+                    raise breakpoints.StopExecution(
+                        stop=self.__make_stop(
+                            reason=breakpoints.BREAKPOINT,
+                            breakpoint_id=breakpoint_id,
+                            pc=pc,
+                        ),
+                        num_steps=0,
+                    )
+
+            original = instruction.src
+            return handlers[original.op_num](original, pc)
+
+        return trap_handler
+
+    def __watched_value(self, watchpoint):
+        if watchpoint.register == None:
+            return self.__memory.load(address=watchpoint.address, bits=watchpoint.bits)
+
+        slot, bits = watchpoint.register
+        if bits == 64:
+            return self.__register_values[slot]
+
+        return self.__registers.read(slot=slot, bits=bits)
+
+    def __watch(self, handler, watchpoints):
+        def watched_handler(instruction, pc):
+            values = [
+                self.__watched_value(watchpoint=watchpoint)
+                for _, watchpoint in watchpoints
+            ]
+            next_pc = handler(instruction, pc)
+
+            for (breakpoint_id, watchpoint), value in zip(watchpoints, values):
+                if self.__watched_value(watchpoint=watchpoint) != value:
+                    raise breakpoints.StopExecution(
+                        stop=self.__make_stop(
+                            reason=breakpoints.WATCHPOINT,
+                            breakpoint_id=breakpoint_id,
+                            pc=next_pc,
+                        ),
+                        num_steps=1,
+                    )
+
+            return next_pc
+
+        return watched_handler
+
+    def __stop_on_return(self, handler, stop_depth):
+        def returning_handler(instruction, pc):
+            next_pc = handler(instruction, pc)
+            if not self.__is_halted and len(self.__call_stack) <= stop_depth:
+                raise breakpoints.StopExecution(
+                    stop=self.__make_stop(
+                        reason=breakpoints.RETURN, breakpoint_id=None, pc=next_pc
+                    ),
+                    num_steps=1,
+                )
+
+            return next_pc
+
+        return returning_handler
+
+    def __stop_handlers(self, handlers, stop_depth, ignore_breakpoints):
+        # Like hooks, only the handlers of opcodes that can trigger a stop are
+        # wrapped, breakpoints cost nothing until their trap is reached
+        handlers = list(handlers)
+
+        watchpoints = [
+            (breakpoint_id, stop_condition)
+            for breakpoint_id, stop_condition in self.__breakpoints.items()
+            if type(stop_condition) == breakpoints.Watchpoint
+        ]
+        if ignore_breakpoints:
+            watchpoints = []
+
+        for op_num, op_code in enumerate(decoder.OP_CODES):
+            watched = [
+                (breakpoint_id, watchpoint)
+                for breakpoint_id, watchpoint in watchpoints
+                if (
+                    watchpoint.register != None
+                    and op_code in breakpoints.REGISTER_WRITE_OP_CODES
+                )
+                or (
+                    watchpoint.address != None
+                    and op_code in breakpoints.MEMORY_WRITE_OP_CODES
+                )
+            ]
+            if len(watched) > 0:
+                handlers[op_num] = self.__watch(
+                    handler=handlers[op_num], watchpoints=watched
+                )
+
+        if stop_depth != None:
+            op_num = decoder.OP_NUMS["ret"]
+            handlers[op_num] = self.__stop_on_return(
+                handler=handlers[op_num], stop_depth=stop_depth
             )
 
-        self.__call_stack.append(self.__current_opcode_ptr)
-        self.__current_opcode_ptr = label_opcode_idx
+        return handlers + [self.__trap(handlers=handlers)]
 
-    def __execute_global_var(self, global_var_name):
-        self.__store_in_memory(mem_location=global_var_name, value=0, bits=64)
+    def __load_globals(self, show_exec_opcodes):
+        for instruction in self.__instructions:
+            if instruction.op_code == "byte":
+                self.__memory.store(
+                    address=instruction.dst, value=instruction.src, bits=8
+                )
 
-    def execute(self, yield_execution=False, show_exec_opcodes=False):
-        current_global_var = None
-        current_global_val_idx = 0
         while not self.__is_opcode_list_end():
             op_code = self.__get_opcode_from_pos()
+            if op_code.op_code not in ["global", "byte"]:
+                break
 
             if show_exec_opcodes:
                 print(op_code)
 
-            if op_code.op_code == "global":
-                global_var_name = op_code.op_value
-                current_global_var = global_var_name
-                current_global_val_idx = 0
-                self.__execute_global_var(global_var_name=global_var_name)
-                self.__increment_opcode_ptr()
-            elif op_code.op_code == "byte":
-                value = int(op_code.op_value)
-                value = 256 - abs(value) if value < 0 else value
-                self.__store_in_memory(
-                    mem_location=current_global_var + str(current_global_val_idx),
-                    value=value,
-                    bits=8,
-                )
-                current_global_val_idx += 1
-                self.__increment_opcode_ptr()
+            self.__increment_opcode_ptr()
+
+    def __is_limited(self, limits_obj, pc):
+        reason = limits_obj.exceeded()
+        if reason == None:
+            return False
+
+        self.__stop = self.__make_stop(reason=reason, breakpoint_id=None, pc=pc)
+        return True
+
+    def __run(self, handlers, instructions, limits_obj=None):
+        num_instructions = len(instructions)
+
+        pc = self.__current_opcode_ptr
+        num_steps = 0
+        try:
+            if limits_obj == None:
+                while pc < num_instructions:
+                    instruction = instructions[pc]
+                    pc = handlers[instruction.op_num](instruction, pc)
+                    num_steps += 1
             else:
+                # Limits are only looked at between chunks of steps
+                while pc < num_instructions and not self.__is_limited(
+                    limits_obj=limits_obj, pc=pc
+                ):
+                    chunk_end = num_steps + limits.CHECK_INTERVAL
+                    while pc < num_instructions and num_steps < chunk_end:
+                        instruction = instructions[pc]
+                        pc = handlers[instruction.op_num](instruction, pc)
+                        num_steps += 1
+        finally:
+            # Also kept when a handler raises or the run is interrupted. Fused
+            # handlers add the steps they run beyond the first themselves.
+            self.__current_opcode_ptr = pc
+            self.__num_steps += num_steps
+
+    def __run_compiled(self, handlers, limits_obj=None):
+        # Blocks that have been reached often enough run as compiled Python
+        # functions, everything else is interpreted one instruction at a time
+        instructions = self.__instructions
+        num_instructions = len(instructions)
+
+        if self.__block_compiler == None:
+            self.__block_compiler = block_compiler.BlockCompiler(
+                instructions=instructions
+            )
+            self.__blocks = [None] * num_instructions
+            self.__block_heat = [0] * num_instructions
+
+        compiler = self.__block_compiler
+        blocks = self.__blocks
+        heat = self.__block_heat
+        register_values = self.__register_values
+        memory_obj = self.__memory
+
+        # Limits are looked at every CHECK_INTERVAL steps, rounded up to the
+        # end of a block, without any the run is a single chunk
+        chunk_end = float("inf") if limits_obj == None else 0
+
+        pc = self.__current_opcode_ptr
+        num_steps = 0
+        try:
+            while pc < num_instructions:
+                if num_steps >= chunk_end:
+                    if self.__is_limited(limits_obj=limits_obj, pc=pc):
+                        break
+
+                    chunk_end = num_steps + limits.CHECK_INTERVAL
+
+                block = blocks[pc]
+                if block != None:
+                    next_pc = block[0](
+                        register_values,
+                        self.__register_widths,
+                        memory_obj,
+                        self.__flag_state,
+                        self.__call_stack,
+                    )
+
+                    # None when a register the block reads is not set yet
+                    if next_pc != None:
+                        pc = next_pc
+                        num_steps += block[1]
+                        continue
+                else:
+                    heat[pc] += 1
+                    if heat[pc] == block_compiler.HOT_THRESHOLD:
+                        blocks[pc] = compiler.compile_block(start=pc)
+                        if blocks[pc] != None:
+                            continue
+
+                instruction = instructions[pc]
+                pc = handlers[instruction.op_num](instruction, pc)
+                num_steps += 1
+        finally:
+            self.__current_opcode_ptr = pc
+            self.__num_steps += num_steps
+
+    def __run_until_stop(
+        self,
+        handlers,
+        max_steps,
+        stop_depth,
+        ignore_breakpoints,
+        previous_stop,
+        limits_obj,
+    ):
+        instructions = self.__instructions
+        if not ignore_breakpoints and any(
+            type(stop_condition) == breakpoints.Breakpoint
+            for stop_condition in self.__breakpoints.values()
+        ):
+            instructions = self.__trap_instructions()
+
+        handlers = self.__stop_handlers(
+            handlers=handlers,
+            stop_depth=stop_depth,
+            ignore_breakpoints=ignore_breakpoints,
+        )
+
+        num_instructions = len(instructions)
+        max_steps = float("inf") if max_steps == None else max_steps
+
+        pc = self.__current_opcode_ptr
+        num_steps = 0
+        try:
+            # Resuming in front of the breakpoint the last run stopped at runs
+            # that instruction instead of stopping there again
+            if (
+                previous_stop != None
+                and previous_stop.reason == breakpoints.BREAKPOINT
+                and previous_stop.pc == pc
+                and pc < num_instructions
+                and max_steps > 0
+            ):
+                instruction = self.__instructions[pc]
+                pc = handlers[instruction.op_num](instruction, pc)
+                num_steps += 1
+
+            while pc < num_instructions and num_steps < max_steps:
+                if limits_obj != None and self.__is_limited(
+                    limits_obj=limits_obj, pc=pc
+                ):
+                    break
+
+                chunk_end = min(max_steps, num_steps + limits.CHECK_INTERVAL)
+                while pc < num_instructions and num_steps < chunk_end:
+                    instruction = instructions[pc]
+                    pc = handlers[instruction.op_num](instruction, pc)
+                    num_steps += 1
+
+            if pc < num_instructions and self.__stop == None:
+                self.__stop = self.__make_stop(
+                    reason=breakpoints.MAX_STEPS, breakpoint_id=None, pc=pc
+                )
+        except breakpoints.StopExecution as stop_execution:
+            self.__stop = stop_execution.stop
+            pc = stop_execution.stop.pc
+            num_steps += stop_execution.num_steps
+        finally:
+            self.__current_opcode_ptr = pc
+            self.__num_steps += num_steps
+
+    def __run_profiled(self, handlers, show_exec_opcodes):
+        # Same as __run, but times every instruction and charges it to the
+        # function on top of the call stack
+        instructions = self.__instructions
+        num_instructions = len(instructions)
+        call_stack = self.__call_stack
+        perf_counter = time.perf_counter
+
+        profile = self.__profile
+        counts = profile.counts
+        times = profile.times
+        function_counts = profile.function_counts
+        function_times = profile.function_times
+        entry = profile.entry
+
+        pc = self.__current_opcode_ptr
+        num_steps = self.__num_steps
+        try:
+            while pc < num_instructions:
+                instruction = instructions[pc]
+                function = (
+                    instructions[call_stack[-1]].src if len(call_stack) > 0 else entry
+                )
+
+                if show_exec_opcodes:
+                    print(self.__get_opcode_from_pos(pos=pc))
+
+                start = perf_counter()
+                next_pc = handlers[instruction.op_num](instruction, pc)
+                elapsed = perf_counter() - start
+
+                counts[pc] += 1
+                times[pc] += elapsed
+                function_counts[function] = function_counts.get(function, 0) + 1
+                function_times[function] = function_times.get(function, 0.0) + elapsed
+
+                pc = next_pc
+                num_steps += 1
+        finally:
+            self.__current_opcode_ptr = pc
+            self.__num_steps = num_steps
+
+    def __run_hooked(self, handlers, step_callbacks, show_exec_opcodes):
+        instructions = self.__instructions
+        num_instructions = len(instructions)
+
+        pc = self.__current_opcode_ptr
+        while pc < num_instructions:
+            instruction = instructions[pc]
+
+            if show_exec_opcodes:
+                print(self.__get_opcode_from_pos(pos=pc))
+
+            next_pc = handlers[instruction.op_num](instruction, pc)
+
+            # Callbacks see the VM as it is after the step, e.g. to checkpoint it
+            self.__current_opcode_ptr = next_pc
+            self.__num_steps += 1
+
+            is_paused = False
+            for callback in step_callbacks:
+                if callback(self, instruction, pc, next_pc):
+                    is_paused = True
+
+            pc = next_pc
+            if is_paused:
+                break
+
+    def __step(self, handlers, show_exec_opcodes):
+        instructions = self.__instructions
+        num_instructions = len(instructions)
+
+        pc = self.__current_opcode_ptr
+        while pc < num_instructions:
+            instruction = instructions[pc]
+
+            if show_exec_opcodes:
+                print(self.__get_opcode_from_pos(pos=pc))
+
+            pc = handlers[instruction.op_num](instruction, pc)
+            self.__current_opcode_ptr = pc
+            self.__num_steps += 1
+
+            if self.__is_halted:
                 break
 
-        main_opcode = opcode.OpCode(op_code="label", op_value="main", line_num=1)
-        main_opcode_idx = self.__find_opcode_idx(op=main_opcode)
+            yield instruction, pc
+
+    def __get_state(self, line_num):
+        rsp = self.__register_values[registers.RSP]
+
+        return {
+            "line_num": line_num,
+            "flags": flags.to_dict(bits=self.__flag_bits()),
+            "registers": self.__registers.snapshot(),
+            "memory": self.__memory.snapshot(rsp=rsp),
+            "stack": self.__memory.stack(rsp=rsp),
+        }
+
+    def __get_delta(self, instruction, pc, registers_before, flags_before):
+        delta = {"line_num": self.__instructions[pc - 1].line_num}
+
+        changed_registers = {
+            registers.PARENT_REGISTERS[slot]: value
+            for slot, value in enumerate(self.__register_values)
+            if value != registers_before[slot]
+        }
+        if len(changed_registers) > 0:
+            delta["registers"] = changed_registers
+
+        flags_after = flags.to_dict(bits=self.__flag_bits())
+        if flags_after != flags_before:
+            delta["flags"] = flags_after
+
+        # Only moves to memory and pushes write memory
+        if instruction.op_code == "push":
+            rsp = self.__register_values[registers.RSP]
+            delta["memory"] = self.__memory.dump(address=rsp, num_bytes=8)
+            delta["push"] = self.__memory.load(address=rsp, bits=64)
+        elif instruction.op_code == "pop":
+            delta["pop"] = self.__read_register(operand=instruction.dst)
+        elif instruction.dst != None and instruction.op_code in [
+            "mov",
+            "movzb",
+            "movsbq",
+            "movsxd",
+            "movswq",
+        ]:
+            if instruction.dst.kind in decoder.MEMORY_KINDS:
+                delta["memory"] = self.__memory.dump(
+                    address=self.__compute_operand_address(operand=instruction.dst),
+                    num_bytes=instruction.bits >> 3,
+                )
+
+        return delta
+
+    def __step_deltas(self, handlers, show_exec_opcodes):
+        state = self.__get_state(line_num=None)
+        state["globals_size"] = self.__memory.globals_size
+        state["stack_top"] = self.__memory.stack_top
+        yield state
+
+        registers_before = list(self.__register_values)
+        flags_before = flags.to_dict(bits=self.__flag_bits())
+        for instruction, pc in self.__step(
+            handlers=handlers, show_exec_opcodes=show_exec_opcodes
+        ):
+            yield self.__get_delta(
+                instruction=instruction,
+                pc=pc,
+                registers_before=registers_before,
+                flags_before=flags_before,
+            )
+
+            registers_before = list(self.__register_values)
+            flags_before = flags.to_dict(bits=self.__flag_bits())
+
+    def get_state(self):
+        # State after the last step, at the line execution continues from
+        if self.__current_opcode_ptr == 0:
+            return self.__get_state(line_num=None)
+
+        return self.__get_state(
+            line_num=self.__instructions[self.__current_opcode_ptr - 1].line_num
+        )
+
+    def checkpoint(self):
+        return (
+            list(self.__register_values),
+            self.__memory.checkpoint(),
+            list(self.__flag_state),
+            list(self.__call_stack),
+            self.__current_opcode_ptr,
+            self.__is_halted,
+            self.__num_steps,
+            list(self.__register_widths),
+        )
+
+    def restore(self, checkpoint):
+        (
+            register_values,
+            memory_checkpoint,
+            flag_state,
+            call_stack,
+            self.__current_opcode_ptr,
+            self.__is_halted,
+            self.__num_steps,
+            register_widths,
+        ) = checkpoint
+
+        # Handlers hold on to the register list, so it is refilled in place
+        self.__register_values[:] = register_values
+        self.__register_widths[:] = register_widths
+        self.__memory.restore(checkpoint=memory_checkpoint)
+        self.__flag_state[:] = flag_state
+        self.__call_stack = list(call_stack)
+        self.__stop = None
+
+    def execute(
+        self,
+        yield_execution=False,
+        show_exec_opcodes=False,
+        mode="table",
+        yield_deltas=False,
+        max_steps=None,
+        stop_depth=None,
+        ignore_breakpoints=False,
+        timeout=None,
+        cancel_token=None,
+    ):
+        if mode not in self.__execution_modes.keys():
+            error_utils.error(msg=f"Unknown execution mode '{mode}'")
+
+        self.__load_globals(show_exec_opcodes=show_exec_opcodes)
+
+        main_opcode_idx = self.find_label(label="main")
 
         if main_opcode_idx != None:
             self.__current_opcode_ptr = main_opcode_idx
 
-        while not self.__is_opcode_list_end():
-            op_code = self.__get_opcode_from_pos()
+        return (
+            yield from self.resume(
+                yield_execution=yield_execution,
+                show_exec_opcodes=show_exec_opcodes,
+                mode=mode,
+                yield_deltas=yield_deltas,
+                max_steps=max_steps,
+                stop_depth=stop_depth,
+                ignore_breakpoints=ignore_breakpoints,
+                timeout=timeout,
+                cancel_token=cancel_token,
+            )
+        )
 
-            if show_exec_opcodes:
-                print(op_code)
+    def resume(
+        self,
+        yield_execution=False,
+        show_exec_opcodes=False,
+        mode="table",
+        yield_deltas=False,
+        max_steps=None,
+        stop_depth=None,
+        ignore_breakpoints=False,
+        timeout=None,
+        cancel_token=None,
+    ):
+        # Continues from the current state, e.g. after restoring a checkpoint.
+        # A plain run stops early after max_steps steps, once a ret leaves at
+        # most stop_depth calls on the call stack, at a breakpoint or
+        # watchpoint unless ignore_breakpoints is set, after timeout seconds or
+        # once cancel_token is cancelled. stop tells which.
+        if mode not in self.__execution_modes.keys():
+            error_utils.error(msg=f"Unknown execution mode '{mode}'")
+
+        limits_obj = None
+        if timeout != None or cancel_token != None:
+            limits_obj = limits.Limits(timeout=timeout, cancel_token=cancel_token)
+
+        previous_stop = self.__stop
+        self.__stop = None
+
+        has_stops = (
+            max_steps != None
+            or stop_depth != None
+            or (not ignore_breakpoints and len(self.__breakpoints) > 0)
+        )
 
-            if op_code.op_code in ["mov", "movzb", "movsbq", "movsxd", "movswq"]:
-                value, register = op_code.op_value.split("---")
-                self.__execute_move_instruction(value=value, register=register)
-                self.__increment_opcode_ptr()
-            elif op_code.op_code == "ret":
-                is_end = self.__execute_return_instruction()
+        # Fused instructions and compiled blocks hide the steps they are made
+        # of, so anything that looks at single steps runs on the table instead
+        if mode in BATCHED_MODES and (
+            yield_execution
+            or has_stops
+            or show_exec_opcodes
+            or self.__profile != None
+            or any(len(callbacks) > 0 for callbacks in self.__hooks.values())
+        ):
+            mode = "table"
 
-                if is_end:
-                    break
+        handlers = self.__execution_modes[mode]
 
-                self.__increment_opcode_ptr()
-            elif op_code.op_code in ["add", "sub", "imul", "idiv"]:
-                value, register = op_code.op_value.split("---")
-                self.__execute_arithmetic_operation(
-                    value=value, register=register, operator=op_code.op_code
+        # Hooks are picked up here, without any the plain loops run unchanged
+        if any(len(callbacks) > 0 for callbacks in self.__hooks.values()):
+            handlers = self.__hook_handlers(handlers=handlers)
+
+        if not yield_execution:
+            if len(self.__hooks["on_step"]) > 0:
+                self.__run_hooked(
+                    handlers=handlers,
+                    step_callbacks=list(self.__hooks["on_step"]),
+                    show_exec_opcodes=show_exec_opcodes,
+                )
+            elif self.__profile != None:
+                self.__run_profiled(
+                    handlers=handlers, show_exec_opcodes=show_exec_opcodes
                 )
-                self.__increment_opcode_ptr()
-            elif op_code.op_code in ["cqo", "cdq"]:
-                self.__increment_opcode_ptr()
-            elif op_code.op_code == "neg":
-                self.__execute_unary_operation(register=op_code.op_value)
-                self.__increment_opcode_ptr()
-            elif op_code.op_code == "push":
-                self.__execute_push_to_stack(value=op_code.op_value)
-                self.__increment_opcode_ptr()
-            elif op_code.op_code == "pop":
-                self.__execute_pop_from_stack(register=op_code.op_value)
-                self.__increment_opcode_ptr()
-            elif op_code.op_code == "cmp":
-                src_register, dst_register = op_code.op_value.split("---")
-                self.__execute_compare(
-                    src_register=src_register, dst_register=dst_register
+            elif show_exec_opcodes:
+                for _ in self.__step(handlers=handlers, show_exec_opcodes=True):
+                    pass
+            elif has_stops:
+                self.__run_until_stop(
+                    handlers=handlers,
+                    max_steps=max_steps,
+                    stop_depth=stop_depth,
+                    ignore_breakpoints=ignore_breakpoints,
+                    previous_stop=previous_stop,
+                    limits_obj=limits_obj,
                 )
-                self.__increment_opcode_ptr()
-            elif op_code.op_code in ["sete", "setne", "setl", "setle"]:
-                self.__execute_comparison_op(
-                    operator=op_code.op_code, register=op_code.op_value
+            elif mode == "compiled":
+                self.__run_compiled(handlers=handlers, limits_obj=limits_obj)
+            elif mode == "fused":
+                if self.__fused_instructions == None:
+                    self.__fused_instructions = fusion.fuse(
+                        instructions=self.__instructions
+                    )
+
+                self.__run(
+                    handlers=handlers,
+                    instructions=self.__fused_instructions,
+                    limits_obj=limits_obj,
                 )
-                self.__increment_opcode_ptr()
-            elif op_code.op_code == "lea":
-                address, register = op_code.op_value.split("---")
-                self.__execute_lea(address=address, register=register)
-                self.__increment_opcode_ptr()
-            elif op_code.op_code == "jmp":
-                jmp_idx = int(op_code.op_value)
-                self.__execute_jmp(jmp_idx=jmp_idx)
-                self.__increment_opcode_ptr()
-            elif op_code.op_code == "je":
-                jmp_idx = int(op_code.op_value)
-                self.__execute_conditional_jump(jmp_idx=jmp_idx, on="zero")
-                self.__increment_opcode_ptr()
-            elif op_code.op_code == "label":
-                self.__increment_opcode_ptr()
-            elif op_code.op_code == "call":
-                label = op_code.op_value
-                self.__execute_call(label=label)
-                self.__increment_opcode_ptr()
-
-            if yield_execution:
-                executed_opcode = self.__opcodes[self.__current_opcode_ptr - 1]
-
-                yield {
-                    "line_num": executed_opcode.line_num,
-                    "flags": self.__flags,
-                    "registers": {
-                        register: self.__registers[register].value
-                        for register in self.__registers.keys()
-                        if self.__registers[register].value != None
-                    },
-                    "memory": self.__memory,
-                    "stack": self.__stack,
-                }
-
-        if yield_execution:
-            yield self.__registers["rax"].value
+            else:
+                self.__run(
+                    handlers=handlers,
+                    instructions=self.__instructions,
+                    limits_obj=limits_obj,
+                )
+
+            return self.__registers.result(slot=registers.RAX)
+
+        if yield_deltas:
+            # Full state before the first step, then only what each step changed
+            yield from self.__step_deltas(
+                handlers=handlers, show_exec_opcodes=show_exec_opcodes
+            )
         else:
-            return self.__registers["rax"].value
+            for _, pc in self.__step(
+                handlers=handlers, show_exec_opcodes=show_exec_opcodes
+            ):
+                yield self.__get_state(line_num=self.__instructions[pc - 1].line_num)
+
+        yield self.__registers.result(slot=registers.RAX)
+
+    def run(self, mode="table", max_steps=None, timeout=None, cancel_token=None):
+        # Runs the program like execute(), but a run stopped by a limit is
+        # reported in the result instead of having to be looked up on the VM
+        execution = self.execute(
+            mode=mode, max_steps=max_steps, timeout=timeout, cancel_token=cancel_token
+        )
+        try:
+            while True:
+                next(execution)
+        except StopIteration as stop_iteration:
+            value = stop_iteration.value
+
+        if self.__stop == None:
+            return limits.RunResult(
+                value=value,
+                stop=None,
+                pc=self.__current_opcode_ptr,
+                num_steps=self.__num_steps,
+                state=self.get_state(),
+            )
+
+        return limits.RunResult(
+            value=None,
+            stop=self.__stop,
+            pc=self.__current_opcode_ptr,
+            num_steps=self.__num_steps,
+            state=self.__get_state(line_num=self.__stop.line_num),
+        )
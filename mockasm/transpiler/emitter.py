@@ -0,0 +1,676 @@
+from ..runtime import decoder
+from ..runtime import memory
+from ..runtime import registers
+
+MOVES = frozenset(["mov", "movzb", "movsbq", "movsxd", "movswq"])
+ARITHMETIC = {"add": "+", "sub": "-", "imul": "*", "idiv": "//"}
+SETS = {
+    "sete": "fz == 1",
+    "setne": "fz != 1",
+    "setl": "fn == 1 and fp == 0",
+    "setle": "(fn == 1 and fp == 0) or fz == 1",
+}
+
+REGISTER_KINDS = [decoder.REGISTER, decoder.SUB_REGISTER]
+
+# Opcodes that write their dst when it is a register
+WRITE_OP_CODES = MOVES | set(ARITHMETIC.keys()) | set(SETS.keys())
+WRITE_OP_CODES |= {"neg", "pop", "lea"}
+
+# Struct names used by the generated module, keyed like memory.LOAD_FORMATS
+FORMAT_NAMES = {
+    (bits, signed): f"{'S' if signed else 'U'}{bits}"
+    for bits, signed in memory.LOAD_FORMATS.keys()
+}
+
+# Only rsp and rbp hold a value before the program writes any register
+INITIALLY_SET = (1 << registers.RSP) | (1 << registers.RBP)
+ALL_SET = (1 << len(registers.PARENT_REGISTERS)) - 1
+
+# Calls in the program become Python calls in the generated module. They run
+# in a thread with a C stack big enough for RECURSION_LIMIT frames, so deep
+# recursion raises RecursionError instead of crashing the interpreter.
+RECURSION_LIMIT = 1 << 16
+THREAD_STACK_SIZE = 256 << 20
+
+PRELUDE = '''# Generated by mockasm --emit-python
+
+import struct
+import sys
+import threading
+
+GLOBALS = bytes.fromhex("{globals_data}")
+STACK_TOP = {stack_top}
+MAX_MEMORY_SIZE = {max_memory_size}
+RECURSION_LIMIT = {recursion_limit}
+THREAD_STACK_SIZE = {thread_stack_size}
+
+{formats}
+
+
+class Halt(Exception):
+    pass
+
+
+def error(msg):
+    raise ValueError(f"\\033[91m{{msg}}\\033[m")
+
+
+def grow(memory, address, num_bytes):
+    end = address + num_bytes
+    if address < 0 or end > MAX_MEMORY_SIZE:
+        error(msg=f"Invalid memory access at address {{address}}")
+
+    if end > len(memory):
+        memory.extend(bytes(end - len(memory)))
+
+
+def load(memory, address, fmt):
+    if address < 0 or address + fmt.size > len(memory):
+        grow(memory, address, fmt.size)
+
+    return fmt.unpack_from(memory, address)[0]
+
+
+def store(memory, address, value, fmt):
+    if address < 0 or address + fmt.size > len(memory):
+        grow(memory, address, fmt.size)
+
+    fmt.pack_into(memory, address, value)
+
+
+def as_written(value, bits):
+    # Signed at the width the register was last written with
+    if value is None or bits == 64:
+        return value
+
+    return ((value & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000
+
+
+def print_result(*values):
+    for value in values:
+        if value is not None:
+            print(value)
+            break
+
+
+def run_program():
+    memory = bytearray(STACK_TOP)
+    memory[: len(GLOBALS)] = GLOBALS
+
+    {registers} = None
+    {stack_registers} = STACK_TOP
+    fz = fn = fp = 0{widths}
+'''
+
+EPILOGUE = '''
+    try:
+        {entry}()
+    except Halt:
+        pass
+
+    return {result}
+
+
+def run():
+    # Deep recursion needs more C stack than the main thread may have
+    outcome = {{}}
+
+    def target():
+        try:
+            outcome["result"] = run_program()
+        except BaseException as error:
+            outcome["error"] = error
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), RECURSION_LIMIT))
+
+    stack_size = threading.stack_size(THREAD_STACK_SIZE)
+    try:
+        thread = threading.Thread(target=target)
+        thread.start()
+    finally:
+        threading.stack_size(stack_size)
+    thread.join()
+
+    if "error" in outcome:
+        raise outcome["error"]
+
+    return outcome["result"]
+
+
+if __name__ == "__main__":
+    run()
+'''
+
+
+class PythonEmitter:
+    def __init__(self, opcodes):
+        decoder_obj = decoder.Decoder(opcodes=opcodes)
+        self.__instructions = decoder_obj.decode()
+        self.__symbol_table = decoder_obj.symbol_table
+        self.__globals_size = decoder_obj.globals_size
+
+        # Registers the program writes as 32-bit, only these keep track of the
+        # width they were last written with
+        self.__narrow_slots = sorted(
+            set(
+                instruction.dst.register
+                for instruction in self.__instructions
+                if instruction.op_code in WRITE_OP_CODES
+                and instruction.dst.kind == decoder.SUB_REGISTER
+                and instruction.dst.bits == 32
+            )
+        )
+
+    def __local(self, slot):
+        return f"r{slot}"
+
+    def __width(self, slot):
+        return f"w{slot}"
+
+    def __result(self, slot):
+        if slot not in self.__narrow_slots:
+            return self.__local(slot=slot)
+
+        return f"as_written({self.__local(slot=slot)}, {self.__width(slot=slot)})"
+
+    def __printed_result(self, slot):
+        # Same as the VM, stack pointers print as the bytes below the stack top
+        if slot in [registers.RSP, registers.RBP]:
+            return f"STACK_TOP - {self.__local(slot=slot)}"
+
+        return self.__result(slot=slot)
+
+    def __entry(self):
+        # Same start as VM.execute: main, or whatever follows the globals
+        main_idx = self.__symbol_table.get("main", None)
+        if main_idx != None:
+            return main_idx
+
+        pc = 0
+        while pc < len(self.__instructions) and self.__instructions[pc].op_code in [
+            "global",
+            "byte",
+        ]:
+            pc += 1
+
+        return pc
+
+    def __successors(self, pc, follow_calls):
+        instruction = self.__instructions[pc]
+        op_code = instruction.op_code
+
+        if op_code == "jmp":
+            successors = [instruction.src + 1]
+        elif op_code == "je":
+            successors = [instruction.src + 1, pc + 1]
+        elif op_code == "call" and follow_calls:
+            successors = [instruction.src + 1, pc + 1]
+        elif op_code == "ret":
+            successors = []
+        else:
+            successors = [pc + 1]
+
+        return [
+            successor
+            for successor in successors
+            if successor < len(self.__instructions)
+        ]
+
+    def __register_slots(self, operands):
+        return [
+            operand.register
+            for operand in operands
+            if operand != None and operand.kind in REGISTER_KINDS
+        ]
+
+    def __checked_slots(self, instruction):
+        # Registers the VM refuses to read while they are unset
+        op_code = instruction.op_code
+        if op_code in ARITHMETIC or op_code == "cmp":
+            return self.__register_slots(operands=[instruction.src, instruction.dst])
+        elif op_code in ["push", "neg"]:
+            return self.__register_slots(operands=[instruction.src])
+
+        return []
+
+    def __written_slots(self, instruction):
+        op_code = instruction.op_code
+        if (
+            op_code in MOVES
+            or op_code in ARITHMETIC
+            or op_code in SETS
+            or op_code in ["neg", "pop", "lea"]
+        ):
+            return self.__register_slots(operands=[instruction.dst])
+
+        return []
+
+    def __set_registers(self, entry):
+        # Registers are never unset again once written, so a register is known
+        # to be set at pc when every path from the entry writes it first. A
+        # call returns with at least the registers set before it.
+        num_instructions = len(self.__instructions)
+        set_registers = [None] * num_instructions
+        if entry >= num_instructions:
+            return set_registers
+
+        set_registers[entry] = INITIALLY_SET
+        pending = [entry]
+        while len(pending) > 0:
+            pc = pending.pop()
+            instruction = self.__instructions[pc]
+
+            out = set_registers[pc]
+            for slot in self.__checked_slots(
+                instruction=instruction
+            ) + self.__written_slots(instruction=instruction):
+                out |= 1 << slot
+
+            for successor in self.__successors(pc=pc, follow_calls=True):
+                current = set_registers[successor]
+                joined = out if current == None else current & out
+                if joined != current:
+                    set_registers[successor] = joined
+                    pending.append(successor)
+
+        return set_registers
+
+    def __leaders(self, entries):
+        leaders = set(entries)
+        for pc, instruction in enumerate(self.__instructions):
+            if instruction.op_code in ["jmp", "je"]:
+                leaders.add(instruction.src + 1)
+            if instruction.op_code == "je":
+                leaders.add(pc + 1)
+
+        return leaders
+
+    def __block_successors(self, start, leaders):
+        for pc in range(start, len(self.__instructions)):
+            op_code = self.__instructions[pc].op_code
+            if op_code in ["jmp", "je", "ret"]:
+                return self.__successors(pc=pc, follow_calls=False)
+            elif pc + 1 in leaders:
+                return [pc + 1]
+
+        return []
+
+    def __function_blocks(self, entry, leaders):
+        blocks = set()
+        pending = [entry]
+        while len(pending) > 0:
+            start = pending.pop()
+            if start in blocks or start >= len(self.__instructions):
+                continue
+
+            blocks.add(start)
+            pending += self.__block_successors(start=start, leaders=leaders)
+
+        return sorted(blocks)
+
+    def __to_int64(self, expression):
+        sign = hex(registers.INT64_SIGN)
+        return f"((({expression}) + {sign}) & {hex(registers.UINT64_MASK)}) - {sign}"
+
+    def __narrow(self, expression, bits, signed):
+        mask = (1 << bits) - 1
+        if not signed:
+            return f"({expression} & {mask})"
+
+        sign = 1 << (bits - 1)
+        return f"((({expression} & {mask}) ^ {sign}) - {sign})"
+
+    def __address(self, operand):
+        if operand.kind == decoder.ADDRESS:
+            return f"{self.__local(slot=registers.RBP)} - {operand.value}"
+        elif operand.kind == decoder.LOCATION_AT:
+            return self.__local(slot=operand.register)
+        elif operand.kind == decoder.RELATIVE_ADDRESS:
+            return f"{self.__local(slot=operand.register)} + {operand.value}"
+
+        return repr(operand.value)
+
+    def __read(self, operand, bits=64, signed=True):
+        if operand.kind == decoder.REGISTER:
+            return self.__local(slot=operand.register)
+        elif operand.kind == decoder.SUB_REGISTER:
+            return self.__narrow(
+                expression=self.__local(slot=operand.register),
+                bits=operand.bits,
+                signed=signed,
+            )
+        elif operand.kind in decoder.MEMORY_KINDS:
+            address = self.__address(operand=operand)
+            return f"load(memory, {address}, {FORMAT_NAMES[(bits, signed)]})"
+
+        return repr(operand.value)
+
+    def __is_set(self, operand, set_registers):
+        return (
+            operand.kind not in REGISTER_KINDS
+            or (set_registers >> operand.register) & 1 == 1
+        )
+
+    def __write(self, operand, expression, set_registers, wrap=True):
+        # wrap is False for values that are signed 64-bit already
+        local = self.__local(slot=operand.register)
+        if operand.kind == decoder.REGISTER:
+            if wrap:
+                expression = self.__to_int64(expression=expression)
+
+            return [f"{local} = {expression}"] + self.__set_width(
+                slot=operand.register, bits=64
+            )
+        elif operand.bits == 32:
+            return [f"{local} = ({expression}) & 0xFFFFFFFF"] + self.__set_width(
+                slot=operand.register, bits=32
+            )
+
+        # Narrower writes keep the rest of the register, unset counts as 0
+        current = local
+        if not self.__is_set(operand=operand, set_registers=set_registers):
+            current = f"(0 if {local} is None else {local})"
+
+        mask = (1 << operand.bits) - 1
+        return [f"{local} = ({current} & {~mask}) | (({expression}) & {mask})"]
+
+    def __set_width(self, slot, bits):
+        if slot not in self.__narrow_slots:
+            return []
+
+        return [f"{self.__width(slot=slot)} = {bits}"]
+
+    def __store(self, operand, expression, bits):
+        mask = hex((1 << bits) - 1)
+        address = self.__address(operand=operand)
+        return [
+            f"store(memory, {address}, ({expression}) & {mask}, {FORMAT_NAMES[(bits, False)]})"
+        ]
+
+    def __check(self, operand, set_registers, msg):
+        if self.__is_set(operand=operand, set_registers=set_registers):
+            return []
+
+        name = registers.PARENT_REGISTERS[operand.register]
+        return [
+            f"if {self.__local(slot=operand.register)} is None:",
+            f"    error(msg={repr(msg.replace('{}', name))})",
+        ]
+
+    def __translate(self, instruction, pc, set_registers, halt):
+        op_code = instruction.op_code
+        src = instruction.src
+        dst = instruction.dst
+
+        if op_code in MOVES:
+            value = self.__read(
+                operand=src, bits=instruction.bits, signed=op_code != "movzb"
+            )
+
+            # Moves read unset registers as -1
+            if not self.__is_set(operand=src, set_registers=set_registers):
+                value = f"(-1 if {self.__local(slot=src.register)} is None else {value})"
+
+            if dst.kind in REGISTER_KINDS:
+                return self.__write(
+                    operand=dst,
+                    expression=value,
+                    set_registers=set_registers,
+                    wrap=src.kind == decoder.IMMEDIATE,
+                )
+
+            return self.__store(operand=dst, expression=value, bits=instruction.bits)
+        elif op_code in ARITHMETIC:
+            lines = self.__check(
+                operand=dst,
+                set_registers=set_registers,
+                msg="Register {} does not have any value, set a value to perform arithmetic operation",
+            )
+            lines += self.__check(
+                operand=src,
+                set_registers=set_registers,
+                msg="Register {} has not been set, you cannot perform "
+                + op_code
+                + " operation",
+            )
+
+            return lines + self.__write(
+                operand=dst,
+                expression=f"{self.__read(operand=dst)} {ARITHMETIC[op_code]} {self.__read(operand=src)}",
+                set_registers=set_registers,
+            )
+        elif op_code == "neg":
+            lines = self.__check(
+                operand=dst,
+                set_registers=set_registers,
+                msg="Register '{}' has not been set, cannot negate empty value",
+            )
+
+            return lines + self.__write(
+                operand=dst,
+                expression=f"-1 * {self.__read(operand=dst)}",
+                set_registers=set_registers,
+            )
+        elif op_code == "push":
+            rsp = self.__local(slot=registers.RSP)
+            lines = self.__check(
+                operand=src,
+                set_registers=set_registers,
+                msg="Register '{}' has not been set, you cannot push it to stack",
+            )
+
+            return lines + [
+                f"value = {self.__read(operand=src)}",
+                f"{rsp} = {rsp} - 8",
+                f"store(memory, {rsp}, value & {hex((1 << 64) - 1)}, U64)",
+            ]
+        elif op_code == "pop":
+            rsp = self.__local(slot=registers.RSP)
+            lines = [
+                f"value = load(memory, {rsp}, S64)",
+                f"{rsp} = {rsp} + 8",
+            ]
+
+            return lines + self.__write(
+                operand=dst, expression="value", set_registers=set_registers, wrap=False
+            )
+        elif op_code == "cmp":
+            msg = "Register '{}' has not been set, cannot use it in cmp"
+            lines = self.__check(operand=src, set_registers=set_registers, msg=msg)
+            lines += self.__check(operand=dst, set_registers=set_registers, msg=msg)
+
+            return lines + [
+                f"value = {self.__read(operand=src)}",
+                f"result = {self.__read(operand=dst)} - value",
+                "if result < 0:",
+                "    fn = 1",
+                "elif result == 0:",
+                "    fz = 1",
+                "else:",
+                "    fp = 1",
+            ]
+        elif op_code in SETS:
+            lines = self.__write(
+                operand=dst,
+                expression=f"1 if {SETS[op_code]} else 0",
+                set_registers=set_registers,
+                wrap=False,
+            )
+
+            return lines + ["fz = fn = fp = 0"]
+        elif op_code == "lea":
+            return self.__write(
+                operand=dst,
+                expression=self.__address(operand=src),
+                set_registers=set_registers,
+            )
+        elif op_code == "call":
+            # A call to the end of the program ends it like falling off it
+            if instruction.src + 1 >= len(self.__instructions):
+                return [halt]
+
+            return [f"function_{instruction.src + 1}()"]
+
+        return []
+
+    def __goto(self, pc, halt):
+        if pc >= len(self.__instructions):
+            return [halt]
+
+        return [f"block = {pc}"]
+
+    def __block_lines(self, start, leaders, set_registers, is_top_level):
+        # At the top level a ret or the end of the program stops the run, in
+        # a called function only ret returns normally
+        halt = "return" if is_top_level else "raise Halt"
+
+        lines = []
+        for pc in range(start, len(self.__instructions)):
+            instruction = self.__instructions[pc]
+            op_code = instruction.op_code
+            registers_at = (
+                ALL_SET if set_registers[pc] == None else set_registers[pc]
+            )
+
+            lines += self.__translate(
+                instruction=instruction,
+                pc=pc,
+                set_registers=registers_at,
+                halt=halt,
+            )
+
+            if op_code == "jmp":
+                return lines + self.__goto(pc=instruction.src + 1, halt=halt)
+            elif op_code == "je":
+                return lines + [
+                    "is_taken = fz",
+                    "fz = fn = fp = 0",
+                    "if is_taken:",
+                    "    " + self.__goto(pc=instruction.src + 1, halt=halt)[0],
+                    "else:",
+                    "    " + self.__goto(pc=pc + 1, halt=halt)[0],
+                ]
+            elif op_code == "ret":
+                if not is_top_level:
+                    return lines + ["return"]
+
+                values = ", ".join(
+                    self.__printed_result(slot=slot)
+                    for slot in range(len(registers.PARENT_REGISTERS))
+                )
+                return lines + [f"print_result({values})", "return"]
+            elif pc + 1 in leaders:
+                return lines + self.__goto(pc=pc + 1, halt=halt)
+
+        return lines + [halt]
+
+    def __dispatch_lines(self, starts, blocks, indent):
+        # Blocks are picked by binary search on their start
+        if len(starts) == 1:
+            return [indent + line for line in blocks[starts[0]]]
+
+        mid = len(starts) // 2
+        return (
+            [f"{indent}if block < {starts[mid]}:"]
+            + self.__dispatch_lines(
+                starts=starts[:mid], blocks=blocks, indent=indent + "    "
+            )
+            + [f"{indent}else:"]
+            + self.__dispatch_lines(
+                starts=starts[mid:], blocks=blocks, indent=indent + "    "
+            )
+        )
+
+    def __function_lines(self, name, entry, leaders, set_registers, is_top_level):
+        names = ", ".join(
+            [self.__local(slot=slot) for slot in range(len(registers.PARENT_REGISTERS))]
+            + ["fz", "fn", "fp"]
+            + [self.__width(slot=slot) for slot in self.__narrow_slots]
+        )
+        lines = [f"def {name}():", f"    nonlocal {names}"]
+
+        starts = self.__function_blocks(entry=entry, leaders=leaders)
+        if len(starts) == 0:
+            return lines + ["    return" if is_top_level else "    raise Halt"]
+
+        blocks = {
+            start: self.__block_lines(
+                start=start,
+                leaders=leaders,
+                set_registers=set_registers,
+                is_top_level=is_top_level,
+            )
+            for start in starts
+        }
+
+        lines += [f"    block = {entry}", "    while True:"]
+        return lines + self.__dispatch_lines(
+            starts=starts, blocks=blocks, indent="        "
+        )
+
+    def __globals_data(self):
+        data = bytearray(self.__globals_size)
+        for instruction in self.__instructions:
+            if instruction.op_code == "byte":
+                data[instruction.dst] = instruction.src & 0xFF
+
+        return data.hex()
+
+    def emit(self):
+        entry = self.__entry()
+        call_targets = sorted(
+            set(
+                instruction.src + 1
+                for instruction in self.__instructions
+                if instruction.op_code == "call"
+                and instruction.src + 1 < len(self.__instructions)
+            )
+        )
+
+        leaders = self.__leaders(entries=[entry] + call_targets)
+        set_registers = self.__set_registers(entry=entry)
+
+        functions = [("top_level", entry, True)] + [
+            (f"function_{target}", target, False) for target in call_targets
+        ]
+
+        num_registers = len(registers.PARENT_REGISTERS)
+        source = PRELUDE.format(
+            globals_data=self.__globals_data(),
+            stack_top=self.__globals_size + memory.STACK_SIZE,
+            max_memory_size=self.__globals_size
+            + memory.STACK_SIZE
+            + memory.STACK_MARGIN,
+            recursion_limit=RECURSION_LIMIT,
+            thread_stack_size=THREAD_STACK_SIZE,
+            formats="\n".join(
+                f'{name} = struct.Struct("{memory.LOAD_FORMATS[key].format}")'
+                for key, name in FORMAT_NAMES.items()
+            ),
+            registers=" = ".join(
+                self.__local(slot=slot)
+                for slot in range(num_registers)
+                if slot not in [registers.RSP, registers.RBP]
+            ),
+            stack_registers=" = ".join(
+                self.__local(slot=slot) for slot in [registers.RSP, registers.RBP]
+            ),
+            widths="".join(
+                f"\n    {self.__width(slot=slot)} = 64" for slot in self.__narrow_slots
+            ),
+        )
+
+        for name, function_entry, is_top_level in functions:
+            lines = self.__function_lines(
+                name=name,
+                entry=function_entry,
+                leaders=leaders,
+                set_registers=set_registers,
+                is_top_level=is_top_level,
+            )
+            source += "\n" + "\n".join("    " + line for line in lines) + "\n"
+
+        return source + EPILOGUE.format(
+            entry="top_level", result=self.__result(slot=registers.RAX)
+        )
@@ -9,3 +9,11 @@ def read_file(path):
         file_contents = file.read()
 
     return file_contents
+
+
+def read_lines(path):
+    if path == "":
+        error_utils.error(msg="File path cannot be empty while reading a file!")
+
+    with open(path, "r") as file:
+        yield from file
@@ -44,7 +44,10 @@ setup(
         "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.6",
     ],
-    packages=[package for package in find_packages()],
+    packages=[
+        package
+        for package in find_packages(exclude=["benchmarks", "benchmarks.*"])
+    ],
     package_data={
         "mockasm": [
             "static/css/styles.css",
@@ -0,0 +1,52 @@
+import contextlib
+import io
+
+from mockasm.lexer import lexer
+from mockasm.optimizer import peephole
+from mockasm.parser import parser
+from mockasm.runtime import block_compiler
+from mockasm.runtime import vm
+from mockasm.transpiler import emitter
+
+MODES = ["table", "loop", "fused", "compiled"]
+
+
+def parse(source_code, optimize=False):
+    tokens = lexer.Lexer(source_code=source_code).lexical_analyze()
+    opcodes = parser.Parser(tokens=tokens).parse()
+
+    if optimize:
+        opcodes = peephole.PeepholeOptimizer(opcodes=opcodes).optimize()
+
+    return opcodes
+
+
+def run_output(source_code, mode="table", optimize=False):
+    # What the program prints, the VM prints its result on the final ret
+    vm_obj = vm.VM(opcodes=parse(source_code=source_code, optimize=optimize))
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        _ = list(vm_obj.execute(mode=mode))
+
+    return output.getvalue()
+
+
+def emitted_output(source_code):
+    module_source = emitter.PythonEmitter(opcodes=parse(source_code=source_code)).emit()
+
+    namespace = {"__name__": "emitted"}
+    exec(compile(module_source, "<emitted>", "exec"), namespace)
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        namespace["run"]()
+
+    return output.getvalue()
+
+
+def all_outputs(source_code, monkeypatch):
+    # Output of every execution mode and of the emitted module, compiled mode
+    # compiles every block the first time it is reached
+    monkeypatch.setattr(block_compiler, "HOT_THRESHOLD", 1)
+
+    outputs = {mode: run_output(source_code=source_code, mode=mode) for mode in MODES}
+    outputs["emit-python"] = emitted_output(source_code=source_code)
+
+    return outputs
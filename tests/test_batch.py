@@ -0,0 +1,69 @@
+import csv
+import json
+
+import pytest
+
+from benchmarks import workloads
+from mockasm import batch
+
+SPIN_PROGRAM = """.L.main:
+  mov $0, rax
+.L.spin:
+  add $1, rax
+  jmp .L.spin
+"""
+
+
+@pytest.fixture
+def programs(tmp_path):
+    (tmp_path / "finishes.s").write_text(workloads.loop(iterations=10))
+    (tmp_path / "spins.s").write_text(SPIN_PROGRAM)
+
+    return tmp_path
+
+
+def by_name(results):
+    return {result["path"].rsplit("/", 1)[-1]: result for result in results}
+
+
+def test_batch_stops_at_max_steps(programs):
+    results = by_name(batch.run_batch(pattern=str(programs), jobs=2, max_steps=1000))
+
+    assert results["finishes.s"]["status"] == "ok"
+    assert results["finishes.s"]["exit_value"] == 45
+    assert results["finishes.s"]["error"] == ""
+
+    assert results["spins.s"]["status"] == "max_steps"
+    assert results["spins.s"]["exit_value"] == None
+    assert results["spins.s"]["steps"] == 1000
+
+
+def test_batch_stops_at_timeout(programs):
+    results = by_name(batch.run_batch(pattern=str(programs), jobs=2, timeout=0.2))
+
+    assert results["finishes.s"]["status"] == "ok"
+    assert results["spins.s"]["status"] == "timeout"
+    assert results["spins.s"]["steps"] > 0
+
+
+@pytest.mark.parametrize(
+    "results_format,exit_values", [("json", [45, None]), ("csv", ["45", ""])]
+)
+def test_batch_writes_records(programs, tmp_path, results_format, exit_values):
+    results = batch.run_batch(pattern=str(programs), jobs=2, max_steps=1000)
+
+    path = tmp_path / f"results.{results_format}"
+    batch.write_results(results=results, path=path, results_format=results_format)
+
+    with open(path, newline="") as f:
+        if results_format == "json":
+            records = json.load(f)
+        else:
+            records = list(csv.DictReader(f))
+
+    assert [record["path"] for record in records] == [
+        result["path"] for result in results
+    ]
+    assert [record["status"] for record in records] == ["ok", "max_steps"]
+    assert [record["exit_value"] for record in records] == exit_values
+    assert list(records[0].keys()) == batch.RESULT_FIELDS
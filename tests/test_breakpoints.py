@@ -0,0 +1,56 @@
+import pytest
+
+from helpers import parse
+from mockasm.runtime import breakpoints
+from mockasm.runtime import registers
+from mockasm.runtime import vm
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "1 << 10**9 > 0",
+        "rax << 100000 > 0",
+        "rax >> 2 == 1",
+        "rax * rax > 3",
+        "rax ** 2 > 3",
+        "10**9 > 0",
+    ],
+)
+def test_condition_rejects_growing_operators(expression):
+    with pytest.raises(ValueError):
+        breakpoints.Condition(expression=expression)
+
+
+def test_condition_keeps_other_operators():
+    condition = breakpoints.Condition(
+        expression="(rax + 2) // 3 % 4 == 2 and -rax & 7 != 0 and not dil == 1"
+    )
+
+    register_file = registers.RegisterFile()
+    register_file.write(slot=registers.RAX, bits=64, value=5)
+    register_file.write(slot=registers.REGISTERS["rdi"][0], bits=64, value=2)
+
+    assert condition.evaluate(register_file=register_file)
+
+
+@pytest.mark.parametrize("expression", ["rax % rdi == 0", "rax // rdi == 1"])
+def test_condition_dividing_by_zero_does_not_fire(expression):
+    condition = breakpoints.Condition(expression=expression)
+
+    register_file = registers.RegisterFile()
+    register_file.write(slot=registers.RAX, bits=64, value=5)
+    register_file.write(slot=registers.REGISTERS["rdi"][0], bits=64, value=0)
+
+    assert not condition.evaluate(register_file=register_file)
+
+
+@pytest.mark.parametrize(
+    "address,bits",
+    [(10**12, 64), (-8, 64), ("8", 64), (8.0, 64), (None, 64), (0, 12), (0, "64")],
+)
+def test_watchpoint_rejects_bad_address(address, bits):
+    vm_obj = vm.VM(opcodes=parse(source_code=".L.main:\n  mov $1, rax\n  ret\n"))
+
+    with pytest.raises(ValueError):
+        vm_obj.add_watchpoint(address=address, bits=bits)
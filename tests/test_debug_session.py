@@ -0,0 +1,93 @@
+import pickle
+
+import pytest
+
+from benchmarks import workloads
+from helpers import parse
+from mockasm.app import debug_session
+from mockasm.runtime import vm
+
+SOURCE_CODE = workloads.loop(iterations=5)
+
+
+def new_session(checkpoint_interval=4):
+    return debug_session.DebugSession(
+        opcodes=parse(source_code=SOURCE_CODE),
+        source_code=SOURCE_CODE,
+        checkpoint_interval=checkpoint_interval,
+    )
+
+
+def test_next_stops_at_last_step():
+    session = new_session()
+    sequences = [session.next_sequence()]
+    while not session.is_at_end:
+        sequences.append(session.next_sequence())
+
+    last_step = session.num_steps - 1
+    assert sequences[-1]["step"] == last_step
+
+    # Stepping past the end stays on the last step instead of wrapping
+    for _ in range(3):
+        assert session.next_sequence()["step"] == last_step
+        assert session.is_at_end
+
+    assert session.prev_sequence()["step"] == last_step - 1
+    assert not session.is_at_end
+
+
+def test_spilled_session_is_restored_without_replay(monkeypatch):
+    session = new_session()
+    sequence = session.sequence_at(step=10)
+
+    state = pickle.dumps(session)
+
+    def replay(*args, **kwargs):
+        raise AssertionError("the run was replayed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(vm.VM, "execute", replay)
+        patch.setattr(vm.VM, "resume", replay)
+        loaded_session = pickle.loads(state)
+
+    assert loaded_session.sequence_at(step=10) == sequence
+    assert loaded_session.next_sequence() == session.next_sequence()
+    assert loaded_session.prev_sequence() == session.prev_sequence()
+
+
+def test_session_in_use_is_not_spilled(tmp_path):
+    store = debug_session.DebugSessionStore(max_bytes=1, spill_directory=tmp_path)
+    session_id = store.add(debug_session=new_session())
+
+    with store.use(session_id=session_id) as session:
+        # Over the budget, but the session in use stays in memory
+        store.add(debug_session=new_session())
+        sequence = session.sequence_at(step=10)
+
+    assert not (tmp_path / f"{session_id}.pickle").exists()
+
+    with store.use(session_id=session_id) as used_session:
+        assert used_session is session
+        assert used_session.next_sequence()["step"] == sequence["step"] + 1
+
+    # Once no longer in use it is the first to be spilled
+    store.add(debug_session=new_session())
+    assert (tmp_path / f"{session_id}.pickle").exists()
+
+    with store.use(session_id=session_id) as spilled_session:
+        assert spilled_session is not session
+        assert spilled_session.next_sequence()["step"] == sequence["step"] + 2
+
+
+def test_failed_set_breakpoints_leaves_no_breakpoints():
+    session = new_session()
+    session.next_sequence()
+
+    # The line entry is added before the bad one fails
+    for bad_entry in [5, {"line": "7"}]:
+        with pytest.raises((TypeError, AttributeError, ValueError)):
+            session.set_breakpoints(breakpoints=[{"line": 7}, bad_entry])
+
+    session.continue_sequence()
+    assert session.stop == None
+    assert session.is_at_end
@@ -0,0 +1,21 @@
+import pytest
+
+from benchmarks import workloads
+from helpers import emitted_output
+from helpers import run_output
+from mockasm.transpiler import emitter
+
+
+def test_emitted_recursion_matches_vm():
+    source_code = workloads.recursion(depth=20000)
+
+    assert emitted_output(source_code=source_code) == run_output(
+        source_code=source_code
+    )
+
+
+def test_emitted_recursion_past_limit_raises():
+    source_code = workloads.recursion(depth=emitter.RECURSION_LIMIT + 1000)
+
+    with pytest.raises(RecursionError):
+        emitted_output(source_code=source_code)
@@ -0,0 +1,95 @@
+import contextlib
+import io
+
+import pytest
+
+from benchmarks import workloads
+from helpers import MODES
+from helpers import parse
+from mockasm.runtime import vm
+
+CALL_PROGRAM = """.L.main:
+  mov $1, rdi
+  call .L.f
+  ret
+.L.f:
+  push rdi
+  pop rax
+  mov rax, -8(rsp)
+  cmp $1, rax
+  je .L.done
+  mov $5, rax
+.L.done:
+  ret
+"""
+
+
+def run(vm_obj, mode="table"):
+    with contextlib.redirect_stdout(io.StringIO()):
+        _ = list(vm_obj.execute(mode=mode))
+
+
+def test_hooks_fire_in_order():
+    vm_obj = vm.VM(opcodes=parse(source_code=CALL_PROGRAM))
+
+    events = []
+
+    def recorder(event):
+        def callback(vm_obj, instruction, pc, *args):
+            events.append((event, instruction.op_code, pc, *args))
+
+        return callback
+
+    for event in vm.HOOK_EVENTS:
+        vm_obj.add_hook(event=event, callback=recorder(event=event))
+    run(vm_obj=vm_obj)
+
+    # An instruction's own event comes right after it runs, on_step last. Jumps
+    # and calls continue after the label they target.
+    stack_top = vm_obj.get_state()["registers"]["rsp"]
+    assert events == [
+        ("on_step", "label", 0, 1),
+        ("on_step", "mov", 1, 2),
+        ("on_call", "call", 2, 5),
+        ("on_step", "call", 2, 5),
+        ("on_mem_write", "push", 5, stack_top - 8, 64, 1),
+        ("on_step", "push", 5, 6),
+        ("on_step", "pop", 6, 7),
+        ("on_mem_write", "mov", 7, stack_top - 8, 64, 1),
+        ("on_step", "mov", 7, 8),
+        ("on_step", "cmp", 8, 9),
+        ("on_branch", "je", 9, 12),
+        ("on_step", "je", 9, 12),
+        ("on_ret", "ret", 12, 3),
+        ("on_step", "ret", 12, 3),
+        ("on_ret", "ret", 3, 13),
+        ("on_step", "ret", 3, 13),
+    ]
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_profiler_counts(mode):
+    vm_obj = vm.VM(opcodes=parse(source_code=workloads.fib(n=5)), profile=True)
+    run(vm_obj=vm_obj, mode=mode)
+
+    # fib(5) makes 15 calls, 7 of them recurse and 8 return their argument
+    profile = vm_obj.profile
+    assert {op_code: count for op_code, count, _ in profile.by_opcode()} == {
+        "label": 1,
+        "mov": 1 + 8,
+        "call": 15,
+        "ret": 15 + 1,
+        "cmp": 2 * 15,
+        "setl": 15,
+        "movzb": 15,
+        "je": 15,
+        "push": 3 * 7,
+        "pop": 3 * 7,
+        "sub": 2 * 7,
+        "add": 7,
+    }
+    assert {name: count for name, count, _ in profile.by_function()} == {
+        "main": 4,
+        "fib": 175,
+    }
+    assert profile.total_count == vm_obj.num_steps == 179
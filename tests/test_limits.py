@@ -0,0 +1,110 @@
+import contextlib
+import io
+
+import pytest
+
+from helpers import MODES
+from helpers import parse
+from mockasm.runtime import block_compiler
+from mockasm.runtime import breakpoints
+from mockasm.runtime import limits
+from mockasm.runtime import vm
+
+SPIN_PROGRAM = """.L.main:
+  mov $0, rax
+.L.spin:
+  add $1, rax
+  jmp .L.spin
+"""
+
+
+class CancelAfterChecks(limits.CancelToken):
+    # Cancelled from the check after num_checks checks on, so the run stops at
+    # a known check instead of whenever another thread gets to it
+    def __init__(self, num_checks):
+        super().__init__()
+
+        self.num_checks = num_checks
+        self.checks = 0
+
+    @property
+    def is_cancelled(self):
+        self.checks += 1
+        return self.checks > self.num_checks
+
+
+def spin_state(num_steps):
+    return vm.VM(opcodes=parse(source_code=SPIN_PROGRAM)).run(max_steps=num_steps)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_cancelled_before_run_takes_no_step(mode):
+    cancel_token = limits.CancelToken()
+    cancel_token.cancel()
+
+    run_result = vm.VM(opcodes=parse(source_code=SPIN_PROGRAM)).run(
+        mode=mode, cancel_token=cancel_token
+    )
+
+    assert run_result.stop.reason == breakpoints.CANCELLED
+    assert run_result.num_steps == 0
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_cancel_is_noticed_every_check_interval(mode, monkeypatch):
+    monkeypatch.setattr(block_compiler, "HOT_THRESHOLD", 1)
+
+    cancel_token = CancelAfterChecks(num_checks=2)
+    run_result = vm.VM(opcodes=parse(source_code=SPIN_PROGRAM)).run(
+        mode=mode, cancel_token=cancel_token
+    )
+
+    assert run_result.stop.reason == breakpoints.CANCELLED
+    assert cancel_token.checks == 3
+
+    # Compiled blocks only look at the token between blocks
+    last_check = 2 * limits.CHECK_INTERVAL
+    if mode == "compiled":
+        assert last_check <= run_result.num_steps < last_check + 3
+    else:
+        assert run_result.num_steps == last_check
+
+    expected = spin_state(num_steps=run_result.num_steps)
+    assert run_result.pc == expected.pc
+    assert run_result.state == expected.state
+
+
+def test_run_result_of_finished_run():
+    vm_obj = vm.VM(opcodes=parse(source_code=".L.main:\n  mov $3, rax\n  ret\n"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_result = vm_obj.run()
+
+    assert run_result.value == 3
+    assert run_result.stop == None
+    assert run_result.pc == vm_obj.pc
+    assert run_result.num_steps == vm_obj.num_steps == 3
+    assert run_result.state == vm_obj.get_state()
+
+
+def test_run_result_of_stopped_run():
+    vm_obj = vm.VM(opcodes=parse(source_code=SPIN_PROGRAM))
+    run_result = vm_obj.run(max_steps=10)
+
+    assert run_result.value == None
+    assert run_result.stop.reason == breakpoints.MAX_STEPS
+    assert run_result.pc == run_result.stop.pc == vm_obj.pc
+    assert run_result.num_steps == vm_obj.num_steps == 10
+
+    # main, mov and the loop label, then add and jmp in turns. A stopped run
+    # is shown at the line it continues from.
+    assert run_result.state["registers"]["rax"] == 4
+    assert run_result.state == {
+        **vm_obj.get_state(),
+        "line_num": run_result.stop.line_num,
+    }
+
+
+def test_state_before_first_step_has_no_line():
+    vm_obj = vm.VM(opcodes=parse(source_code=SPIN_PROGRAM))
+
+    assert vm_obj.get_state()["line_num"] == None
@@ -0,0 +1,30 @@
+import pytest
+
+from helpers import MODES
+from helpers import emitted_output
+from helpers import run_output
+from mockasm.runtime import block_compiler
+
+WILD_STORE = """.L.main:
+  mov $1000000000000, rax
+  mov $1, (rax)
+  ret
+"""
+
+WILD_LOAD = """.L.main:
+  mov $1000000000000, rdi
+  mov (rdi), rax
+  ret
+"""
+
+
+@pytest.mark.parametrize("source_code", [WILD_STORE, WILD_LOAD])
+def test_wild_address_fails_instead_of_growing_memory(source_code, monkeypatch):
+    monkeypatch.setattr(block_compiler, "HOT_THRESHOLD", 1)
+
+    for mode in MODES:
+        with pytest.raises(ValueError, match="Invalid memory access"):
+            run_output(source_code=source_code, mode=mode)
+
+    with pytest.raises(ValueError, match="Invalid memory access"):
+        emitted_output(source_code=source_code)
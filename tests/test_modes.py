@@ -0,0 +1,113 @@
+import contextlib
+import io
+
+import pytest
+
+from benchmarks import workloads
+from helpers import MODES
+from helpers import all_outputs
+from helpers import parse
+from mockasm.runtime import block_compiler
+from mockasm.runtime import vm
+
+# Instructions the workloads leave out: idiv, every set<cc>, movsxd, movswq
+# and 32-bit writes, each run often enough for its block to be compiled
+INSTRUCTIONS_PROGRAM = """.global.table
+  byte 7
+  byte -3
+.L.main:
+  push rbp
+  mov rsp, rbp
+  sub $16, rsp
+  mov $0, rcx
+  mov $0, r8
+.L.loop:
+  cmp $40, rcx
+  je .L.end
+  mov rcx, rax
+  add $7, rax
+  mov $3, rdi
+  cqo
+  idiv rdi, rax
+  add rax, r8
+  mov rcx, rax
+  sub $20, rax
+  cqo
+  idiv rdi, rax
+  add rax, r8
+  cmp $5, rcx
+  sete al
+  movzb al, rax
+  add rax, r8
+  cmp $20, rcx
+  setne dl
+  movzb dl, rdx
+  add rdx, r8
+  cmp $9, rcx
+  setle sil
+  movzb sil, rsi
+  add rsi, r8
+  cmp $30, rcx
+  setl al
+  movzb al, rax
+  add rax, r8
+  lea .global.table, rdi
+  movsbq 1(rdi), rax
+  add rax, r8
+  mov rcx, eax
+  sub $100, eax
+  mov eax, -8(rbp)
+  movsxd -8(rbp), rax
+  add rax, r8
+  mov rax, -16(rbp)
+  movswq -16(rbp), rsi
+  add rsi, r8
+  lea $_8, rdi
+  mov r8, (rdi)
+  mov (rdi), r9
+  imul $3, r9
+  sub r9, r8
+  add $1, rcx
+  jmp .L.loop
+.L.end:
+  mov r8d, eax
+  mov rbp, rsp
+  pop rbp
+  ret
+"""
+
+PROGRAMS = {
+    "loop": workloads.loop(iterations=50),
+    "fib": workloads.fib(n=10),
+    "recursion": workloads.recursion(depth=50),
+    "memory": workloads.memory(iterations=20),
+    "globals": workloads.globals_section(num_globals=32, bytes_per_global=4),
+    "functions": workloads.functions(num_bytes=2000)
+    + ".L.main:\n  call .L.func0\n  call .L.func1\n  ret\n",
+    "instructions": INSTRUCTIONS_PROGRAM,
+}
+
+
+def final_state(source_code, mode):
+    vm_obj = vm.VM(opcodes=parse(source_code=source_code))
+    with contextlib.redirect_stdout(io.StringIO()):
+        _ = list(vm_obj.execute(mode=mode))
+
+    return vm_obj.get_state()
+
+
+@pytest.mark.parametrize("name", PROGRAMS.keys())
+def test_modes_print_the_same(name, monkeypatch):
+    outputs = all_outputs(source_code=PROGRAMS[name], monkeypatch=monkeypatch)
+
+    assert len(set(outputs.values())) == 1
+
+
+@pytest.mark.parametrize("name", PROGRAMS.keys())
+def test_modes_end_in_the_same_state(name, monkeypatch):
+    # Registers, flags and memory, not only the printed result
+    monkeypatch.setattr(block_compiler, "HOT_THRESHOLD", 1)
+
+    states = [final_state(source_code=PROGRAMS[name], mode=mode) for mode in MODES]
+
+    assert all(state == states[0] for state in states)
@@ -0,0 +1,68 @@
+import pytest
+
+from benchmarks import workloads
+from helpers import parse
+from helpers import run_output
+
+PROGRAMS = {
+    "loop": workloads.loop(iterations=50),
+    "fib": workloads.fib(n=10),
+    "recursion": workloads.recursion(depth=20),
+    "memory": workloads.memory(iterations=10),
+    "globals": workloads.globals_section(num_globals=32, bytes_per_global=4),
+    "functions": workloads.functions(num_bytes=2000)
+    + ".L.main:\n  call .L.func0\n  call .L.func1\n  ret\n",
+    "stack_round_trip": """.L.main:
+  mov $4294967296, rax
+  imul rax, rax
+  push rax
+  pop rdi
+  mov rdi, rax
+  ret
+""",
+}
+
+
+@pytest.mark.parametrize("name", PROGRAMS.keys())
+def test_optimizer_keeps_output(name):
+    source_code = PROGRAMS[name]
+
+    assert run_output(source_code=source_code, optimize=True) == run_output(
+        source_code=source_code
+    )
+
+
+def test_optimizer_folds_push_pop():
+    source_code = PROGRAMS["stack_round_trip"]
+
+    assert len(parse(source_code=source_code, optimize=True)) < len(
+        parse(source_code=source_code)
+    )
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_pushing_unset_register_fails_with_optimizer(optimize):
+    source_code = """.L.main:
+  mov $1, rax
+  push rdi
+  pop rax
+  ret
+"""
+
+    with pytest.raises(ValueError, match="cannot push it to stack"):
+        run_output(source_code=source_code, optimize=optimize)
+
+
+def test_optimizer_folds_push_of_register_set_in_block():
+    source_code = """.L.main:
+  mov $3, rdi
+  push rdi
+  mov $4, rsi
+  pop rax
+  ret
+"""
+
+    assert len(parse(source_code=source_code, optimize=True)) < len(
+        parse(source_code=source_code)
+    )
+    assert run_output(source_code=source_code, optimize=True) == "3\n"
@@ -0,0 +1,115 @@
+from helpers import all_outputs
+
+
+def test_register_value_survives_stack_round_trip(monkeypatch):
+    source_code = """.L.main:
+  mov $4294967296, rax
+  imul rax, rax
+  push rax
+  pop rdi
+  mov rdi, rax
+  ret
+"""
+
+    # 2^64 wraps to 0 in the register already, like in memory
+    outputs = all_outputs(source_code=source_code, monkeypatch=monkeypatch)
+    assert set(outputs.values()) == {"0\n"}
+
+
+def test_negative_value_survives_stack_round_trip(monkeypatch):
+    source_code = """.L.main:
+  mov $5000000000, rax
+  neg rax
+  push rax
+  pop rdi
+  mov rdi, rax
+  ret
+"""
+
+    outputs = all_outputs(source_code=source_code, monkeypatch=monkeypatch)
+    assert set(outputs.values()) == {"-5000000000\n"}
+
+
+def test_overflowing_loop_wraps_to_int64(monkeypatch):
+    source_code = """.L.main:
+  mov $3, rax
+  mov $0, rdi
+.L.loop:
+  cmp $80, rdi
+  je .L.end
+  imul $7, rax
+  add $1, rdi
+  push rax
+  pop rsi
+  mov rsi, rax
+  neg rax
+  jmp .L.loop
+.L.end:
+  ret
+"""
+
+    expected = 3
+    for _ in range(80):
+        expected = -(expected * 7)
+    expected = ((expected + (1 << 63)) & ((1 << 64) - 1)) - (1 << 63)
+
+    outputs = all_outputs(source_code=source_code, monkeypatch=monkeypatch)
+    assert set(outputs.values()) == {f"{expected}\n"}
+
+
+def test_negative_32_bit_result_prints_signed(monkeypatch):
+    source_code = """.L.main:
+  mov $3, eax
+  mov $5, edi
+  sub edi, eax
+  ret
+"""
+
+    outputs = all_outputs(source_code=source_code, monkeypatch=monkeypatch)
+    assert set(outputs.values()) == {"-2\n"}
+
+
+def test_negative_32_bit_result_of_loop_prints_signed(monkeypatch):
+    source_code = """.L.main:
+  mov $0, eax
+  mov $0, rdi
+.L.loop:
+  cmp $10, rdi
+  je .L.end
+  sub $3, eax
+  add $1, rdi
+  jmp .L.loop
+.L.end:
+  ret
+"""
+
+    outputs = all_outputs(source_code=source_code, monkeypatch=monkeypatch)
+    assert set(outputs.values()) == {"-30\n"}
+
+
+def test_64_bit_write_after_32_bit_write_prints_full_value(monkeypatch):
+    source_code = """.L.main:
+  mov $5, eax
+  sub $7, eax
+  mov $4294967294, rax
+  ret
+"""
+
+    outputs = all_outputs(source_code=source_code, monkeypatch=monkeypatch)
+    assert set(outputs.values()) == {"4294967294\n"}
+
+
+def test_top_level_ret_without_result_prints_pushed_bytes(monkeypatch):
+    # Only the stack pointers are set, they print as the bytes below the stack
+    # top like they did before memory moved the stack
+    outputs = all_outputs(source_code=".L.main:\n  ret\n", monkeypatch=monkeypatch)
+    assert set(outputs.values()) == {"0\n"}
+
+    source_code = """.L.main:
+  push $3
+  push $4
+  ret
+"""
+
+    outputs = all_outputs(source_code=source_code, monkeypatch=monkeypatch)
+    assert set(outputs.values()) == {"16\n"}
@@ -0,0 +1,67 @@
+import contextlib
+import io
+
+import pytest
+
+from benchmarks import workloads
+from helpers import parse
+from mockasm.runtime import trace
+from mockasm.runtime import trace_file
+from mockasm.runtime import vm
+
+PROGRAMS = {
+    "fib": workloads.fib(n=6),
+    "memory": workloads.memory(iterations=10),
+}
+
+# Small, so rebuilding a step starts from checkpoints as well as the beginning
+CHECKPOINT_INTERVAL = 7
+
+
+def full_states(source_code):
+    vm_obj = vm.VM(opcodes=parse(source_code=source_code))
+    with contextlib.redirect_stdout(io.StringIO()):
+        execution = list(vm_obj.execute(yield_execution=True))
+
+    return execution[:-1], execution[-1]
+
+
+def new_vm(source_code):
+    return vm.VM(opcodes=parse(source_code=source_code))
+
+
+@pytest.mark.parametrize("name", PROGRAMS.keys())
+def test_trace_rebuilds_every_step(name):
+    states, result = full_states(source_code=PROGRAMS[name])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        trace_obj = trace.record(
+            vm_obj=new_vm(source_code=PROGRAMS[name]),
+            checkpoint_interval=CHECKPOINT_INTERVAL,
+        )
+
+    assert len(trace_obj) == len(states)
+    assert trace_obj.result == result
+    for step, state in enumerate(states):
+        assert trace_obj.state_at(step=step) == state
+
+
+@pytest.mark.parametrize("name", PROGRAMS.keys())
+def test_trace_file_rebuilds_every_step(name, tmp_path):
+    states, result = full_states(source_code=PROGRAMS[name])
+
+    path = tmp_path / f"{name}.trace"
+    with contextlib.redirect_stdout(io.StringIO()):
+        trace_file.write(
+            path=path,
+            vm_obj=new_vm(source_code=PROGRAMS[name]),
+            checkpoint_interval=CHECKPOINT_INTERVAL,
+        )
+
+    with trace_file.TraceReader(path=path) as reader:
+        assert len(reader) == len(states)
+        assert reader.result == result
+
+        # Backwards, so every step is rebuilt without reusing the one before
+        for step in reversed(range(len(states))):
+            assert reader.state_at(step=step) == states[step]